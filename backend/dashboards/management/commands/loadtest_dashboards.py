@@ -0,0 +1,286 @@
+"""
+Load test: simulate concurrent dashboard viewers against a running server.
+Usage:
+  python manage.py loadtest_dashboards --setup --viewers 20 --widgets 10 --rows 100000
+  python manage.py loadtest_dashboards --viewers 50 --duration 120 --base-url http://localhost:8000
+  python manage.py loadtest_dashboards --teardown
+
+--setup creates loadtest_<n> users, each with a seeded SQLite data source (or a local
+PostgreSQL one with --postgres) and a dashboard of SQL widgets, in the app database the
+server uses. Each viewer thread then logs in with JWT and loops: open the dashboard list,
+open a dashboard, run every widget query (as the frontend does), think, and sometimes
+press "Refresh data" (refresh-cache + re-run widgets).
+"""
+
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboards.models import Dashboard
+from data_sources.benchmarking import BENCH_TABLE, REGIONS, seed_postgresql, seed_sqlite, summarize
+from data_sources.models import DataSource
+
+User = get_user_model()
+
+USER_PREFIX = "loadtest_"
+
+WIDGET_QUERIES = [
+    ("bar", "SELECT region, SUM(amount) AS total FROM {table} GROUP BY region ORDER BY total DESC"),
+    ("line", "SELECT day, SUM(amount) AS total FROM {table} WHERE day >= '2023-01-01' GROUP BY day ORDER BY day"),
+    ("pie", "SELECT product, COUNT(*) AS n FROM {table} WHERE region = '{region}' GROUP BY product ORDER BY n DESC LIMIT 10"),
+    ("table", "SELECT day, region, product, amount FROM {table} WHERE quantity = {quantity} ORDER BY day DESC LIMIT 200"),
+    ("area", "SELECT day, AVG(quantity) AS avg_qty FROM {table} WHERE region = '{region}' GROUP BY day ORDER BY day"),
+]
+
+
+class Stats:
+    """Thread-safe latency samples and error counts per operation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_examples = {}
+
+    def add(self, op: str, ms: float, error: str = ""):
+        with self._lock:
+            self.samples[op].append(ms)
+            if error:
+                self.errors[op] += 1
+                self.error_examples.setdefault(op, error)
+
+
+class Viewer(threading.Thread):
+    def __init__(self, command, username: str, stats: Stats, stop_at: float, start_delay: float):
+        super().__init__(daemon=True)
+        self.command = command
+        self.username = username
+        self.stats = stats
+        self.stop_at = stop_at
+        self.start_delay = start_delay
+        self.token = ""
+        self.rnd = random.Random(username)
+
+    def request(self, op: str, method: str, path: str, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.command.base_url + path, data=data, method=method)
+        req.add_header("Content-Type", "application/json")
+        if self.token:
+            req.add_header("Authorization", f"Bearer {self.token}")
+        start = time.perf_counter()
+        error = ""
+        payload = None
+        try:
+            with urllib.request.urlopen(req, timeout=self.command.timeout) as resp:
+                raw = resp.read()
+            payload = json.loads(raw) if raw else None
+            if isinstance(payload, dict) and payload.get("error"):
+                error = str(payload["error"])[:200]
+        except urllib.error.HTTPError as e:
+            error = f"HTTP {e.code}"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"[:200]
+        self.stats.add(op, (time.perf_counter() - start) * 1000, error)
+        return payload if not error else None
+
+    def run_widgets(self, dashboard: dict, refresh: bool = False):
+        for widget in (dashboard.get("widgets") or {}).values():
+            if widget.get("dataSourceId") and (widget.get("sql") or widget.get("tableName")):
+                body = {"table_name": widget["tableName"]} if widget.get("tableName") else {"sql": widget["sql"]}
+                if refresh:
+                    body["refresh"] = True
+                self.request("widget_query", "POST", f"/api/data-sources/{widget['dataSourceId']}/run-query/", body)
+            elif widget.get("questionId"):
+                self.request("widget_query", "POST", "/api/questions/run/", {"question_id": widget["questionId"]})
+
+    def think(self):
+        pause = self.rnd.uniform(0.5, 1.5) * self.command.think_time
+        time.sleep(max(0.0, min(pause, self.stop_at - time.time())))
+
+    def run(self):
+        time.sleep(self.start_delay)
+        tokens = self.request("login", "POST", "/api/users/token/", {"username": self.username, "password": self.command.password})
+        if not tokens:
+            return
+        self.token = tokens["access"]
+        dashboard = None
+        while time.time() < self.stop_at:
+            if dashboard is None or self.rnd.random() >= self.command.refresh_ratio:
+                # Open (or reload) a dashboard: list, detail, then every widget's data.
+                start = time.perf_counter()
+                listing = self.request("dashboard_list", "GET", "/api/dashboards/")
+                if listing:
+                    dashboard = self.request("dashboard_detail", "GET", f"/api/dashboards/{self.rnd.choice(listing)['id']}/")
+                    if dashboard:
+                        self.run_widgets(dashboard)
+                self.stats.add("page_load", (time.perf_counter() - start) * 1000)
+            else:
+                # "Refresh data" button: clear the source cache, then re-run all widgets.
+                start = time.perf_counter()
+                if dashboard.get("data_source"):
+                    self.request("refresh_cache", "POST", f"/api/data-sources/{dashboard['data_source']}/refresh-cache/")
+                self.run_widgets(dashboard)
+                self.stats.add("page_refresh", (time.perf_counter() - start) * 1000)
+            self.think()
+
+
+class Command(BaseCommand):
+    help = "Simulate concurrent dashboard viewers against a running server; report throughput, latency percentiles and error rate."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--setup", action="store_true", help="Create loadtest users, data sources and dashboards, then exit.")
+        parser.add_argument("--teardown", action="store_true", help="Delete everything created by --setup, then exit.")
+        parser.add_argument("--base-url", default="http://localhost:8000", help="Server to load (default: http://localhost:8000).")
+        parser.add_argument("--viewers", type=int, default=10, help="Concurrent viewers (one user each).")
+        parser.add_argument("--duration", type=float, default=60, help="Test duration in seconds.")
+        parser.add_argument("--ramp-up", type=float, default=5, help="Seconds over which viewers start.")
+        parser.add_argument("--think-time", type=float, default=2.0, help="Mean pause between viewer actions, seconds.")
+        parser.add_argument("--refresh-ratio", type=float, default=0.2, help="Share of actions that are 'Refresh data' clicks.")
+        parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout, seconds.")
+        parser.add_argument("--password", default="loadtest-password", help="Password for loadtest users.")
+        parser.add_argument("--widgets", type=int, default=8, help="--setup: widgets per dashboard.")
+        parser.add_argument("--dashboards", type=int, default=2, help="--setup: dashboards per user.")
+        parser.add_argument("--rows", type=int, default=100_000, help="--setup: rows in the seeded SQLite source.")
+        parser.add_argument(
+            "--postgres",
+            default="",
+            help="--setup: use a local PostgreSQL source instead: host=..,port=..,database=..,user=..,password=..",
+        )
+        parser.add_argument("--output", default="", help="Write the report as JSON to this path.")
+
+    def handle(self, *args, **options):
+        if options["teardown"]:
+            deleted, _ = User.objects.filter(username__startswith=USER_PREFIX).delete()
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} objects."))
+            return
+        if options["setup"]:
+            self.setup(options)
+            return
+
+        self.base_url = options["base_url"].rstrip("/")
+        self.password = options["password"]
+        self.think_time = max(0.0, options["think_time"])
+        self.refresh_ratio = min(1.0, max(0.0, options["refresh_ratio"]))
+        self.timeout = options["timeout"]
+        viewers = options["viewers"]
+        usernames = list(
+            User.objects.filter(username__startswith=USER_PREFIX).order_by("id").values_list("username", flat=True)[:viewers]
+        )
+        if len(usernames) < viewers:
+            raise CommandError(f"Only {len(usernames)} loadtest users exist; run with --setup --viewers {viewers} first.")
+
+        stats = Stats()
+        ramp = max(0.0, options["ramp_up"])
+        started = time.time()
+        stop_at = started + ramp + options["duration"]
+        threads = [
+            Viewer(self, name, stats, stop_at, start_delay=ramp * i / viewers)
+            for i, name in enumerate(usernames)
+        ]
+        self.stdout.write(f"{viewers} viewers against {self.base_url} for {options['duration']:.0f}s (+{ramp:.0f}s ramp-up)…")
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - started
+
+        report = self.report(stats, elapsed, options)
+        if options["output"]:
+            os.makedirs(os.path.dirname(os.path.abspath(options["output"])), exist_ok=True)
+            with open(options["output"], "w") as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    def setup(self, options):
+        viewers = options["viewers"]
+        if options["postgres"]:
+            config = dict(item.split("=", 1) for item in options["postgres"].split(",") if "=" in item)
+            table = f"{BENCH_TABLE}_{options['rows']}"
+            self.stdout.write(f"Seeding PostgreSQL {table}…")
+            seed_postgresql(config, options["rows"], table=table)
+            db_type = "postgresql"
+        else:
+            path = os.path.join(settings.BASE_DIR, ".benchmarks", f"bench_{options['rows']}.sqlite3")
+            self.stdout.write(f"Seeding SQLite with {options['rows']} rows…")
+            config = {"path": seed_sqlite(path, options["rows"])}
+            table = BENCH_TABLE
+            db_type = "sqlite"
+
+        rnd = random.Random(0)
+        existing = set(User.objects.filter(username__startswith=USER_PREFIX).values_list("username", flat=True))
+        created = 0
+        for n in range(viewers):
+            username = f"{USER_PREFIX}{n}"
+            if username in existing:
+                continue
+            user = User.objects.create_user(username, password=options["password"])
+            ds = DataSource.objects.create(user=user, name=f"Load test ({db_type})", db_type=db_type, config=config)
+            for d in range(options["dashboards"]):
+                widgets, layout = {}, []
+                for i in range(options["widgets"]):
+                    chart_type, sql = WIDGET_QUERIES[i % len(WIDGET_QUERIES)]
+                    widgets[f"w{i}"] = {
+                        "dataSourceId": ds.id,
+                        "chartType": chart_type,
+                        "title": f"Widget {i}",
+                        "sql": sql.format(table=table, region=rnd.choice(REGIONS), quantity=rnd.randint(1, 50)),
+                    }
+                    layout.append({"i": f"w{i}", "x": (i % 2) * 6, "y": (i // 2) * 4, "w": 6, "h": 4})
+                Dashboard.objects.create(
+                    user=user, data_source=ds, name=f"Load test {d + 1}", layout={"lg": layout}, widgets=widgets
+                )
+            created += 1
+        self.stdout.write(self.style.SUCCESS(f"Created {created} loadtest users ({len(existing)} already existed)."))
+
+    def report(self, stats: Stats, elapsed: float, options) -> dict:
+        operations = {}
+        total_requests = total_errors = 0
+        for op in sorted(stats.samples):
+            samples = stats.samples[op]
+            errors = stats.errors.get(op, 0)
+            is_request = op not in ("page_load", "page_refresh")
+            if is_request:
+                total_requests += len(samples)
+                total_errors += errors
+            operations[op] = {
+                "count": len(samples),
+                "per_sec": round(len(samples) / elapsed, 2) if elapsed else None,
+                "errors": errors,
+                "error_rate": round(errors / len(samples), 4) if samples else 0,
+                "latency_ms": summarize(samples),
+                "example_error": stats.error_examples.get(op, ""),
+            }
+        report = {
+            "base_url": self.base_url,
+            "viewers": options["viewers"],
+            "duration_s": round(elapsed, 1),
+            "think_time_s": self.think_time,
+            "refresh_ratio": self.refresh_ratio,
+            "requests": total_requests,
+            "throughput_rps": round(total_requests / elapsed, 2) if elapsed else None,
+            "errors": total_errors,
+            "error_rate": round(total_errors / total_requests, 4) if total_requests else 0,
+            "operations": operations,
+        }
+
+        self.stdout.write(
+            f"\n{total_requests} requests in {elapsed:.1f}s: {report['throughput_rps']} req/s, "
+            f"error rate {report['error_rate']:.2%}"
+        )
+        self.stdout.write(f"{'operation':<18}{'count':>8}{'err':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+        for op, info in operations.items():
+            lat = info["latency_ms"]
+            line = f"{op:<18}{info['count']:>8}{info['errors']:>6}{lat['p50']:>10.1f}{lat['p95']:>10.1f}{lat['p99']:>10.1f}{lat['max']:>10.1f}"
+            self.stdout.write(self.style.ERROR(line) if info["errors"] else line)
+            if info["example_error"]:
+                self.stdout.write(f"    e.g. {info['example_error']}")
+        return report
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-19 18:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboards', '0003_dashboard_user_updated_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='filterpreset',
+            index=models.Index(fields=['user', '-created_at'], name='preset_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filterpreset',
+            index=models.Index(fields=['dashboard', 'user', '-created_at'], name='preset_dash_user_created_idx'),
+        ),
+    ]
@@ -27,6 +27,10 @@ class Dashboard(models.Model):
 
     class Meta:
         ordering = ["-updated_at"]
+        indexes = [
+            # Per-user list, newest first (also the cursor-pagination ordering)
+            models.Index(fields=["user", "-updated_at", "-id"], name="dashboard_user_updated_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -54,6 +58,10 @@ class FilterPreset(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["user", "-created_at"], name="preset_user_created_idx"),
+            models.Index(fields=["dashboard", "user", "-created_at"], name="preset_dash_user_created_idx"),
+        ]
 
     def __str__(self):
         return self.name
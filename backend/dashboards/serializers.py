@@ -27,6 +27,14 @@ class DashboardSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class DashboardSummarySerializer(serializers.ModelSerializer):
+    """Sidebar/list representation: no layout or widgets."""
+
+    class Meta:
+        model = Dashboard
+        fields = ("id", "name", "updated_at")
+
+
 class FilterPresetSerializer(serializers.ModelSerializer):
     class Meta:
         model = FilterPreset
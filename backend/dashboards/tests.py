@@ -0,0 +1,247 @@
+import json
+import sqlite3
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+
+from data_sources.models import DataSource
+from data_sources.query_cache import set_cached_result
+
+from .models import Dashboard
+from .widget_data import iter_widget_results, plan_widgets
+
+
+class DashboardQueryCountTests(APITestCase):
+    """List and detail endpoints run a fixed number of queries, however many dashboards exist."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("viewer", password="secret")
+        self.client.force_authenticate(self.user)
+
+    def create_dashboards(self, count):
+        for i in range(count):
+            source = DataSource.objects.create(
+                user=self.user, name=f"Source {i}", db_type="sqlite", config={"path": ":memory:"}
+            )
+            Dashboard.objects.create(user=self.user, data_source=source, name=f"Dashboard {i}")
+
+    def test_list_query_count_is_constant(self):
+        self.create_dashboards(1)
+        # ETag version aggregate + dashboards joined with their data source
+        with self.assertNumQueries(2):
+            self.client.get("/api/dashboards/")
+        self.create_dashboards(10)
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/dashboards/")
+        self.assertEqual(len(response.json()), 11)
+        self.assertEqual({d["data_source_name"] for d in response.json()}, {f"Source {i}" for i in range(10)})
+
+    def test_detail_query_count(self):
+        self.create_dashboards(1)
+        dashboard = Dashboard.objects.get()
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/api/dashboards/{dashboard.pk}/")
+        self.assertEqual(response.json()["data_source_name"], "Source 0")
+
+    def test_summary_pages_are_constant_and_skip_blobs(self):
+        self.create_dashboards(12)
+        with self.assertNumQueries(2):
+            page = self.client.get("/api/dashboards/?view=summary&page_size=5").json()
+        self.assertEqual(set(page["results"][0]), {"id", "name", "updated_at"})
+        seen = [d["id"] for d in page["results"]]
+        while page["next"]:
+            page = self.client.get(page["next"]).json()
+            seen += [d["id"] for d in page["results"]]
+        self.assertEqual(sorted(seen), sorted(Dashboard.objects.values_list("id", flat=True)))
+
+
+class DashboardETagTests(APITestCase):
+    """List and detail answer If-None-Match with 304 until the dashboard or its data source changes."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("viewer", password="secret")
+        self.client.force_authenticate(self.user)
+        self.source = DataSource.objects.create(user=self.user, name="Source", db_type="sqlite", config={"path": ":memory:"})
+        self.dashboard = Dashboard.objects.create(user=self.user, data_source=self.source, name="Sales")
+
+    def assert_revalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
+        # an unchanged resource is answered from the version query alone
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached["ETag"], etag)
+        self.assertEqual(cached.content, b"")
+        return etag
+
+    def test_list_and_detail_return_304_on_a_matching_etag(self):
+        self.assert_revalidates("/api/dashboards/")
+        self.assert_revalidates(f"/api/dashboards/{self.dashboard.pk}/")
+        self.assertEqual(self.client.get("/api/dashboards/", HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_an_edit_changes_the_etag(self):
+        list_etag = self.assert_revalidates("/api/dashboards/")
+        detail_etag = self.assert_revalidates(f"/api/dashboards/{self.dashboard.pk}/")
+        self.client.patch(f"/api/dashboards/{self.dashboard.pk}/", {"name": "Renamed"}, format="json")
+        for url, etag in (("/api/dashboards/", list_etag), (f"/api/dashboards/{self.dashboard.pk}/", detail_etag)):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["ETag"], etag)
+
+    def test_a_renamed_data_source_changes_the_list_etag(self):
+        etag = self.assert_revalidates("/api/dashboards/")
+        self.source.name = "Renamed source"
+        self.source.save()
+        response = self.client.get("/api/dashboards/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()[0]["data_source_name"], "Renamed source")
+
+
+class WidgetDashboardTestCase(APITestCase):
+    """A dashboard over a SQLite source: query, table, failing and unknown-source widgets."""
+
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = str(Path(tmp.name) / "source.sqlite3")
+        with sqlite3.connect(path) as conn:
+            conn.execute("CREATE TABLE sales (region TEXT, amount REAL)")
+            conn.executemany("INSERT INTO sales VALUES (?, ?)", [("north", 10), ("south", 20)])
+        self.user = User.objects.create_user("viewer", password="secret")
+        self.client.force_authenticate(self.user)
+        self.source = DataSource.objects.create(user=self.user, name="Source", db_type="sqlite", config={"path": path})
+        ds = self.source.pk
+        self.dashboard = Dashboard.objects.create(
+            user=self.user,
+            data_source=self.source,
+            name="Sales",
+            widgets={
+                "far": {"dataSourceId": ds, "sql": "SELECT 1 AS one"},
+                "table": {"dataSourceId": ds, "tableName": "sales"},
+                "broken": {"dataSourceId": ds, "sql": "SELECT * FROM missing"},
+                "total": {"dataSourceId": ds, "sql": "SELECT SUM(amount) AS total FROM sales"},
+                "ghost": {"dataSourceId": 999999, "sql": "SELECT 1"},
+                "note": {"data": [{"text": "static"}]},
+            },
+            layout={"lg": [
+                {"i": "total", "x": 0, "y": 0},
+                {"i": "broken", "x": 6, "y": 0},
+                {"i": "table", "x": 0, "y": 4},
+                {"i": "far", "x": 0, "y": 30},
+            ]},
+        )
+
+
+class DashboardDataTests(WidgetDashboardTestCase):
+    """Widget planning and the NDJSON data endpoint."""
+
+    def setUp(self):
+        super().setUp()
+        self.url = f"/api/dashboards/{self.dashboard.pk}/data/"
+
+    def lines(self, response):
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def test_visible_widgets_come_first_in_layout_order(self):
+        jobs = plan_widgets(self.dashboard, self.user)
+        self.assertEqual([j.widget_id for j in jobs], ["total", "broken", "table", "far", "ghost"])
+        self.assertEqual([j.visible for j in jobs], [True, True, True, False, False])
+        jobs = plan_widgets(self.dashboard, self.user, visible=["far"])
+        self.assertEqual([j.widget_id for j in jobs][:1], ["far"])
+        self.assertEqual([j.widget_id for j in plan_widgets(self.dashboard, self.user, viewport_rows=2)][:2], ["total", "broken"])
+
+    def test_cache_hits_are_answered_before_queries_run(self):
+        set_cached_result(self.source.pk, "sql", "SELECT 1 AS one", [{"one": 1}], ["one"])
+        jobs = plan_widgets(self.dashboard, self.user)
+        results = list(iter_widget_results(jobs, cached_first=True))
+        self.assertEqual(results[0]["widget"], "far")
+        self.assertTrue(results[0]["cached"])
+        self.assertEqual(len(results), len(jobs))
+
+    def test_ndjson_streams_one_line_per_widget_then_done(self):
+        response = self.client.post(self.url, {}, format="json")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = self.lines(response)
+        self.assertEqual(lines[-1]["done"], True)
+        self.assertEqual(lines[-1]["widgets"], 5)
+        by_widget = {line["widget"]: line for line in lines[:-1]}
+        self.assertEqual(set(by_widget), {"total", "broken", "table", "far", "ghost"})
+        self.assertEqual(by_widget["total"]["rows"], [{"total": 30.0}])
+        self.assertEqual(len(by_widget["table"]["rows"]), 2)
+        self.assertIn("missing", by_widget["broken"]["error"])
+        self.assertEqual(by_widget["ghost"]["error"], "Data source not found.")
+        self.assertEqual(by_widget["broken"]["rows"], [])
+        cached = {line["widget"] for line in self.lines(self.client.post(self.url, {}, format="json"))[:-1] if line.get("cached")}
+        self.assertEqual(cached, {"total", "table", "far"})
+
+    def test_invalid_body_is_rejected(self):
+        self.assertEqual(self.client.post(self.url, {"visible": "total"}, format="json").status_code, 400)
+        self.assertEqual(self.client.post(self.url, {"viewport_rows": "3"}, format="json").status_code, 400)
+
+
+class DashboardStreamTests(WidgetDashboardTestCase):
+    """Server-Sent Events variant of the data endpoint."""
+
+    def setUp(self):
+        super().setUp()
+        self.url = f"/api/dashboards/{self.dashboard.pk}/stream/"
+
+    def events(self, response):
+        """(id, event, data) per event; comment lines (keep-alives) are skipped."""
+        text = b"".join(response.streaming_content).decode() if response.streaming else response.content.decode()
+        events = []
+        for block in text.strip().split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+            events.append((fields.get("id"), fields["event"], json.loads(fields["data"])))
+        return events
+
+    def test_widget_events_then_done(self):
+        set_cached_result(self.source.pk, "sql", "SELECT 1 AS one", [{"one": 1}], ["one"])
+        response = self.client.get(self.url, HTTP_ACCEPT="text/event-stream")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(response["Cache-Control"], "no-store")
+        events = self.events(response)
+        self.assertEqual(events[-1][:2], (None, "done"))
+        self.assertEqual(events[-1][2]["widgets"], 5)
+        widgets = events[:-1]
+        self.assertTrue(all(event == "widget" and event_id == data["widget"] for event_id, event, data in widgets))
+        # The cache hit is sent before any query has run
+        self.assertEqual(widgets[0][0], "far")
+        self.assertTrue(widgets[0][2]["cached"])
+        by_widget = {data["widget"]: data for _, _, data in widgets}
+        self.assertEqual(by_widget["total"]["rows"], [{"total": 30.0}])
+        self.assertEqual(by_widget["ghost"]["error"], "Data source not found.")
+
+    def test_line_breaks_in_widget_ids_do_not_break_framing(self):
+        widget_id = "evil\r\nevent: done\n\ndata: {}"
+        self.dashboard.widgets = {widget_id: {"dataSourceId": self.source.pk, "sql": "SELECT 1 AS one"}}
+        self.dashboard.save()
+        events = self.events(self.client.get(self.url, HTTP_ACCEPT="text/event-stream"))
+        self.assertEqual([(event_id, event) for event_id, event, _ in events], [("evilevent: donedata: {}", "widget"), (None, "done")])
+        self.assertEqual(events[0][2]["widget"], widget_id)
+
+    def test_errors_are_error_events(self):
+        response = self.client.get(self.url + "?viewport_rows=x", HTTP_ACCEPT="text/event-stream")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.events(response), [(None, "error", {"error": "'viewport_rows' must be an integer."})])
+        response = self.client.get("/api/dashboards/999999/stream/")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.events(response)[0][1], "error")
+
+    def test_content_negotiation(self):
+        # JSON clients get JSON errors; the stream itself is always text/event-stream
+        response = self.client.get(self.url + "?viewport_rows=x", HTTP_ACCEPT="application/json")
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response.json(), {"error": "'viewport_rows' must be an integer."})
+        response = self.client.get(self.url, HTTP_ACCEPT="application/xml")
+        self.assertEqual(response.status_code, 406)
+        self.assertEqual(self.events(response)[0][1], "error")
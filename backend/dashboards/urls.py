@@ -3,6 +3,8 @@ from .views import (
     DashboardListCreateView,
     DashboardDetailView,
     DashboardLayoutView,
+    DashboardDataView,
+    DashboardStreamView,
     FilterPresetListCreateView,
     FilterPresetDetailView,
 )
@@ -11,6 +13,8 @@ urlpatterns = [
     path("", DashboardListCreateView.as_view(), name="dashboard_list_create"),
     path("<int:pk>/", DashboardDetailView.as_view(), name="dashboard_detail"),
     path("<int:pk>/layout/", DashboardLayoutView.as_view(), name="dashboard_layout"),
+    path("<int:pk>/data/", DashboardDataView.as_view(), name="dashboard_data"),
+    path("<int:pk>/stream/", DashboardStreamView.as_view(), name="dashboard_stream"),
     path("<int:pk>/filter-presets/", FilterPresetListCreateView.as_view(), name="filter_preset_list_create"),
     path("filter-presets/<int:pk>/", FilterPresetDetailView.as_view(), name="filter_preset_detail"),
 ]
@@ -1,24 +1,48 @@
+import time
+
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BaseRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.conf import settings
+from django.db.models import Count, Max
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
+from flow_reports_project.http_cache import make_etag, not_modified, set_cache_headers
+from flow_reports_project.pagination import list_response, wants_summary
+from flow_reports_project.renderers import ORJSONRenderer, dumps
+
 from .models import Dashboard, FilterPreset
 from .serializers import (
     DashboardSerializer,
     DashboardLayoutUpdateSerializer,
+    DashboardSummarySerializer,
     FilterPresetSerializer,
 )
+from .widget_data import iter_widget_results, plan_widgets
 
 
 class DashboardListCreateView(APIView):
+    """GET list (ETag from count and latest updated_at; If-None-Match → 304). POST create.
+    ?view=summary returns id, name, updated_at only; ?page_size= / ?cursor= paginate (see pagination.py)."""
+
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         qs = Dashboard.objects.filter(user=request.user)
-        serializer = DashboardSerializer(qs, many=True)
-        return Response(serializer.data)
+        # data_source_name is serialized too, so a renamed source changes the ETag
+        version = qs.aggregate(count=Count("id"), updated=Max("updated_at"), source=Max("data_source__updated_at"))
+        etag = make_etag("dashboards", request.user.id, version, request.query_params.urlencode())
+        response = not_modified(request, etag)
+        if response:
+            return response
+        if wants_summary(request):
+            qs, serializer_class = qs.only("id", "name", "updated_at"), DashboardSummarySerializer
+        else:
+            qs, serializer_class = qs.select_related("data_source"), DashboardSerializer
+        return set_cache_headers(list_response(request, self, qs, serializer_class), etag)
 
     def post(self, request):
         serializer = DashboardSerializer(
@@ -44,12 +68,23 @@ class DashboardDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self, request, pk):
-        return get_object_or_404(Dashboard, pk=pk, user=request.user)
+        return get_object_or_404(Dashboard.objects.select_related("data_source"), pk=pk, user=request.user)
 
     def get(self, request, pk):
-        obj = self.get_object(request, pk)
-        serializer = DashboardSerializer(obj)
-        return Response(serializer.data)
+        # Check versions first: an unchanged dashboard is answered without loading layout/widgets.
+        version = (
+            Dashboard.objects.filter(pk=pk, user=request.user)
+            .values_list("updated_at", "data_source__updated_at")
+            .first()
+        )
+        if version is None:
+            raise Http404
+        etag = make_etag("dashboard", pk, *version)
+        response = not_modified(request, etag)
+        if response:
+            return response
+        serializer = DashboardSerializer(self.get_object(request, pk))
+        return set_cache_headers(Response(serializer.data), etag)
 
     def patch(self, request, pk):
         obj = self.get_object(request, pk)
@@ -73,7 +108,7 @@ class DashboardLayoutView(APIView):
     permission_classes = [IsAuthenticated]
 
     def patch(self, request, pk):
-        dashboard = get_object_or_404(Dashboard, pk=pk, user=request.user)
+        dashboard = get_object_or_404(Dashboard.objects.select_related("data_source"), pk=pk, user=request.user)
         ser = DashboardLayoutUpdateSerializer(data=request.data, partial=True)
         if not ser.is_valid():
             return Response(ser.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -85,6 +120,116 @@ class DashboardLayoutView(APIView):
         return Response(DashboardSerializer(dashboard).data)
 
 
+class DashboardDataView(APIView):
+    """
+    POST run all query widgets of a dashboard; results stream back as NDJSON, one line per widget
+    as it completes: { "widget", "visible", "rows", "columns", "truncated", "cached"?, "error"?, "ms" },
+    then { "done": true, "widgets": n, "ms": total }.
+    Body (all optional): "visible": [widget ids on screen] or "viewport_rows": grid rows on screen,
+    "breakpoint": layout key (default "lg"), "refresh": true to bypass the cache.
+    Visible widgets are started first; the others run afterwards and warm the cache.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        dashboard = get_object_or_404(Dashboard, pk=pk, user=request.user)
+        visible = request.data.get("visible")
+        if visible is not None and not isinstance(visible, list):
+            return Response({"error": "'visible' must be a list of widget ids."}, status=status.HTTP_400_BAD_REQUEST)
+        viewport_rows = request.data.get("viewport_rows")
+        if viewport_rows is not None and (not isinstance(viewport_rows, int) or isinstance(viewport_rows, bool)):
+            return Response({"error": "'viewport_rows' must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        jobs = plan_widgets(
+            dashboard,
+            request.user,
+            visible=visible,
+            viewport_rows=viewport_rows,
+            breakpoint=str(request.data.get("breakpoint") or "lg"),
+        )
+        refresh = request.data.get("refresh") is True
+
+        def lines():
+            started = time.perf_counter()
+            for result in iter_widget_results(jobs, refresh=refresh):
+                yield dumps(result) + b"\n"
+            total = round((time.perf_counter() - started) * 1000, 1)
+            yield dumps({"done": True, "widgets": len(jobs), "ms": total}) + b"\n"
+
+        response = StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+        response["Cache-Control"] = "no-store"
+        response["X-Accel-Buffering"] = "no"  # let nginx pass lines through as they are written
+        return response
+
+
+# CR/LF would end the id: line early (and let the rest pass as fields); NUL makes clients ignore it.
+_SSE_ID_UNSAFE = str.maketrans("", "", "\r\n\0")
+
+
+def _sse(event: str, data, event_id: str | None = None) -> str:
+    """One event; event_id (e.g. a widget id from dashboard JSON) is stripped of CR, LF and NUL."""
+    event_id = str(event_id).translate(_SSE_ID_UNSAFE) if event_id is not None else ""
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Accepts text/event-stream in content negotiation; non-stream responses (errors) become an "error" event."""
+
+    media_type = "text/event-stream"
+    format = "event-stream"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return _sse("error", data).encode()
+
+
+class DashboardStreamView(APIView):
+    """
+    GET Server-Sent Events with each query widget's result as soon as it is ready: cache hits
+    first, then the rest as their queries finish (visible widgets are started first).
+    Events: "widget" (id = widget id, data as in POST data/), "done" ({ widgets, ms }); a comment
+    line is sent every DASHBOARD_STREAM_HEARTBEAT seconds while queries run.
+    Query params: visible=<id>,<id>  viewport_rows=N  breakpoint=lg  refresh=1.
+    Authenticate with the Authorization header (fetch-based SSE client).
+    """
+
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [EventStreamRenderer, ORJSONRenderer]
+
+    def get(self, request, pk):
+        dashboard = get_object_or_404(Dashboard, pk=pk, user=request.user)
+        params = request.query_params
+        visible = [w for w in params.get("visible", "").split(",") if w] if "visible" in params else None
+        try:
+            viewport_rows = int(params["viewport_rows"]) if params.get("viewport_rows") else None
+        except ValueError:
+            return Response({"error": "'viewport_rows' must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        jobs = plan_widgets(
+            dashboard,
+            request.user,
+            visible=visible,
+            viewport_rows=viewport_rows,
+            breakpoint=params.get("breakpoint") or "lg",
+        )
+        refresh = params.get("refresh") in ("1", "true")
+        heartbeat = getattr(settings, "DASHBOARD_STREAM_HEARTBEAT", 15)
+
+        def events():
+            started = time.perf_counter()
+            for result in iter_widget_results(jobs, refresh=refresh, cached_first=True, heartbeat=heartbeat):
+                if result is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield _sse("widget", result, event_id=result["widget"])
+            total = round((time.perf_counter() - started) * 1000, 1)
+            yield _sse("done", {"widgets": len(jobs), "ms": total})
+
+        response = StreamingHttpResponse(events(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-store"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
 # Filter presets
 class FilterPresetListCreateView(APIView):
     permission_classes = [IsAuthenticated]
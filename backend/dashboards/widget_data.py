@@ -0,0 +1,221 @@
+"""
+Dashboard widget data: resolve each widget's query, order widgets by their position on screen,
+and run them concurrently through the shared query cache, yielding results as they complete.
+
+Widget configs (Dashboard.widgets) use the frontend keys: dataSourceId + tableName or sql,
+or questionId; widgets with inline "data" need no query and are skipped.
+Order: widgets in the visible part of the layout first (top to bottom, left to right), then the
+rest. Jobs start in that order on a bounded pool (DASHBOARD_WIDGET_WORKERS), so off-screen
+widgets only take a source connection once every visible widget has started.
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import NamedTuple
+
+from django.conf import settings
+
+from data_sources.instrumentation import QueryTimer, query_label, record_query
+from data_sources.models import DataSource
+from data_sources.query_cache import get_cached_result, set_cached_result
+from data_sources.run_query import run_sql, table_query_sql
+from questions.models import SavedQuestion
+from questions.nl_to_sql import validate_and_sanitize_sql
+
+DEFAULT_BREAKPOINT = "lg"
+
+
+class WidgetJob(NamedTuple):
+    widget_id: str
+    visible: bool
+    data_source: DataSource | None
+    query_type: str  # "table" | "sql" (cache key type)
+    query_value: str  # table name or SQL (cache key value)
+    sql: str  # SQL to execute
+    error: str = ""
+
+
+def layout_items(layout, breakpoint: str = DEFAULT_BREAKPOINT) -> list:
+    """Grid items for a breakpoint. layout is { "lg": [items], ... } or a plain list of items."""
+    if isinstance(layout, list):
+        return layout
+    if not isinstance(layout, dict) or not layout:
+        return []
+    items = layout.get(breakpoint) or layout.get(DEFAULT_BREAKPOINT) or next(iter(layout.values()))
+    return items if isinstance(items, list) else []
+
+
+def widget_order(dashboard, breakpoint: str = DEFAULT_BREAKPOINT) -> list[tuple[str, int]]:
+    """(widget id, y) top to bottom, then left to right; widgets missing from the layout go last."""
+    positions = {}
+    for item in layout_items(dashboard.layout, breakpoint):
+        if isinstance(item, dict) and "i" in item:
+            positions[str(item["i"])] = (item.get("y") or 0, item.get("x") or 0)
+    ids = [str(w) for w in (dashboard.widgets or {})]
+    bottom = max((y for y, _ in positions.values()), default=0) + 1
+    ordered = sorted(ids, key=lambda w: positions.get(w, (bottom, 0)))
+    return [(w, positions.get(w, (bottom, 0))[0]) for w in ordered]
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def plan_widgets(dashboard, user, visible=None, viewport_rows=None, breakpoint: str = DEFAULT_BREAKPOINT) -> list[WidgetJob]:
+    """
+    Jobs for the dashboard's query widgets in priority order.
+    visible: widget ids on screen (from the client); otherwise widgets starting above
+    viewport_rows grid rows (default DASHBOARD_VISIBLE_ROWS) count as visible.
+    Data sources and questions are loaded in two queries and must belong to user.
+    """
+    widgets = dashboard.widgets or {}
+    order = widget_order(dashboard, breakpoint)
+    if visible is not None:
+        visible_ids = {str(w) for w in visible}
+    else:
+        rows = viewport_rows if viewport_rows is not None else getattr(settings, "DASHBOARD_VISIBLE_ROWS", 12)
+        visible_ids = {w for w, y in order if y < rows}
+
+    source_ids = {_as_int(c.get("dataSourceId")) for c in widgets.values() if isinstance(c, dict)}
+    question_ids = {_as_int(c.get("questionId")) for c in widgets.values() if isinstance(c, dict)}
+    sources = {ds.id: ds for ds in DataSource.objects.filter(user=user, id__in=source_ids - {None})}
+    questions = {
+        q.id: q
+        for q in SavedQuestion.objects.select_related("data_source").filter(user=user, id__in=question_ids - {None})
+    }
+
+    jobs = []
+    for widget_id, _ in order:
+        config = widgets.get(widget_id)
+        if not isinstance(config, dict):
+            continue
+        is_visible = widget_id in visible_ids
+        table_name = (config.get("tableName") or "").strip()
+        sql = (config.get("sql") or "").strip()
+        if config.get("dataSourceId") and (table_name or sql):
+            ds = sources.get(_as_int(config["dataSourceId"]))
+            if ds is None:
+                jobs.append(WidgetJob(widget_id, is_visible, None, "", "", "", "Data source not found."))
+            elif table_name:
+                gen_sql = table_query_sql(ds.db_type, table_name)
+                jobs.append(WidgetJob(widget_id, is_visible, ds, "table", table_name, gen_sql or "", "" if gen_sql else "Invalid table name."))
+            else:
+                jobs.append(WidgetJob(widget_id, is_visible, ds, "sql", sql, sql))
+        elif config.get("questionId"):
+            question = questions.get(_as_int(config["questionId"]))
+            if question is None:
+                jobs.append(WidgetJob(widget_id, is_visible, None, "", "", "", "Question not found."))
+            elif not question.generated_sql:
+                jobs.append(WidgetJob(widget_id, is_visible, None, "", "", "", "This question has no generated SQL. Generate SQL first."))
+            elif question.data_source is None:
+                jobs.append(WidgetJob(widget_id, is_visible, None, "", "", "", "This question has no data source. Assign a data source to run it."))
+            else:
+                # Same cache key as POST /api/questions/run/ (sanitized SQL)
+                sanitized, err = validate_and_sanitize_sql(question.generated_sql, question.data_source.db_type)
+                jobs.append(WidgetJob(widget_id, is_visible, question.data_source, "sql", sanitized, sanitized, err))
+    # Stable: visible widgets first, each group still top to bottom
+    jobs.sort(key=lambda job: not job.visible)
+    return jobs
+
+
+def _result(job: WidgetJob, **body) -> dict:
+    return {"widget": job.widget_id, "visible": job.visible, **body}
+
+
+def cached_widget_result(job: WidgetJob) -> dict | None:
+    """The job's result from the query cache (hits are recorded in query stats), or None for errors and misses."""
+    if job.error or job.data_source is None:
+        return None
+    ds = job.data_source
+    timer = QueryTimer(ds.id, ds.db_type, query_label(job.query_type, job.query_value))
+    cached = get_cached_result(ds.id, job.query_type, job.query_value, timer=timer)
+    if cached is None:
+        return None
+    record_query(timer)
+    return _result(job, rows=cached["rows"], columns=cached["columns"], truncated=cached.get("truncated", False), cached=True)
+
+
+def run_widget(job: WidgetJob, refresh: bool = False, lookup: bool = True) -> dict:
+    """
+    Run one widget's query (cache first unless refresh); recorded in the source's query stats.
+    lookup=False: the caller already missed the cache for this job, go straight to the source.
+    """
+    if job.error:
+        return _result(job, error=job.error, rows=[], columns=[])
+    ds = job.data_source
+    timer = QueryTimer(ds.id, ds.db_type, query_label(job.query_type, job.query_value))
+    try:
+        if refresh:
+            timer.cache = "bypass"
+        elif not lookup:
+            timer.cache = "miss"
+        else:
+            cached = get_cached_result(ds.id, job.query_type, job.query_value, timer=timer)
+            if cached is not None:
+                return _result(job, rows=cached["rows"], columns=cached["columns"], truncated=cached.get("truncated", False), cached=True)
+        rows, columns, err, truncated = run_sql(ds, job.sql, timer=timer)
+        if err:
+            timer.error = err
+            return _result(job, error=err, rows=[], columns=[])
+        set_cached_result(ds.id, job.query_type, job.query_value, rows, columns, truncated=truncated, timer=timer)
+        return _result(job, rows=rows, columns=columns, truncated=truncated)
+    finally:
+        record_query(timer)
+
+
+def _workers() -> int:
+    return max(1, int(getattr(settings, "DASHBOARD_WIDGET_WORKERS", 4)))
+
+
+def iter_widget_results(
+    jobs: list[WidgetJob],
+    refresh: bool = False,
+    cached_first: bool = False,
+    heartbeat: float | None = None,
+):
+    """
+    Yield each widget's result dict as soon as it is ready ("ms" = time since start).
+    cached_first: answer cache hits immediately, before any query is started.
+    heartbeat: yield None after this many seconds without a result (keep-alive for streams).
+    Stopping the generator early cancels widgets that have not started yet.
+    """
+    started = time.perf_counter()
+
+    def stamp(result):
+        result["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    pending_jobs = list(jobs)
+    lookup = True
+    if cached_first and not refresh:
+        remaining = []
+        for job in pending_jobs:
+            hit = cached_widget_result(job)
+            if hit is not None:
+                yield stamp(hit)
+            else:
+                remaining.append(job)
+        pending_jobs = remaining
+        lookup = False
+    if not pending_jobs:
+        return
+    executor = ThreadPoolExecutor(max_workers=min(_workers(), len(pending_jobs)), thread_name_prefix="widget")
+    try:
+        # Submission order is start order: visible widgets first.
+        futures = {executor.submit(run_widget, job, refresh, lookup): job for job in pending_jobs}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=heartbeat, return_when=FIRST_COMPLETED)
+            if not done:
+                yield None
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = _result(futures[future], error=str(e), rows=[], columns=[])
+                yield stamp(result)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
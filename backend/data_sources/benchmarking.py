@@ -0,0 +1,132 @@
+"""
+Helpers for benchmarks and load tests: deterministic seed data for local SQLite/PostgreSQL
+data sources and latency summaries (percentiles).
+"""
+
+import math
+import os
+import random
+import sqlite3
+from datetime import date, timedelta
+
+BENCH_TABLE = "bench_sales"
+REGIONS = ["north", "south", "east", "west", "central", "overseas", "online"]
+PRODUCTS = [f"product_{i:03d}" for i in range(200)]
+START_DAY = date(2019, 1, 1)
+DAYS = 5 * 365
+
+
+def _rows(count: int, seed: int = 42):
+    rnd = random.Random(seed)
+    for i in range(1, count + 1):
+        yield (
+            i,
+            (START_DAY + timedelta(days=rnd.randrange(DAYS))).isoformat(),
+            rnd.choice(REGIONS),
+            rnd.choice(PRODUCTS),
+            round(rnd.uniform(1, 5000), 2),
+            rnd.randint(1, 50),
+        )
+
+
+def seed_sqlite(path: str, rows: int, batch: int = 50_000) -> str:
+    """
+    Create (or reuse) a SQLite file with `rows` rows in bench_sales. Returns the path.
+    An existing file with the right row count is reused, so repeated runs are cheap.
+    """
+    if os.path.exists(path):
+        try:
+            conn = sqlite3.connect(path)
+            (existing,) = conn.execute(f"SELECT COUNT(*) FROM {BENCH_TABLE}").fetchone()
+            conn.close()
+            if existing == rows:
+                return path
+        except sqlite3.Error:
+            pass
+        os.remove(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        f"CREATE TABLE {BENCH_TABLE} (id INTEGER PRIMARY KEY, day TEXT, region TEXT, "
+        "product TEXT, amount REAL, quantity INTEGER)"
+    )
+    chunk = []
+    for row in _rows(rows):
+        chunk.append(row)
+        if len(chunk) >= batch:
+            conn.executemany(f"INSERT INTO {BENCH_TABLE} VALUES (?, ?, ?, ?, ?, ?)", chunk)
+            chunk = []
+    if chunk:
+        conn.executemany(f"INSERT INTO {BENCH_TABLE} VALUES (?, ?, ?, ?, ?, ?)", chunk)
+    conn.execute(f"CREATE INDEX {BENCH_TABLE}_day ON {BENCH_TABLE} (day)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def seed_postgresql(config: dict, rows: int, table: str = BENCH_TABLE) -> None:
+    """Create bench table in a local PostgreSQL database with generate_series (server-side, fast)."""
+    import psycopg2
+
+    conn = psycopg2.connect(
+        host=config.get("host") or "localhost",
+        port=config.get("port") or 5432,
+        dbname=config.get("database"),
+        user=config.get("user"),
+        password=config.get("password") or "",
+    )
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", (table,))
+            if cursor.fetchone()[0]:
+                cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                if cursor.fetchone()[0] == rows:
+                    return
+                cursor.execute(f"DROP TABLE {table}")
+            cursor.execute(
+                f"CREATE TABLE {table} (id BIGINT PRIMARY KEY, day DATE, region TEXT, "
+                "product TEXT, amount NUMERIC(12, 2), quantity INTEGER)"
+            )
+            cursor.execute("SELECT setseed(0.42)")  # deterministic random() for this session
+            cursor.execute(
+                f"""
+                INSERT INTO {table}
+                SELECT g,
+                       DATE '2019-01-01' + floor(random() * {DAYS})::int,
+                       (ARRAY{REGIONS!r})[1 + floor(random() * {len(REGIONS)})::int],
+                       'product_' || lpad(floor(random() * 200)::int::text, 3, '0'),
+                       round((1 + random() * 4999)::numeric, 2),
+                       1 + floor(random() * 50)::int
+                FROM generate_series(1, %s) AS g
+                """,
+                (rows,),
+            )
+            cursor.execute(f"CREATE INDEX ON {table} (day)")
+            cursor.execute(f"ANALYZE {table}")
+    finally:
+        conn.close()
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list (q in 0..100)."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples_ms: list) -> dict:
+    """min / p50 / p95 / p99 / mean / max of latency samples in milliseconds."""
+    values = sorted(samples_ms)
+    if not values:
+        return {"n": 0}
+    return {
+        "n": len(values),
+        "min": round(values[0], 3),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "mean": round(sum(values) / len(values), 3),
+        "max": round(values[-1], 3),
+    }
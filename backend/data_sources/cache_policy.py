@@ -0,0 +1,76 @@
+"""
+Cost-aware query cache policy: which results to cache, for how long, and which to drop first
+when a source's cache budget is full.
+
+Each result is valued by what caching it saves per byte: value = cost_ms x (1 + reads) / size,
+where cost_ms is the time the source took (connect + execute + fetch + convert) and reads is
+how often the same query was already served or run. Then:
+  admission  results up to QUERY_CACHE_ADMIT_ALWAYS_KB are always cached; larger ones need
+             at least QUERY_CACHE_MIN_MS_PER_MB of saved time per MB (huge-but-cheap results
+             are re-run instead); results over QUERY_CACHE_MAX_ENTRY_MB are never cached
+  TTL        QUERY_CACHE_TIMEOUT, lengthened for expensive and frequently read results, up to
+             QUERY_CACHE_MAX_TIMEOUT
+  eviction   past QUERY_CACHE_SOURCE_MAX_MB per source, the lowest-value entries go first
+             (approximate: sizes are tracked per source without locking, and entries the
+             backend already evicted are only noticed when the budget is checked)
+"""
+
+import json
+import math
+from typing import NamedTuple
+
+from django.conf import settings
+
+SIZE_SAMPLE_ROWS = 100
+COST_PHASES = ("connect", "execute", "fetch", "convert")
+
+
+class CacheDecision(NamedTuple):
+    admit: bool
+    timeout: int | None  # seconds; None = no expiry
+    reason: str = ""  # why a result was not admitted
+
+
+def estimate_size(rows: list, columns: list) -> int:
+    """Approximate JSON size of a result in bytes, from an evenly spaced sample of rows."""
+    if not rows:
+        return len(json.dumps(columns, default=str))
+    step = max(1, len(rows) // SIZE_SAMPLE_ROWS)
+    sample = rows[::step][:SIZE_SAMPLE_ROWS]
+    sample_bytes = len(json.dumps(sample, default=str, separators=(",", ":")))
+    return int(sample_bytes * len(rows) / len(sample)) + len(json.dumps(columns, default=str))
+
+
+def query_cost_ms(timer) -> float | None:
+    """Time the source spent producing the result (QueryTimer phases), None if unknown."""
+    if timer is None:
+        return None
+    spent = [timer.phases[p] for p in COST_PHASES if p in timer.phases]
+    return sum(spent) if spent else None
+
+
+def value_score(cost_ms: float | None, size: int, reads: int) -> float:
+    """Milliseconds saved per MB of cache by keeping the result (higher = more worth keeping)."""
+    return (cost_ms or 0.0) * (1 + reads) / max(size / (1024 * 1024), 1 / 1024)
+
+
+def decide(cost_ms: float | None, size: int, reads: int, base_timeout: int | None = None) -> CacheDecision:
+    """Admission and TTL for a result of size bytes that took cost_ms and was read reads times before."""
+    if base_timeout is None:
+        base_timeout = getattr(settings, "QUERY_CACHE_TIMEOUT", 300)
+    if size > getattr(settings, "QUERY_CACHE_MAX_ENTRY_MB", 50) * 1024 * 1024:
+        return CacheDecision(False, None, "too_large")
+    if (
+        cost_ms is not None
+        and size > getattr(settings, "QUERY_CACHE_ADMIT_ALWAYS_KB", 64) * 1024
+        and value_score(cost_ms, size, reads) < getattr(settings, "QUERY_CACHE_MIN_MS_PER_MB", 20)
+    ):
+        return CacheDecision(False, None, "low_value")
+    if not base_timeout:
+        return CacheDecision(True, None)
+    if cost_ms is None:
+        return CacheDecision(True, base_timeout)
+    # 100 ms -> x1.3, 1 s -> x2, 10 s -> x3; each doubling of reads adds a quarter
+    factor = (1 + math.log10(1 + cost_ms / 100)) * (1 + math.log2(1 + reads) / 4)
+    ceiling = max(base_timeout, getattr(settings, "QUERY_CACHE_MAX_TIMEOUT", 3600))
+    return CacheDecision(True, int(min(ceiling, base_timeout * factor)))
@@ -0,0 +1,178 @@
+"""
+Query cache snapshots: dump the hottest query_cache entries with their remaining TTL to a local
+file, and load them back after a restart so the first users after a deploy do not send every
+query to the source databases at once.
+
+  python manage.py cache_snapshot                 # write QUERY_CACHE_SNAPSHOT_PATH once
+  python manage.py cache_snapshot --every 300     # keep writing every 5 minutes
+  python manage.py cache_restore                  # load it (before serving traffic)
+
+With QUERY_CACHE_SNAPSHOT_PATH set, wsgi/asgi startup restores the snapshot and each worker
+writes one when it exits (see setup_snapshots).
+
+Entries are ranked by hit count, then by when they were stored (newest first); expired entries
+are skipped on restore. A source whose data version changed since the snapshot (refresh-cache)
+is not restored, so a restart never brings back results that were invalidated. The file is a
+gzipped pickle written by this app; only load snapshots from a trusted path.
+"""
+
+import atexit
+import gzip
+import logging
+import os
+import pickle
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .query_cache import (
+    _stamp_key,
+    _version_key,
+    flush_hit_counts,
+    get_hit_counts,
+    track_key,
+    tracked_keys,
+)
+
+logger = logging.getLogger("data_sources.query")
+
+SNAPSHOT_FORMAT = 1
+
+
+def _source_ids() -> list[int]:
+    from .models import DataSource
+
+    return list(DataSource.objects.values_list("id", flat=True))
+
+
+def collect_entries(limit: int) -> list[dict]:
+    """
+    The limit hottest live entries: { data_source_id, key, value, hits }. Keys are ranked from
+    the hit counts and the tracked lists, so only about limit values are read from the cache.
+    """
+    flush_hit_counts()
+    now = time.time()
+    ranked = []
+    for data_source_id in _source_ids():
+        hits = get_hit_counts(data_source_id)
+        # Rendered bodies are skipped: they are re-rendered from the entry on its first hit
+        for position, key in enumerate(tracked_keys(data_source_id)):
+            if ":body:" not in key:
+                ranked.append((hits.get(key, 0), position, data_source_id, key))
+    ranked.sort(key=lambda r: r[:2], reverse=True)
+    entries = []
+    # Evicted or expired keys are still tracked: read further chunks until limit entries are live
+    for start in range(0, len(ranked), max(limit, 1)):
+        if len(entries) >= limit:
+            break
+        chunk = ranked[start : start + limit]
+        values = cache.get_many([key for _, _, _, key in chunk])
+        for hits, _, data_source_id, key in chunk:
+            value = values.get(key)
+            expires = value.get("expires") if isinstance(value, dict) else None
+            if value is None or (expires is not None and expires <= now):
+                continue
+            entries.append({"data_source_id": data_source_id, "key": key, "value": value, "hits": hits})
+    return entries[:limit]
+
+
+def write_snapshot(path: str, limit: int | None = None, skip_empty: bool = False) -> int:
+    """
+    Write the hottest entries to path (atomically). Returns the number of entries written.
+    skip_empty: keep the existing file when there is nothing to write (e.g. an idle worker exiting).
+    """
+    if limit is None:
+        limit = getattr(settings, "QUERY_CACHE_SNAPSHOT_LIMIT", 500)
+    entries = collect_entries(limit)
+    if skip_empty and not entries:
+        return 0
+    versions = {}
+    for entry in entries:
+        ds_id = entry["data_source_id"]
+        if ds_id not in versions:
+            versions[ds_id] = cache.get(_version_key(ds_id))
+    snapshot = {"format": SNAPSHOT_FORMAT, "created": time.time(), "versions": versions, "entries": entries}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp, "wb", compresslevel=1) as f:
+        pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    return len(entries)
+
+
+def restore_snapshot(path: str, max_age: int | None = None) -> int:
+    """
+    Load entries from path with their remaining TTL, without overwriting newer entries.
+    Snapshots older than max_age seconds (default QUERY_CACHE_SNAPSHOT_MAX_AGE) are ignored.
+    Returns the number of entries restored.
+    """
+    if max_age is None:
+        max_age = getattr(settings, "QUERY_CACHE_SNAPSHOT_MAX_AGE", 3600)
+    try:
+        with gzip.open(path, "rb") as f:
+            snapshot = pickle.load(f)
+    except FileNotFoundError:
+        return 0
+    if snapshot.get("format") != SNAPSHOT_FORMAT:
+        return 0
+    now = time.time()
+    if max_age and now - snapshot["created"] > max_age:
+        return 0
+    current = {}
+    for ds_id, version in snapshot["versions"].items():
+        if version is None:
+            current[ds_id] = cache.get(_version_key(ds_id)) is None
+        else:
+            # Fresh cache: adopt the snapshot's version so ETags stay valid; otherwise it must match.
+            cache.add(_version_key(ds_id), version, timeout=None)
+            current[ds_id] = cache.get(_version_key(ds_id)) == version
+    restored = 0
+    for entry in snapshot["entries"]:
+        ds_id = entry["data_source_id"]
+        if not current.get(ds_id):
+            continue
+        expires = entry["value"].get("expires")
+        remaining = None if expires is None else int(expires - now)
+        if remaining is not None and remaining < 1:
+            continue
+        if cache.add(entry["key"], entry["value"], timeout=remaining):
+            tables = entry["value"].get("tables")
+            track_key(ds_id, entry["key"], remaining, tables)
+            cache.set(_stamp_key(entry["key"]), entry["value"].get("etag"), timeout=remaining)
+            track_key(ds_id, _stamp_key(entry["key"]), remaining, tables)
+            restored += 1
+    return restored
+
+
+def snapshot_path() -> str | None:
+    return getattr(settings, "QUERY_CACHE_SNAPSHOT_PATH", None)
+
+
+def setup_snapshots() -> None:
+    """
+    Startup hook for wsgi/asgi: restore QUERY_CACHE_SNAPSHOT_PATH (once per snapshot file when
+    workers share a cache, once per worker with locmem) and write a snapshot at exit.
+    """
+    path = snapshot_path()
+    if not path:
+        return
+    try:
+        marker = f"query:snapshot:restored:{os.stat(path).st_mtime_ns}"
+    except FileNotFoundError:
+        marker = None
+    if marker and cache.add(marker, 1, timeout=24 * 3600):
+        try:
+            restored = restore_snapshot(path)
+            logger.info("query cache snapshot restored: %s entries from %s", restored, path)
+        except Exception:
+            logger.exception("query cache snapshot restore failed: %s", path)
+    atexit.register(_snapshot_at_exit, path)
+
+
+def _snapshot_at_exit(path: str) -> None:
+    try:
+        written = write_snapshot(path, skip_empty=True)
+        logger.info("query cache snapshot written: %s entries to %s", written, path)
+    except Exception:
+        logger.exception("query cache snapshot failed: %s", path)
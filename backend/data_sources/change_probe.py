@@ -0,0 +1,81 @@
+"""
+Cheap per-dialect change probes for data sources, used by the watch_sources command to
+invalidate cached results when the underlying tables change (so long TTLs stay safe).
+
+A probe returns { table: token } where the token changes whenever the table's data does:
+  PostgreSQL  pg_stat_user_tables insert/update/delete counters and live tuple count
+  MySQL       information_schema.tables update_time and auto_increment
+  SQLite      the database and WAL files' size and mtime; SQLite keeps no per-table change
+              data, so the probe is { ALL_TABLES: token } and any write changes every table.
+Probes read catalog/statistics views only and never scan user tables.
+PostgreSQL statistics are flushed shortly after commit, so a change can be seen a second late.
+"""
+
+import os
+
+from .run_query import get_connection
+
+ALL_TABLES = "*"
+
+
+def _probe_postgresql(cursor) -> dict:
+    cursor.execute("""
+        SELECT schemaname, relname, n_tup_ins, n_tup_upd, n_tup_del, n_live_tup
+        FROM pg_stat_user_tables
+    """)
+    tokens = {}
+    for schema, table, ins, upd, dele, live in cursor.fetchall():
+        # Table entries use bare names for the public schema (as in get_schema)
+        name = table if schema == "public" else f"{schema}.{table}"
+        tokens[name] = f"{ins}:{upd}:{dele}:{live}"
+    return tokens
+
+
+def _probe_mysql(cursor) -> dict:
+    try:
+        # MySQL 8 caches these columns for a day by default; MariaDB has no such variable.
+        cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+    except Exception:
+        pass
+    cursor.execute("""
+        SELECT table_name, update_time, auto_increment FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_type = 'BASE TABLE'
+    """)
+    return {table: f"{updated}:{auto_inc}" for table, updated, auto_inc in cursor.fetchall()}
+
+
+def _probe_sqlite(path: str) -> dict:
+    parts = []
+    for suffix in ("", "-wal"):
+        try:
+            st = os.stat(path + suffix)
+        except FileNotFoundError:
+            parts.append("-")
+            continue
+        parts.append(f"{st.st_size}:{st.st_mtime_ns}")
+    return {ALL_TABLES: "/".join(parts)}
+
+
+def probe_tables(data_source) -> dict:
+    """{ table: change token } for the source (see module docstring). Raises on connection errors."""
+    db_type = data_source.db_type
+    if db_type == "sqlite":
+        path = (data_source.config or {}).get("path") or ""
+        if not path:
+            raise ValueError("SQLite path is required.")
+        return _probe_sqlite(path)
+    if db_type not in ("postgresql", "mysql"):
+        raise ValueError(f"Unsupported db_type: {db_type}")
+    conn = get_connection(data_source)
+    try:
+        cursor = conn.cursor()
+        return _probe_postgresql(cursor) if db_type == "postgresql" else _probe_mysql(cursor)
+    finally:
+        conn.close()
+
+
+def changed_tables(before: dict, after: dict) -> set[str] | None:
+    """Tables whose token differs (added or dropped tables count); None means every table changed."""
+    if ALL_TABLES in before or ALL_TABLES in after:
+        return None if before != after else set()
+    return {t for t in before.keys() | after.keys() if before.get(t) != after.get(t)}
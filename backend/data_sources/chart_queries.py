@@ -0,0 +1,254 @@
+"""
+Chart queries compiled into the source database, so a widget receives one row per plotted point
+instead of the raw rows behind it.
+
+Time grain: { "time_grain": "day", "column_mapping": { "x", "y", "series" }, "aggregate": "sum" }
+wraps the query as SELECT <bucket(x)>, series, <aggregate>(y) ... GROUP BY bucket, series, where the
+bucket start is computed by the source:
+  PostgreSQL  date_trunc('<grain>', x)
+  MySQL       DATE_FORMAT(x, ...) (weeks start on Monday via WEEKDAY)
+  SQLite      strftime(..., x) (weeks start on Monday via 'weekday 0', '-6 days')
+Buckets come back as datetimes; missing buckets between the first and last one are then filled
+per series (0 for sum/count, null for avg/min/max) unless "fill_gaps": false.
+
+Top N: { "chart_type": "pie", "top_n": 10, "column_mapping": { "label", "value" } } (bar: "x", "y")
+aggregates value per label, ranks labels with ROW_NUMBER() (largest first) and collapses every
+label past the first N into one "Other" row, all in one query (MySQL needs 8.0+ for windows).
+Labels are not aggregated, so boolean or uuid label columns work too; they are grouped on,
+so PostgreSQL json labels must be cast to text or jsonb in the query.
+"""
+
+from datetime import date, datetime, time, timedelta
+
+from .run_query import MAX_ROWS
+from .sql_parse import analyze_sql
+
+TIME_GRAINS = ("minute", "hour", "day", "week", "month")
+AGGREGATES = ("sum", "avg", "count", "min", "max")
+# Aggregates whose value for an empty bucket is 0 (others have none)
+ZERO_FILLED = ("sum", "count")
+# Chart type -> column_mapping keys of the label and value columns
+TOP_N_CHART_TYPES = {"pie": ("label", "value"), "bar": ("x", "y")}
+MAX_TOP_N = 1000
+OTHER_LABEL = "Other"
+RANK_COLUMN = "fr_rank"
+
+_MYSQL_FORMATS = {
+    "minute": "%Y-%m-%d %H:%i:00",
+    "hour": "%Y-%m-%d %H:00:00",
+    "day": "%Y-%m-%d 00:00:00",
+    "week": "%Y-%m-%d 00:00:00",
+    "month": "%Y-%m-01 00:00:00",
+}
+_SQLITE_FORMATS = {
+    "minute": "%Y-%m-%d %H:%M:00",
+    "hour": "%Y-%m-%d %H:00:00",
+    "day": "%Y-%m-%d 00:00:00",
+    "week": "%Y-%m-%d 00:00:00",
+    "month": "%Y-%m-01 00:00:00",
+}
+_STEPS = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(weeks=1)}
+
+
+def quote_identifier(db_type: str, name: str) -> str:
+    """Column name quoted for the dialect (result columns may contain any character)."""
+    if db_type == "mysql":
+        return "`" + name.replace("`", "``") + "`"
+    return '"' + name.replace('"', '""') + '"'
+
+
+def bucket_expression(db_type: str, column: str, grain: str) -> str:
+    """SQL for the start of the grain bucket containing column (a quoted identifier)."""
+    if db_type == "postgresql":
+        return f"date_trunc('{grain}', {column})"
+    if db_type == "mysql":
+        if grain == "week":
+            column = f"DATE_SUB({column}, INTERVAL WEEKDAY({column}) DAY)"
+        return f"DATE_FORMAT({column}, '{_MYSQL_FORMATS[grain]}')"
+    if db_type == "sqlite":
+        modifiers = ", 'weekday 0', '-6 days'" if grain == "week" else ""
+        return f"strftime('{_SQLITE_FORMATS[grain]}', {column}{modifiers})"
+    raise ValueError(f"Unsupported db_type: {db_type}")
+
+
+def time_bucket_sql(db_type: str, sql: str, options: dict) -> str:
+    """Wrap sql (a read-only SELECT) so it returns one aggregated row per time bucket and series."""
+    x = quote_identifier(db_type, options["x"])
+    y = quote_identifier(db_type, options["y"])
+    select = [f"{bucket_expression(db_type, x, options['time_grain'])} AS {x}"]
+    group = ["1"]
+    if options.get("series"):
+        select.append(quote_identifier(db_type, options["series"]))
+        group.append("2")
+    select.append(f"{options['aggregate'].upper()}({y}) AS {y}")
+    # Comments are stripped so a trailing -- comment cannot swallow the closing parenthesis
+    inner = analyze_sql(sql, db_type).sql
+    return (
+        f"SELECT {', '.join(select)} FROM ({inner}) AS src WHERE {x} IS NOT NULL "
+        f"GROUP BY {', '.join(group)} ORDER BY {', '.join(group)}"
+    )
+
+
+def top_n_sql(db_type: str, sql: str, options: dict) -> str:
+    """
+    Wrap sql so it returns the top_n labels by aggregated value (RANK_COLUMN 1..top_n) plus one
+    row (label null, RANK_COLUMN top_n + 1) for all other labels; that row's rank is null when
+    there are no other labels. Top labels are selected as stored (not aggregated).
+    """
+    label = quote_identifier(db_type, options["label"])
+    value = quote_identifier(db_type, options["value"])
+    aggregate = options["aggregate"]
+    n = int(options["top_n"])
+    if aggregate == "avg":
+        # Other is the average over its source rows, not an average of averages
+        grouped = f"AVG({value}) AS {value}, SUM({value}) AS fr_sum, COUNT({value}) AS fr_count"
+        combined = "SUM(fr_sum) * 1.0 / NULLIF(SUM(fr_count), 0)"
+    else:
+        grouped = f"{aggregate.upper()}({value}) AS {value}"
+        combined = f"{'SUM' if aggregate in ZERO_FILLED else aggregate.upper()}({value})"
+    inner = analyze_sql(sql, db_type).sql
+    return (
+        f"WITH ranked AS (SELECT g.*, ROW_NUMBER() OVER "
+        f"(ORDER BY CASE WHEN {value} IS NULL THEN 1 ELSE 0 END, {value} DESC, {label}) AS fr_rn "
+        f"FROM (SELECT {label}, {grouped} FROM ({inner}) AS src GROUP BY {label}) AS g) "
+        f"SELECT {label}, {value}, fr_rn AS {quote_identifier(db_type, RANK_COLUMN)} FROM ranked WHERE fr_rn <= {n} "
+        f"UNION ALL SELECT NULL, {combined}, CASE WHEN COUNT(*) > 0 THEN {n + 1} END FROM ranked WHERE fr_rn > {n}"
+    )
+
+
+def label_other(rows: list, columns: list, options: dict) -> tuple[list, list]:
+    """
+    (rows, columns) of a top_n_sql result in rank order (the row-cap wrapper does not keep the
+    source's order): the remainder row labelled OTHER_LABEL or dropped if empty, rank column dropped.
+    """
+    n = int(options["top_n"])
+    rows = sorted((row for row in rows if row[RANK_COLUMN] is not None), key=lambda row: row[RANK_COLUMN])
+    for row in rows:
+        if row.pop(RANK_COLUMN) > n:
+            row[options["label"]] = OTHER_LABEL
+    return rows, [c for c in columns if c != RANK_COLUMN]
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, time())
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _next_bucket(value: datetime, grain: str) -> datetime:
+    if grain == "month":
+        return value.replace(year=value.year + value.month // 12, month=value.month % 12 + 1)
+    return value + _STEPS[grain]
+
+
+def _wall(value: datetime) -> datetime:
+    """Local wall-clock time of a bucket start. PostgreSQL returns aware datetimes with a fixed
+    UTC offset that changes at DST; buckets are stepped and matched on the wall clock instead."""
+    return value.replace(tzinfo=None)
+
+
+def fill_time_gaps(rows: list, options: dict, limit: int = MAX_ROWS) -> list:
+    """
+    Rows of a time_bucket_sql result with bucket values as datetimes, ordered by bucket, and a row
+    for every bucket from the first to the last (per series). Left unfilled if that would exceed
+    limit rows. Filled buckets take the UTC offset of the bucket before them in their series.
+    """
+    x, y, series, grain = options["x"], options["y"], options.get("series"), options["time_grain"]
+    for row in rows:
+        row[x] = _as_datetime(row[x])
+    if not rows or any(row[x] is None for row in rows):
+        return rows
+    # The source's ORDER BY does not survive the row-cap wrapper (limit_sql)
+    rows.sort(key=lambda row: _wall(row[x]))
+    if not options.get("fill_gaps", True):
+        return rows
+    first, last = _wall(rows[0][x]), _wall(rows[-1][x])
+    buckets = [first]
+    while buckets[-1] < last:
+        buckets.append(_next_bucket(buckets[-1], grain))
+        if len(buckets) > limit:
+            return rows
+    by_series: dict = {}
+    for row in rows:
+        by_series.setdefault(row.get(series) if series else None, {})[_wall(row[x])] = row
+    if len(buckets) * len(by_series) > limit:
+        return rows
+    empty = 0 if options["aggregate"] in ZERO_FILLED else None
+    filled = []
+    for name, present in by_series.items():
+        tzinfo = rows[0][x].tzinfo
+        for bucket in buckets:
+            row = present.get(bucket)
+            if row is None:
+                row = {x: bucket.replace(tzinfo=tzinfo), y: empty}
+                if series:
+                    row[series] = name
+            else:
+                tzinfo = row[x].tzinfo
+            filled.append(row)
+    filled.sort(key=lambda row: _wall(row[x]))
+    return filled
+
+
+def parse_top_n(data) -> tuple[dict | None, str | None]:
+    """
+    Top N options from a run-query body: ({ "top_n", "label", "value", "aggregate" } or None, error).
+    None without an error when no top_n is given; pie charts use label/value, bar charts x/y.
+    """
+    top_n = data.get("top_n")
+    if top_n is None:
+        return None, None
+    if isinstance(top_n, bool) or not isinstance(top_n, int) or not 1 <= top_n <= MAX_TOP_N:
+        return None, f"'top_n' must be an integer between 1 and {MAX_TOP_N}."
+    chart_type = data.get("chart_type")
+    if chart_type not in TOP_N_CHART_TYPES:
+        return None, "'top_n' requires 'chart_type' pie or bar."
+    if data.get("time_grain") is not None:
+        return None, "'top_n' cannot be combined with 'time_grain'."
+    aggregate = data.get("aggregate") or "sum"
+    if aggregate not in AGGREGATES:
+        return None, f"'aggregate' must be one of: {', '.join(AGGREGATES)}."
+    label_key, value_key = TOP_N_CHART_TYPES[chart_type]
+    mapping = data.get("column_mapping")
+    if not isinstance(mapping, dict) or not isinstance(mapping.get(label_key), str) or not isinstance(mapping.get(value_key), str):
+        return None, f"'column_mapping' with '{label_key}' and '{value_key}' columns is required for 'top_n'."
+    return {"top_n": top_n, "label": mapping[label_key], "value": mapping[value_key], "aggregate": aggregate}, None
+
+
+def parse_time_grain(data) -> tuple[dict | None, str | None]:
+    """
+    Time bucketing options from a run-query body: ({ "time_grain", "x", "y", "series", "aggregate",
+    "fill_gaps" } or None, error). None without an error when no time_grain is given.
+    """
+    grain = data.get("time_grain")
+    if grain is None:
+        return None, None
+    if grain not in TIME_GRAINS:
+        return None, f"'time_grain' must be one of: {', '.join(TIME_GRAINS)}."
+    aggregate = data.get("aggregate") or "sum"
+    if aggregate not in AGGREGATES:
+        return None, f"'aggregate' must be one of: {', '.join(AGGREGATES)}."
+    fill_gaps = data.get("fill_gaps", True)
+    if not isinstance(fill_gaps, bool):
+        return None, "'fill_gaps' must be true or false."
+    mapping = data.get("column_mapping")
+    if not isinstance(mapping, dict) or not isinstance(mapping.get("x"), str) or not isinstance(mapping.get("y"), str):
+        return None, "'column_mapping' with 'x' and 'y' columns is required for 'time_grain'."
+    series = mapping.get("series") or None
+    if series is not None and not isinstance(series, str):
+        return None, "'column_mapping.series' must be a column name."
+    return {
+        "time_grain": grain,
+        "x": mapping["x"],
+        "y": mapping["y"],
+        "series": series,
+        "aggregate": aggregate,
+        "fill_gaps": fill_gaps,
+    }, None
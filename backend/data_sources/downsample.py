@@ -0,0 +1,112 @@
+"""
+Server-side downsampling of line/area chart results with Largest-Triangle-Three-Buckets (LTTB).
+
+run-query accepts { "chart_type": "line", "column_mapping": { "x", "y", "series" }, "max_points": 500 }:
+each series (rows grouped by the "series" column) keeps at most max_points rows, chosen so the
+plotted shape is preserved: the first and last points, and per bucket the point forming the
+largest triangle with its neighbours (peaks and dips survive, flat stretches thin out).
+Rows are returned unchanged and in their original order; only which rows are kept changes.
+"""
+
+from datetime import date, datetime, time
+
+CHART_TYPES = ("line", "area")
+MIN_POINTS = 3
+MAX_POINTS = 20000
+
+
+def _number(value) -> float | None:
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, date):
+        return datetime.combine(value, time()).timestamp()
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def lttb(xs: list[float], ys: list[float], threshold: int) -> list[int]:
+    """Indexes of the threshold points (x ascending) that best keep the shape of the series."""
+    n = len(xs)
+    if threshold >= n or threshold < MIN_POINTS:
+        return list(range(n))
+    every = (n - 2) / (threshold - 2)
+    picked = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        span = next_end - end
+        avg_x = sum(xs[end:next_end]) / span
+        avg_y = sum(ys[end:next_end]) / span
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        picked.append(best)
+        a = best
+    picked.append(n - 1)
+    return picked
+
+
+def _downsample_series(rows: list, indexes: list[int], x: str, y: str, max_points: int) -> list[int]:
+    xs = [_number(rows[i].get(x)) for i in indexes]
+    if any(v is None for v in xs):
+        # Categorical x: points are evenly spaced in row order
+        xs = [float(p) for p in range(len(indexes))]
+    else:
+        order = sorted(range(len(indexes)), key=xs.__getitem__)
+        indexes = [indexes[p] for p in order]
+        xs = [xs[p] for p in order]
+    ys = [_number(rows[i].get(y)) or 0.0 for i in indexes]
+    return [indexes[p] for p in lttb(xs, ys, max_points)]
+
+
+def downsample_rows(rows: list, x: str, y: str, series: str | None, max_points: int) -> list:
+    """Rows (dicts) reduced to at most max_points per series, in their original order."""
+    groups: dict = {}
+    for i, row in enumerate(rows):
+        groups.setdefault(row.get(series) if series else None, []).append(i)
+    if all(len(indexes) <= max_points for indexes in groups.values()):
+        return rows
+    kept = []
+    for indexes in groups.values():
+        if len(indexes) <= max_points:
+            kept.extend(indexes)
+        else:
+            kept.extend(_downsample_series(rows, indexes, x, y, max_points))
+    kept.sort()
+    return [rows[i] for i in kept]
+
+
+def parse_downsample(data) -> tuple[dict | None, str | None]:
+    """
+    Downsampling options from a run-query body: ({ "x", "y", "series", "max_points" } or None, error).
+    None without an error when the request does not ask for it (no max_points, or not line/area).
+    """
+    max_points = data.get("max_points")
+    if max_points is None or data.get("chart_type") not in CHART_TYPES:
+        return None, None
+    if isinstance(max_points, bool) or not isinstance(max_points, int) or not MIN_POINTS <= max_points <= MAX_POINTS:
+        return None, f"'max_points' must be an integer between {MIN_POINTS} and {MAX_POINTS}."
+    mapping = data.get("column_mapping")
+    if not isinstance(mapping, dict) or not isinstance(mapping.get("x"), str) or not isinstance(mapping.get("y"), str):
+        return None, "'column_mapping' with 'x' and 'y' columns is required for 'max_points'."
+    series = mapping.get("series") or None
+    if series is not None and not isinstance(series, str):
+        return None, "'column_mapping.series' must be a column name."
+    return {"x": mapping["x"], "y": mapping["y"], "series": series, "max_points": max_points}, None
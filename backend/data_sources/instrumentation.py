@@ -0,0 +1,159 @@
+"""
+Query performance instrumentation: per-phase timings (connect, execute, fetch, convert,
+cache_get, cache_set, render), row/byte counts and cache hit/miss for run-query requests.
+
+Exposed as a Server-Timing response header, one structured log line per query
+(logger "data_sources.query") and per-source aggregates with the slowest queries,
+kept in the cache for GET /api/data-sources/<pk>/stats/.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger("data_sources.query")
+
+SLOWEST_KEPT = 20
+
+
+class QueryTimer:
+    """Collects timings for one query request. Phases may be entered more than once (durations add up)."""
+
+    def __init__(self, data_source_id: int | None = None, db_type: str = "", label: str = ""):
+        self.data_source_id = data_source_id
+        self.db_type = db_type
+        self.label = label
+        self.phases: dict[str, float] = {}
+        self.rows = 0
+        self.bytes = 0
+        self.cache = ""  # "hit" | "miss" | "bypass"
+        self.error = ""
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, e.g. 'cache;desc=miss, execute;dur=12.3, total;dur=15.0'."""
+        parts = [f'cache;desc="{self.cache}"'] if self.cache else []
+        parts += [f"{name};dur={ms:.1f}" for name, ms in self.phases.items()]
+        parts.append(f"total;dur={self.total_ms:.1f}")
+        return ", ".join(parts)
+
+    def as_dict(self) -> dict:
+        return {
+            "data_source_id": self.data_source_id,
+            "db_type": self.db_type,
+            "query": self.label,
+            "cache": self.cache,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "total_ms": round(self.total_ms, 2),
+            "phases": {name: round(ms, 2) for name, ms in self.phases.items()},
+            "error": self.error,
+        }
+
+
+def query_label(query_type: str, query_value: str) -> str:
+    """Short, log-safe description of a query: table name or the start of the SQL."""
+    text = " ".join((query_value or "").split())
+    return f"{query_type}:{text[:200]}"
+
+
+def _stats_key(data_source_id: int) -> str:
+    return f"query:stats:{data_source_id}"
+
+
+def record_query(timer: QueryTimer) -> None:
+    """Log the query and fold it into the per-source aggregates (slowest queries first)."""
+    info = timer.as_dict()
+    slow_ms = getattr(settings, "QUERY_SLOW_MS", 1000)
+    level = logging.WARNING if info["total_ms"] >= slow_ms else logging.INFO
+    logger.log(
+        level,
+        "query data_source=%s db_type=%s cache=%s rows=%s bytes=%s total_ms=%.1f %s",
+        info["data_source_id"],
+        info["db_type"],
+        info["cache"] or "-",
+        info["rows"],
+        info["bytes"],
+        info["total_ms"],
+        " ".join(f"{name}_ms={ms:.1f}" for name, ms in info["phases"].items()),
+        extra={"query_stats": info},
+    )
+    if timer.data_source_id is None:
+        return
+    # Read-modify-write: concurrent workers may drop an update; fine for diagnostics.
+    key = _stats_key(timer.data_source_id)
+    stats = cache.get(key) or {"count": 0, "total_ms": 0.0, "hits": 0, "misses": 0, "errors": 0, "slowest": []}
+    stats["count"] += 1
+    stats["total_ms"] += info["total_ms"]
+    if timer.cache == "hit":
+        stats["hits"] += 1
+    elif timer.cache:
+        stats["misses"] += 1
+    if timer.error:
+        stats["errors"] += 1
+    info["at"] = time.time()
+    slowest = [s for s in stats["slowest"] if s["query"] != info["query"] or s["total_ms"] > info["total_ms"]]
+    if not any(s["query"] == info["query"] for s in slowest):
+        slowest.append(info)
+    stats["slowest"] = sorted(slowest, key=lambda s: s["total_ms"], reverse=True)[:SLOWEST_KEPT]
+    cache.set(key, stats, timeout=None)
+
+
+def get_query_stats(data_source_id: int) -> dict:
+    """Aggregates for a data source: counts, cache hit ratio, average latency and slowest queries."""
+    stats = cache.get(_stats_key(data_source_id)) or {"count": 0, "total_ms": 0.0, "hits": 0, "misses": 0, "errors": 0, "slowest": []}
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        "queries": stats["count"],
+        "errors": stats["errors"],
+        "cache_hits": stats["hits"],
+        "cache_misses": stats["misses"],
+        "cache_hit_ratio": round(stats["hits"] / lookups, 4) if lookups else None,
+        "avg_ms": round(stats["total_ms"] / stats["count"], 2) if stats["count"] else None,
+        "slowest": stats["slowest"],
+    }
+
+
+def reset_query_stats(data_source_id: int) -> None:
+    cache.delete(_stats_key(data_source_id))
+
+
+class QueryTimingMixin:
+    """
+    APIView mixin: if the view set self.query_timer, render the response eagerly (timed as
+    "render"), add the Server-Timing header, and log/record the query.
+    """
+
+    query_timer = None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        timer = self.query_timer
+        if timer is None:
+            return response
+        if hasattr(response, "render") and not getattr(response, "is_rendered", True):
+            with timer.phase("render"):
+                response.render()
+        if not getattr(response, "streaming", False):
+            timer.bytes = len(response.content)
+        if response.status_code >= 400 and not timer.error:
+            data = getattr(response, "data", None)
+            timer.error = str(data.get("error", response.status_code) if isinstance(data, dict) else response.status_code)
+        response["Server-Timing"] = timer.server_timing()
+        record_query(timer)
+        return response
@@ -0,0 +1,269 @@
+"""
+Benchmark the query and dashboard hot paths against seeded local data sources.
+Usage:
+  python manage.py benchmark --rows 10000,100000,1000000 --widgets 1,10,25
+  python manage.py benchmark --postgres host=localhost,database=bench,user=bench,password=bench
+  python manage.py benchmark --compare .benchmarks/results-<previous>.json
+Everything written to the app database (user, data sources, dashboards) is rolled back.
+"""
+
+import json
+import logging
+import os
+import pickle
+import platform
+import subprocess
+import time
+import uuid
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from flow_reports_project.renderers import MessagePackRenderer, ORJSONRenderer, msgpack
+
+from dashboards.models import Dashboard
+from dashboards.serializers import DashboardSerializer
+from data_sources.benchmarking import BENCH_TABLE, seed_postgresql, seed_sqlite, summarize
+from data_sources.models import DataSource, SavedVisualization
+from data_sources.query_cache import invalidate_data_source
+from data_sources.run_query import run_sql, table_query_sql
+from data_sources.serializers import SavedVisualizationSerializer
+
+User = get_user_model()
+
+QUERIES = {
+    "table": {"table_name": BENCH_TABLE},
+    "aggregate": {
+        "sql": f"SELECT region, product, SUM(amount) AS total, COUNT(*) AS n FROM {BENCH_TABLE} "
+        "GROUP BY region, product ORDER BY total DESC",
+    },
+    "filtered": {
+        "sql": f"SELECT day, region, amount FROM {BENCH_TABLE} WHERE day >= :start AND day < :end ORDER BY day",
+        "params": {"start": "2021-01-01", "end": "2021-04-01"},
+    },
+}
+
+
+def _int_list(value: str) -> list[int]:
+    try:
+        return [int(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise CommandError(f"Expected comma-separated integers, got {value!r}")
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+class Command(BaseCommand):
+    help = "Benchmark run-query (cold/warm), dashboard load, serialization and cache size; writes JSON results."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", default="10000,100000", help="Comma-separated row counts to seed (10k–5M).")
+        parser.add_argument("--widgets", default="1,10,25", help="Comma-separated widget counts for dashboard load.")
+        parser.add_argument("--repeat", type=int, default=5, help="Samples per measurement.")
+        parser.add_argument(
+            "--postgres",
+            default="",
+            help="Also benchmark a local PostgreSQL source: host=..,port=..,database=..,user=..,password=..",
+        )
+        parser.add_argument("--data-dir", default=str(settings.BASE_DIR / ".benchmarks"), help="Seed and result directory.")
+        parser.add_argument("--output", default="", help="Result JSON path (default: <data-dir>/results-<timestamp>.json).")
+        parser.add_argument("--compare", default="", help="Previous result JSON to compare p50 latencies against.")
+
+    def handle(self, *args, **options):
+        self.repeat = max(1, options["repeat"])
+        row_counts = _int_list(options["rows"])
+        widget_counts = _int_list(options["widgets"])
+        data_dir = options["data_dir"]
+        if options["verbosity"] < 2:
+            logging.getLogger("data_sources.query").setLevel(logging.WARNING)
+
+        sources = []
+        for rows in row_counts:
+            self.stdout.write(f"Seeding SQLite with {rows} rows…")
+            path = seed_sqlite(os.path.join(data_dir, f"bench_{rows}.sqlite3"), rows)
+            sources.append((f"sqlite:{rows}", "sqlite", {"path": path}, rows))
+        if options["postgres"]:
+            config = dict(item.split("=", 1) for item in options["postgres"].split(",") if "=" in item)
+            for rows in row_counts:
+                table = f"{BENCH_TABLE}_{rows}"
+                self.stdout.write(f"Seeding PostgreSQL {table}…")
+                seed_postgresql(config, rows, table=table)
+                sources.append((f"postgresql:{rows}", "postgresql", dict(config, bench_table=table), rows))
+
+        self.results = []
+        with transaction.atomic():
+            user = User.objects.create_user(f"bench_{uuid.uuid4().hex[:8]}", password=uuid.uuid4().hex)
+            self.client = APIClient(HTTP_HOST="localhost")
+            self.client.force_authenticate(user)
+            first = None
+            for label, db_type, config, rows in sources:
+                table = config.pop("bench_table", BENCH_TABLE)
+                ds = DataSource.objects.create(user=user, name=label, db_type=db_type, config=config)
+                first = first or (ds, table)
+                self.bench_run_query(ds, label, rows, table)
+                self.bench_dashboard(user, ds, label, table, widget_counts)
+            if first:
+                self.bench_serialization(user, *first)
+            transaction.set_rollback(True)
+
+        output = options["output"] or os.path.join(data_dir, f"results-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "git_revision": _git_revision(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "cache_backend": settings.CACHES["default"]["BACKEND"],
+                "rows": row_counts,
+                "widgets": widget_counts,
+                "repeat": self.repeat,
+            },
+            "results": self.results,
+        }
+        with open(output, "w") as fh:
+            json.dump(report, fh, indent=2)
+        self.print_summary()
+        if options["compare"]:
+            self.compare(options["compare"])
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+    # --- measurements ---------------------------------------------------------
+
+    def record(self, name: str, samples_ms: list, **extra):
+        self.results.append({"name": name, "latency_ms": summarize(samples_ms), **extra})
+
+    def _post_query(self, ds, body):
+        start = time.perf_counter()
+        response = self.client.post(f"/api/data-sources/{ds.id}/run-query/", body, format="json")
+        elapsed = (time.perf_counter() - start) * 1000
+        if response.status_code != 200:
+            raise CommandError(f"run-query failed ({response.status_code}): {response.content[:300]!r}")
+        return elapsed, response
+
+    def bench_run_query(self, ds, label: str, rows: int, table: str):
+        for name, body in QUERIES.items():
+            body = json.loads(json.dumps(body).replace(BENCH_TABLE, table))
+            cold, warm = [], []
+            response = None
+            for _ in range(self.repeat):
+                invalidate_data_source(ds.id)
+                elapsed, response = self._post_query(ds, body)
+                cold.append(elapsed)
+            for _ in range(self.repeat):
+                elapsed, _ = self._post_query(ds, body)
+                warm.append(elapsed)
+            data = response.json()
+            payload = {"rows": data["rows"], "columns": data["columns"], "truncated": data.get("truncated", False)}
+            cache_bytes = len(pickle.dumps(payload, pickle.HIGHEST_PROTOCOL))
+            result_rows = len(data["rows"])
+            self.record(f"run_query.cold.{name}.{label}", cold, source_rows=rows, result_rows=result_rows)
+            self.record(f"run_query.warm.{name}.{label}", warm, source_rows=rows, result_rows=result_rows)
+            self.results.append({
+                "name": f"cache_size.{name}.{label}",
+                "bytes": cache_bytes,
+                "bytes_per_row": round(cache_bytes / result_rows, 1) if result_rows else None,
+                "response_bytes": len(response.content),
+                "result_rows": result_rows,
+            })
+
+    def bench_dashboard(self, user, ds, label: str, table: str, widget_counts: list):
+        for count in widget_counts:
+            widgets = {
+                f"w{i}": {
+                    "dataSourceId": ds.id,
+                    "sql": f"SELECT region, SUM(amount) AS total FROM {table} WHERE quantity >= {i % 50} GROUP BY region",
+                    "chartType": "bar",
+                    "title": f"Widget {i}",
+                }
+                for i in range(count)
+            }
+            layout = {"lg": [{"i": f"w{i}", "x": (i % 2) * 6, "y": (i // 2) * 4, "w": 6, "h": 4} for i in range(count)]}
+            dashboard = Dashboard.objects.create(user=user, data_source=ds, name=f"bench {count}", layout=layout, widgets=widgets)
+            for phase in ("cold", "warm"):
+                samples = []
+                for _ in range(self.repeat):
+                    if phase == "cold":
+                        invalidate_data_source(ds.id)
+                    start = time.perf_counter()
+                    response = self.client.get(f"/api/dashboards/{dashboard.id}/")
+                    for widget in response.json()["widgets"].values():
+                        self._post_query(ds, {"sql": widget["sql"]})
+                    samples.append((time.perf_counter() - start) * 1000)
+                self.record(f"dashboard_load.{phase}.{count}_widgets.{label}", samples, widgets=count)
+
+    def bench_serialization(self, user, ds, table: str):
+        layout = {"lg": [{"i": f"w{i}", "x": 0, "y": i, "w": 6, "h": 4} for i in range(20)]}
+        widgets = {f"w{i}": {"dataSourceId": ds.id, "sql": "SELECT 1", "chartType": "line", "columnMapping": {"x": "day", "y": "amount"}} for i in range(20)}
+        Dashboard.objects.bulk_create(
+            [Dashboard(user=user, data_source=ds, name=f"ser {i}", layout=layout, widgets=widgets) for i in range(200)]
+        )
+        SavedVisualization.objects.bulk_create(
+            [SavedVisualization(user=user, data_source=ds, name=f"viz {i}", sql="SELECT 1", column_mapping={"x": "day"}) for i in range(200)]
+        )
+        for name, fn in (
+            ("dashboards", lambda: DashboardSerializer(Dashboard.objects.filter(user=user), many=True).data),
+            ("visualizations", lambda: SavedVisualizationSerializer(SavedVisualization.objects.filter(user=user), many=True).data),
+        ):
+            samples, objects = [], 0
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                objects = len(fn())
+                samples.append((time.perf_counter() - start) * 1000)
+            self.record(f"serialize.{name}", samples, objects=objects, objects_per_sec=round(objects / (min(samples) / 1000)))
+
+        # Rows as the driver returns them (dates, decimals), rendered by each API renderer;
+        # render.json.rows is DRF's stdlib JSONRenderer, the baseline.
+        rows, columns, _, truncated = run_sql(ds, table_query_sql(ds.db_type, table))
+        data = {"rows": rows, "columns": columns, "truncated": truncated}
+        renderers = [("json", JSONRenderer()), ("orjson", ORJSONRenderer())]
+        if msgpack is not None:
+            renderers.append(("msgpack", MessagePackRenderer()))
+        for name, renderer in renderers:
+            samples, size = [], 0
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                size = len(renderer.render(data))
+                samples.append((time.perf_counter() - start) * 1000)
+            self.record(f"render.{name}.rows", samples, bytes=size, mb_per_sec=round(size / 1e6 / (min(samples) / 1000), 1))
+
+    # --- reporting ------------------------------------------------------------
+
+    def print_summary(self):
+        for result in self.results:
+            latency = result.get("latency_ms")
+            if latency:
+                self.stdout.write(f"{result['name']:<60} p50={latency['p50']:>10.2f}ms  p95={latency['p95']:>10.2f}ms")
+            else:
+                self.stdout.write(f"{result['name']:<60} {result['bytes']:>12} bytes")
+
+    def compare(self, path: str):
+        with open(path) as fh:
+            baseline = {r["name"]: r for r in json.load(fh)["results"]}
+        self.stdout.write(f"\nCompared with {path} (p50 / bytes):")
+        for result in self.results:
+            before = baseline.get(result["name"])
+            if not before:
+                continue
+            if "latency_ms" in result and "latency_ms" in before and before["latency_ms"].get("p50"):
+                old, new = before["latency_ms"]["p50"], result["latency_ms"]["p50"]
+            elif "bytes" in result and before.get("bytes"):
+                old, new = before["bytes"], result["bytes"]
+            else:
+                continue
+            change = (new - old) / old * 100
+            style = self.style.ERROR if change > 10 else self.style.SUCCESS if change < -10 else (lambda s: s)
+            self.stdout.write(style(f"{result['name']:<60} {old:>12.2f} -> {new:>12.2f} ({change:+.1f}%)"))
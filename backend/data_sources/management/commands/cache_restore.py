@@ -0,0 +1,27 @@
+"""
+Load a query cache snapshot written by cache_snapshot (run before serving traffic).
+Usage:
+  python manage.py cache_restore                        # QUERY_CACHE_SNAPSHOT_PATH
+  python manage.py cache_restore --path /var/lib/flow_reports/query_cache.snapshot --max-age 7200
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from data_sources.cache_snapshot import restore_snapshot, snapshot_path
+
+
+class Command(BaseCommand):
+    help = "Restore query cache entries from a snapshot file, with their remaining TTL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", help="Snapshot file (default: QUERY_CACHE_SNAPSHOT_PATH).")
+        parser.add_argument(
+            "--max-age", type=int, help="Ignore snapshots older than this many seconds (default: QUERY_CACHE_SNAPSHOT_MAX_AGE; 0 = any)."
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"] or snapshot_path()
+        if not path:
+            raise CommandError("Pass --path or set QUERY_CACHE_SNAPSHOT_PATH.")
+        restored = restore_snapshot(path, options["max_age"])
+        self.stdout.write(f"Restored {restored} entries from {path}")
@@ -0,0 +1,35 @@
+"""
+Write the hottest query cache entries to a snapshot file (see data_sources.cache_snapshot).
+Usage:
+  python manage.py cache_snapshot                       # QUERY_CACHE_SNAPSHOT_PATH
+  python manage.py cache_snapshot --path /var/lib/flow_reports/query_cache.snapshot --limit 1000
+  python manage.py cache_snapshot --every 300           # periodically, until interrupted
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from data_sources.cache_snapshot import snapshot_path, write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Snapshot the hottest query cache entries (with remaining TTL) to a local file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", help="Snapshot file (default: QUERY_CACHE_SNAPSHOT_PATH).")
+        parser.add_argument("--limit", type=int, help="Max entries (default: QUERY_CACHE_SNAPSHOT_LIMIT).")
+        parser.add_argument("--every", type=int, default=0, help="Repeat every N seconds.")
+
+    def handle(self, *args, **options):
+        path = options["path"] or snapshot_path()
+        if not path:
+            raise CommandError("Pass --path or set QUERY_CACHE_SNAPSHOT_PATH.")
+        while True:
+            started = time.perf_counter()
+            written = write_snapshot(path, options["limit"])
+            ms = (time.perf_counter() - started) * 1000
+            self.stdout.write(f"Wrote {written} entries to {path} in {ms:.0f} ms")
+            if options["every"] <= 0:
+                return
+            time.sleep(options["every"])
@@ -0,0 +1,133 @@
+"""
+EXPLAIN the per-user list queries of the main endpoints against a seeded app database and
+check that each one uses its composite index.
+Usage:
+  python manage.py check_query_plans                 # seed 200 users x 50 rows per model
+  python manage.py check_query_plans --users 1000 --per-user 100 --verbose
+  python manage.py check_query_plans --strict        # exit 1 if any plan misses its index
+Seed data is written in a transaction and rolled back.
+"""
+
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from dashboards.models import Dashboard, FilterPreset
+from data_sources.models import DataSource, SavedVisualization
+from questions.models import SavedQuestion
+
+User = get_user_model()
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _plans(user, source, dashboard):
+    """(endpoint, expected index, queryset) — the querysets the list views run."""
+    return [
+        ("GET /api/dashboards/", "dashboard_user_updated_idx",
+         Dashboard.objects.filter(user=user)),
+        ("GET /api/dashboards/?page_size=50", "dashboard_user_updated_idx",
+         Dashboard.objects.filter(user=user).order_by("-updated_at", "-id")[:51]),
+        ("GET /api/data-sources/", "datasource_user_updated_idx",
+         DataSource.objects.filter(user=user)),
+        ("GET /api/questions/", "question_user_updated_idx",
+         SavedQuestion.objects.filter(user=user)),
+        ("GET /api/questions/?data_source_id=", "question_user_source_idx",
+         SavedQuestion.objects.filter(user=user, data_source=source)),
+        ("GET /api/data-sources/<id>/visualizations/", "viz_source_user_updated_idx",
+         SavedVisualization.objects.filter(data_source=source, user=user)),
+        ("GET /api/dashboards/filter-presets/", "preset_user_created_idx",
+         FilterPreset.objects.filter(user=user)),
+        ("GET /api/dashboards/<id>/filter-presets/", "preset_dash_user_created_idx",
+         FilterPreset.objects.filter(user=user, dashboard=dashboard)),
+    ]
+
+
+class Command(BaseCommand):
+    help = "Seed the app database, EXPLAIN the main list queries and report whether they use their composite indexes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200, help="Users to seed.")
+        parser.add_argument("--per-user", type=int, default=50, help="Rows per model per user.")
+        parser.add_argument("--strict", action="store_true", help="Exit with an error if any plan misses its index.")
+        parser.add_argument("--verbose", action="store_true", help="Print the full plans.")
+
+    def handle(self, *args, **options):
+        self.misses = []
+        try:
+            with transaction.atomic():
+                user, source, dashboard = self.seed(options["users"], max(1, options["per_user"]))
+                self.analyze()
+                for endpoint, index, queryset in _plans(user, source, dashboard):
+                    self.check_plan(endpoint, index, queryset, options["verbose"])
+                raise _Rollback
+        except _Rollback:
+            pass
+        if self.misses and options["strict"]:
+            raise CommandError(f"{len(self.misses)} queries do not use their index: {', '.join(self.misses)}")
+        if not self.misses:
+            self.stdout.write(self.style.SUCCESS("All list queries use their composite indexes."))
+
+    def seed(self, users: int, per_user: int):
+        self.stdout.write(f"Seeding {users} users x {per_user} rows ({connection.vendor})…")
+        tag = uuid.uuid4().hex[:8]
+        owners = User.objects.bulk_create([User(username=f"plans_{tag}_{i}") for i in range(users)])
+        if not owners[0].pk:  # backends without RETURNING
+            owners = list(User.objects.filter(username__startswith=f"plans_{tag}_").order_by("id"))
+        DataSource.objects.bulk_create(
+            [DataSource(user=u, name=f"Source {i}", db_type="sqlite", config={}) for u in owners for i in range(per_user)],
+            batch_size=5000,
+        )
+        first_source = {s.user_id: s for s in DataSource.objects.filter(user__in=owners).order_by("id")}
+        SavedQuestion.objects.bulk_create(
+            [SavedQuestion(user=u, data_source=first_source[u.pk], title=f"Q {i}", natural_language="?")
+             for u in owners for i in range(per_user)],
+            batch_size=5000,
+        )
+        SavedVisualization.objects.bulk_create(
+            [SavedVisualization(user=u, data_source=first_source[u.pk], name=f"Chart {i}")
+             for u in owners for i in range(per_user)],
+            batch_size=5000,
+        )
+        Dashboard.objects.bulk_create(
+            [Dashboard(user=u, data_source=first_source[u.pk], name=f"Dashboard {i}")
+             for u in owners for i in range(per_user)],
+            batch_size=5000,
+        )
+        first_dashboard = {d.user_id: d for d in Dashboard.objects.filter(user__in=owners).order_by("id")}
+        FilterPreset.objects.bulk_create(
+            [FilterPreset(user=u, dashboard=first_dashboard[u.pk], name=f"Preset {i}")
+             for u in owners for i in range(per_user)],
+            batch_size=5000,
+        )
+        user = owners[len(owners) // 2]
+        return user, first_source[user.pk], first_dashboard[user.pk]
+
+    def analyze(self):
+        """Refresh planner statistics so plans reflect the seeded volume."""
+        tables = [m._meta.db_table for m in (Dashboard, FilterPreset, DataSource, SavedVisualization, SavedQuestion)]
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute("ANALYZE")
+            elif connection.vendor == "postgresql":
+                for table in tables:
+                    cursor.execute(f"ANALYZE {connection.ops.quote_name(table)}")
+            elif connection.vendor == "mysql":
+                cursor.execute("ANALYZE TABLE " + ", ".join(connection.ops.quote_name(t) for t in tables))
+                cursor.fetchall()
+
+    def check_plan(self, endpoint: str, index: str, queryset, verbose: bool):
+        plan = queryset.explain()
+        if index in plan:
+            self.stdout.write(f"{self.style.SUCCESS('ok  ')} {endpoint:<45} {index}")
+        else:
+            self.misses.append(endpoint)
+            self.stdout.write(f"{self.style.ERROR('MISS')} {endpoint:<45} expected {index}")
+            verbose = True
+        if verbose:
+            for line in plan.splitlines():
+                self.stdout.write(f"       {line}")
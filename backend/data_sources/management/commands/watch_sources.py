@@ -0,0 +1,72 @@
+"""
+Poll data sources for table changes and invalidate the cached results that depend on them
+(see data_sources.change_probe). Run it next to the web workers, e.g. as a systemd service.
+Usage:
+  python manage.py watch_sources                    # every QUERY_CHANGE_POLL_SECONDS
+  python manage.py watch_sources --interval 10 --source 3 --source 7
+  python manage.py watch_sources --once             # single pass (cron)
+The last probe of each source is kept in the cache, so a restarted watcher (or a second one)
+compares against it instead of starting over. The first probe of a source only records it.
+Probes only see base tables: entries read through names the probe does not report (views,
+tables in other databases) are invalidated whenever any table of the source changes.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from data_sources.change_probe import changed_tables, probe_tables
+from data_sources.models import DataSource
+from data_sources.query_cache import indexed_tables, invalidate_tables, table_tag
+
+logger = logging.getLogger("data_sources.query")
+
+
+def _probe_key(data_source_id: int) -> str:
+    return f"query:probe:{data_source_id}"
+
+
+class Command(BaseCommand):
+    help = "Watch data sources for table changes and invalidate affected query cache entries."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, help="Seconds between passes (default: QUERY_CHANGE_POLL_SECONDS).")
+        parser.add_argument("--source", type=int, action="append", help="Only these data source ids (repeatable).")
+        parser.add_argument("--once", action="store_true", help="Run one pass and exit.")
+
+    def handle(self, *args, **options):
+        interval = options["interval"] or getattr(settings, "QUERY_CHANGE_POLL_SECONDS", 30)
+        while True:
+            started = time.monotonic()
+            self.poll(options["source"])
+            if options["once"]:
+                return
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    def poll(self, source_ids=None):
+        sources = DataSource.objects.only("id", "db_type", "config").order_by("id")
+        if source_ids:
+            sources = sources.filter(id__in=source_ids)
+        for ds in sources:
+            try:
+                tokens = probe_tables(ds)
+            except Exception as e:
+                logger.warning("change probe failed data_source=%s: %s", ds.id, e)
+                continue
+            previous = cache.get(_probe_key(ds.id))
+            cache.set(_probe_key(ds.id), tokens, timeout=None)
+            if previous is None:
+                continue
+            tables = changed_tables(previous, tokens)
+            if tables is not None and not tables:
+                continue
+            if tables is not None:
+                probed = {table_tag(t) for t in tokens}
+                tables |= {t for t in indexed_tables(ds.id) if t not in probed}
+            deleted = invalidate_tables(ds.id, tables)
+            changed = "all tables" if tables is None else ", ".join(sorted(tables))
+            logger.info("source changed data_source=%s tables=%s invalidated=%s", ds.id, changed, deleted)
+            self.stdout.write(f"Data source {ds.id}: {changed} changed, {deleted} cached results invalidated")
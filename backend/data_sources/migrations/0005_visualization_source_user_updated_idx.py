@@ -0,0 +1,20 @@
+# Generated by Django 6.0.2 on 2026-10-19 18:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_sources', '0004_add_table_name_sql'),
+        ('questions', '0002_add_data_source_and_visualizations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='savedvisualization',
+            index=models.Index(fields=['data_source', 'user', '-updated_at', '-id'], name='viz_source_user_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-19 18:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_sources', '0005_visualization_source_user_updated_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='datasource',
+            index=models.Index(fields=['user', '-updated_at'], name='datasource_user_updated_idx'),
+        ),
+    ]
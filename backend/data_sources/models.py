@@ -24,6 +24,9 @@ class DataSource(models.Model):
 
     class Meta:
         ordering = ["-updated_at"]
+        indexes = [
+            models.Index(fields=["user", "-updated_at"], name="datasource_user_updated_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -71,6 +74,9 @@ class SavedVisualization(models.Model):
 
     class Meta:
         ordering = ["-updated_at"]
+        indexes = [
+            models.Index(fields=["data_source", "user", "-updated_at", "-id"], name="viz_source_user_updated_idx"),
+        ]
 
     def __str__(self):
         return self.name
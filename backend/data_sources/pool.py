@@ -0,0 +1,168 @@
+"""
+Per-process connection pool for PostgreSQL and MySQL data sources.
+
+Connections are keyed by data source id + config, so editing a data source never
+reuses a connection made with the old settings. Idle connections are closed after
+DATA_SOURCE_POOL_MAX_IDLE seconds; at most DATA_SOURCE_POOL_SIZE are kept per key.
+SQLite connections are cheap local file handles and are not pooled.
+
+Sessions are read-only, and read-only mode is set again on every checkout (one round trip):
+session settings persist on a pooled connection, so a statement that switched it off must
+not leave a writable session for the next request.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from flow_reports_project.metrics import POOL_CONNECTIONS
+
+POOLED_DB_TYPES = {"postgresql", "mysql"}
+
+_lock = threading.Lock()
+_idle: dict[tuple, list["PooledConnection"]] = {}
+
+
+class PooledConnection:
+    """A driver connection plus per-connection state (server-side prepared statements)."""
+
+    __slots__ = ("conn", "key", "last_used", "prepared")
+
+    def __init__(self, conn, key):
+        self.conn = conn
+        self.key = key
+        self.last_used = time.monotonic()
+        # statement text -> server-side prepared statement name
+        self.prepared: dict[str, str] = {}
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+def _pool_size() -> int:
+    return int(getattr(settings, "DATA_SOURCE_POOL_SIZE", 4))
+
+
+def _max_idle() -> float:
+    return float(getattr(settings, "DATA_SOURCE_POOL_MAX_IDLE", 300))
+
+
+def _pool_key(data_source) -> tuple:
+    config = json.dumps(data_source.config or {}, sort_keys=True, default=str)
+    return (data_source.id, data_source.db_type, hashlib.sha256(config.encode()).hexdigest()[:16])
+
+
+def _is_open(conn, db_type: str) -> bool:
+    if db_type == "postgresql":
+        return not conn.closed
+    if db_type == "mysql":
+        return bool(conn.open)
+    return True
+
+
+READ_ONLY_SQL = {
+    "postgresql": "SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY",
+    "mysql": "SET SESSION TRANSACTION READ ONLY",
+}
+
+
+def _set_read_only(conn, db_type: str) -> None:
+    with conn.cursor() as cursor:
+        cursor.execute(READ_ONLY_SQL[db_type])
+
+
+def _connect(data_source):
+    from .run_query import get_connection
+
+    conn = get_connection(data_source)
+    # Read-only, autocommit sessions: no idle transactions holding snapshots between requests.
+    if data_source.db_type == "postgresql":
+        conn.set_session(readonly=True, autocommit=True)
+    elif data_source.db_type == "mysql":
+        conn.autocommit(True)
+        _set_read_only(conn, "mysql")
+    return conn
+
+
+def _checkout(data_source, key) -> PooledConnection | None:
+    """An idle connection for key with read-only mode restored, or None. Stale ones are closed."""
+    idle_gauge = POOL_CONNECTIONS.labels(data_source.db_type, "idle")
+    while True:
+        with _lock:
+            idle = _idle.get(key) or []
+            candidate = idle.pop() if idle else None
+        if candidate is None:
+            return None
+        idle_gauge.dec()
+        fresh = time.monotonic() - candidate.last_used <= _max_idle()
+        if fresh and _is_open(candidate.conn, data_source.db_type):
+            try:
+                _set_read_only(candidate.conn, data_source.db_type)
+                return candidate
+            except Exception:
+                pass  # broken connection: close it and try the next one
+        candidate.close()
+
+
+def _checkin(entry: PooledConnection) -> None:
+    entry.last_used = time.monotonic()
+    with _lock:
+        idle = _idle.setdefault(entry.key, [])
+        if len(idle) < _pool_size():
+            idle.append(entry)
+            POOL_CONNECTIONS.labels(entry.key[1], "idle").inc()
+            return
+    entry.close()
+
+
+def _timed(timer, fn):
+    if timer is None:
+        return fn()
+    with timer.phase("connect"):
+        return fn()
+
+
+@contextmanager
+def pooled_connection(data_source, timer=None):
+    """
+    Yield a PooledConnection for the data source. The connection goes back to the pool
+    if the block completes, and is closed if it raises (state may be broken).
+    Checkout/connect time is recorded as the "connect" phase of timer (QueryTimer) if given.
+    """
+    if data_source.db_type not in POOLED_DB_TYPES:
+        entry = _timed(timer, lambda: PooledConnection(_connect(data_source), None))
+        try:
+            yield entry
+        finally:
+            entry.close()
+        return
+    key = _pool_key(data_source)
+    entry = _timed(timer, lambda: _checkout(data_source, key) or PooledConnection(_connect(data_source), key))
+    in_use = POOL_CONNECTIONS.labels(data_source.db_type, "in_use")
+    in_use.inc()
+    try:
+        yield entry
+    except BaseException:
+        entry.close()
+        raise
+    finally:
+        in_use.dec()
+    _checkin(entry)
+
+
+def close_pool(data_source_id: int | None = None) -> int:
+    """Close idle connections for one data source (or all). Returns number closed."""
+    with _lock:
+        keys = [k for k in _idle if data_source_id is None or k[0] == data_source_id]
+        entries = [e for k in keys for e in _idle.pop(k)]
+    for entry in entries:
+        POOL_CONNECTIONS.labels(entry.key[1], "idle").dec()
+        entry.close()
+    return len(entries)
@@ -1,41 +1,302 @@
 """
 Query result cache for run-query (Power BI–style: load once → fast in-memory → refresh).
-Keys: data_source_id + query type (table/sql) + normalized identifier.
+Keys: data_source_id + query type (table/sql) + normalized identifier (+ parameter values)
+(+ a variant: a derived form of the result, such as a downsampled chart series).
+Each entry is tagged with the tables it reads (parsed from its SQL), and a per-source reverse
+index (table -> keys) lets a table refresh drop exactly the entries that depend on it.
+Admission, TTL and per-source eviction follow each query's cost, size and reads (cache_policy).
+Rendered response bodies of an entry (per format and content encoding) are cached next to it
+under "<key>:body:<format>:<encoding>", so warm hits skip unpickling rows and re-encoding.
+A body is only served while it was rendered from the current entry: "<key>:body:etag" holds the
+entry's ETag and is deleted with the bodies, so a body rendered from a result that was refreshed
+or invalidated meanwhile is never written back or served.
 """
 
 import hashlib
+import json
+import threading
+import time
+from collections import Counter
+
 from django.core.cache import cache
 from django.conf import settings
 
+from flow_reports_project.http_cache import make_etag
+from flow_reports_project.metrics import CACHE_EVICTIONS, CACHE_LOOKUPS, CACHE_REJECTS, CACHE_STORES
+
+from .cache_policy import decide, estimate_size, query_cost_ms, value_score
+from .sql_parse import normalize_sql, referenced_tables
+
+# Keys tracked per source for invalidation (entries plus their rendered bodies)
+TRACKED_KEYS = 4000
+# Index bucket for entries whose tables could not be parsed: dropped on any table change.
+UNKNOWN_TABLES = "*"
+
 
 def _normalize_sql(sql: str) -> str:
-    """Normalize SQL for cache key: strip, single spaces, lower."""
-    return " ".join((sql or "").strip().lower().split())
+    """Normalize SQL for cache key: tokenized, comments dropped, single spaces, keywords lower (memoized)."""
+    return normalize_sql(sql)
+
+
+def _params_suffix(params: dict | None) -> str:
+    """Key suffix for bound parameter values; same SQL with other values gets its own entry."""
+    if not params:
+        return ""
+    encoded = json.dumps(params, sort_keys=True, default=str)
+    return f":p:{hashlib.sha256(encoded.encode()).hexdigest()[:16]}"
+
 
+def _variant_suffix(variant: dict | None) -> str:
+    """Key suffix for a derived result (e.g. downsampling options); kept under its query's key prefix."""
+    if not variant:
+        return ""
+    encoded = json.dumps(variant, sort_keys=True, default=str)
+    return f":v:{hashlib.sha256(encoded.encode()).hexdigest()[:16]}"
 
-def build_key(data_source_id: int, query_type: str, query_value: str) -> str:
-    """Build cache key. query_type is 'table' or 'sql'; query_value is table name or SQL."""
+
+def build_key(
+    data_source_id: int,
+    query_type: str,
+    query_value: str,
+    params: dict | None = None,
+    variant: dict | None = None,
+) -> str:
+    """
+    Build cache key. query_type is 'table' or 'sql'; query_value is table name or SQL; params are
+    bound values; variant describes a derived result of the same query.
+    """
     if query_type == "table":
         safe = "".join(c for c in (query_value or "").strip() if c.isalnum() or c in "._")
         payload = f"table:{safe}"
     else:
         payload = f"sql:{hashlib.sha256(_normalize_sql(query_value).encode()).hexdigest()[:32]}"
-    return f"query:{data_source_id}:{payload}"
+    return f"query:{data_source_id}:{payload}{_params_suffix(params)}{_variant_suffix(variant)}"
+
+
+def get_cached_result(
+    data_source_id: int,
+    query_type: str,
+    query_value: str,
+    params: dict | None = None,
+    timer=None,
+    variant: dict | None = None,
+):
+    """
+    Return cached { "rows", "columns", "truncated", "etag" } or None.
+    query_type: "table" | "sql", query_value: table name or SQL string, params: bound :parameter values.
+    timer (instrumentation.QueryTimer) records the "cache_get" phase and hit/miss.
+    """
+    key = build_key(data_source_id, query_type, query_value, params, variant)
+    if timer is None:
+        result = cache.get(key)
+    else:
+        with timer.phase("cache_get"):
+            result = cache.get(key)
+        timer.cache = "miss" if result is None else "hit"
+        if result is not None:
+            timer.rows = len(result["rows"])
+    CACHE_LOOKUPS.labels("miss" if result is None else "hit").inc()
+    if result is not None:
+        _count_hit(data_source_id, key)
+    return result
+
+
+def _body_key(key: str, fmt: str, encoding: str) -> str:
+    return f"{key}:body:{fmt}:{encoding}"
+
+
+def _stamp_key(key: str) -> str:
+    """ETag of the entry the key's bodies may be rendered from (tracked and deleted like a body)."""
+    return f"{key}:body:etag"
+
+
+def _body_keys(keys_list: list, keys) -> list[str]:
+    """Tracked body keys of the given entry keys."""
+    prefixes = tuple(f"{k}:body:" for k in keys)
+    return [k for k in keys_list if k.startswith(prefixes)] if prefixes else []
 
 
-def get_cached_result(data_source_id: int, query_type: str, query_value: str):
+def get_cached_body(
+    data_source_id: int,
+    query_type: str,
+    query_value: str,
+    params: dict | None = None,
+    fmt: str = "json",
+    encoding: str = "identity",
+    timer=None,
+    variant: dict | None = None,
+):
+    """
+    Return a cached rendered response { "body", "encoding", "etag", "rows" } or None.
+    A miss here is not a cache miss: the caller falls back to get_cached_result.
+    """
+    key = build_key(data_source_id, query_type, query_value, params, variant)
+    body_key = _body_key(key, fmt, encoding)
+    if timer is None:
+        found = cache.get_many([body_key, _stamp_key(key)])
+    else:
+        with timer.phase("cache_get"):
+            found = cache.get_many([body_key, _stamp_key(key)])
+    result = found.get(body_key)
+    if result is not None and result.get("etag") != found.get(_stamp_key(key)):
+        result = None  # rendered from a result that has been replaced or invalidated since
+    if timer is not None:
+        if result is not None:
+            timer.cache = "hit"
+            timer.rows = result["rows"]
+    if result is not None:
+        CACHE_LOOKUPS.labels("hit").inc()
+        _count_hit(data_source_id, key)
+    return result
+
+
+def set_cached_body(
+    data_source_id: int,
+    query_type: str,
+    query_value: str,
+    cached: dict,
+    body: bytes,
+    encoding: str,
+    params: dict | None = None,
+    fmt: str = "json",
+    requested_encoding: str | None = None,
+    variant: dict | None = None,
+) -> None:
     """
-    Return cached { "rows", "columns" } or None.
-    query_type: "table" | "sql", query_value: table name or SQL string.
+    Cache the rendered body of entry cached (from get_cached_result) until the entry expires.
+    requested_encoding: the client's encoding when body was left uncompressed (small bodies).
+    Call after rendering: nothing is stored if the entry was replaced or invalidated meanwhile.
     """
-    key = build_key(data_source_id, query_type, query_value)
-    return cache.get(key)
+    expires = cached.get("expires")
+    remaining = None if expires is None else int(expires - time.time())
+    if remaining is not None and remaining < 1:
+        return
+    key = build_key(data_source_id, query_type, query_value, params, variant)
+    if cache.get(_stamp_key(key)) != cached.get("etag"):
+        return
+    body_key = _body_key(key, fmt, requested_encoding or encoding)
+    value = {
+        "body": body,
+        "encoding": encoding,
+        "etag": cached.get("etag"),
+        "rows": len(cached["rows"]),
+        "expires": expires,
+        "tables": cached.get("tables"),
+    }
+    cache.set(body_key, value, timeout=remaining)
+    track_key(data_source_id, body_key, remaining, cached.get("tables"))
 
 
 def _keys_list_key(data_source_id: int) -> str:
     return f"query:keys:{data_source_id}"
 
 
+def _hits_key(data_source_id: int) -> str:
+    return f"query:hits:{data_source_id}"
+
+
+# Hit counts per entry (for snapshots of the hottest entries), counted in-process and merged
+# into the cache at most every HIT_FLUSH_SECONDS so a cache hit does not cost a cache write.
+HIT_FLUSH_SECONDS = 10
+_hits_lock = threading.Lock()
+_pending_hits: Counter = Counter()
+_hits_flushed = time.monotonic()
+
+
+def _count_hit(data_source_id: int, key: str) -> None:
+    with _hits_lock:
+        _pending_hits[(data_source_id, key)] += 1
+        due = time.monotonic() - _hits_flushed >= HIT_FLUSH_SECONDS
+    if due:
+        flush_hit_counts()
+
+
+def flush_hit_counts() -> None:
+    """Merge this process's pending hit counts into the per-source counts in the cache."""
+    global _hits_flushed
+    with _hits_lock:
+        pending = dict(_pending_hits)
+        _pending_hits.clear()
+        _hits_flushed = time.monotonic()
+    by_source: dict[int, dict[str, int]] = {}
+    for (data_source_id, key), n in pending.items():
+        by_source.setdefault(data_source_id, {})[key] = n
+    for data_source_id, counts in by_source.items():
+        # Read-modify-write like the query stats: a concurrent flush may drop some counts.
+        tracked = set(cache.get(_keys_list_key(data_source_id)) or [])
+        hits = {k: n for k, n in (cache.get(_hits_key(data_source_id)) or {}).items() if k in tracked}
+        for key, n in counts.items():
+            if key in tracked:
+                hits[key] = hits.get(key, 0) + n
+        cache.set(_hits_key(data_source_id), hits, timeout=None)
+
+
+def get_hit_counts(data_source_id: int) -> dict[str, int]:
+    """Cache key -> hits for a source's entries (as of the last flush in each process)."""
+    return cache.get(_hits_key(data_source_id)) or {}
+
+
+def tracked_keys(data_source_id: int) -> list[str]:
+    """Cache keys of a source's stored results (oldest first)."""
+    return cache.get(_keys_list_key(data_source_id)) or []
+
+
+def _tables_index_key(data_source_id: int) -> str:
+    return f"query:tables:{data_source_id}"
+
+
+def table_tag(table_name: str) -> str:
+    """Index name of a table: bare and lower-case ("public.Orders" -> "orders")."""
+    return str(table_name).strip().strip('`"').split(".")[-1].strip('`"').lower()
+
+
+def query_tables(query_type: str, query_value: str) -> list[str] | None:
+    """Tables an entry depends on (sorted), or None if its SQL could not be parsed."""
+    if query_type == "table":
+        return [table_tag(query_value)]
+    tables = referenced_tables(query_value)
+    return None if tables is None else sorted(tables)
+
+
+def track_key(data_source_id: int, key: str, timeout: int | None, tables: list[str] | None = None) -> None:
+    """
+    Register key for data-source invalidation (max TRACKED_KEYS per source) and index it under
+    each table it reads (tables=None: unknown, indexed under UNKNOWN_TABLES).
+    """
+    list_key = _keys_list_key(data_source_id)
+    keys_list = cache.get(list_key) or []
+    if key not in keys_list:
+        keys_list.append(key)
+        keys_list = keys_list[-TRACKED_KEYS:]
+        cache.set(list_key, keys_list, timeout=timeout or None)
+    index_key = _tables_index_key(data_source_id)
+    index = cache.get(index_key) or {}
+    tags = [UNKNOWN_TABLES] if tables is None else tables
+    if all(key in index.get(tag, ()) for tag in tags):
+        return
+    # Read-modify-write like the keys list; keys that fell off the list are pruned here.
+    tracked = set(keys_list)
+    index = {tag: [k for k in keys if k in tracked] for tag, keys in index.items()}
+    for tag in tags:
+        if key not in index.setdefault(tag, []):
+            index[tag].append(key)
+    cache.set(index_key, {tag: keys for tag, keys in index.items() if keys}, timeout=timeout or None)
+
+
+def indexed_tables(data_source_id: int) -> set[str]:
+    """Table names the source's cached entries are indexed under (UNKNOWN_TABLES excluded)."""
+    return set(cache.get(_tables_index_key(data_source_id)) or {}) - {UNKNOWN_TABLES}
+
+
+def keys_for_tables(data_source_id: int, tables) -> set[str]:
+    """Cached keys of a source that read any of tables (plus entries with unknown tables)."""
+    index = cache.get(_tables_index_key(data_source_id)) or {}
+    keys = set(index.get(UNKNOWN_TABLES, ()))
+    for table in tables:
+        keys.update(index.get(table_tag(table), ()))
+    return keys
+
+
 def set_cached_result(
     data_source_id: int,
     query_type: str,
@@ -43,38 +304,229 @@ def set_cached_result(
     rows: list,
     columns: list,
     timeout: int | None = None,
-) -> None:
-    """Store query result in cache and register key for data-source invalidation."""
-    if timeout is None:
-        timeout = getattr(settings, "QUERY_CACHE_TIMEOUT", 300)
-    key = build_key(data_source_id, query_type, query_value)
-    cache.set(key, {"rows": rows, "columns": columns}, timeout=timeout or None)
-    # Track this key for full data-source invalidation (max 1000 keys per source)
-    list_key = _keys_list_key(data_source_id)
-    keys_list = cache.get(list_key) or []
-    if key not in keys_list:
-        keys_list.append(key)
-        cache.set(list_key, keys_list[-1000:], timeout=timeout or None)
+    truncated: bool = False,
+    params: dict | None = None,
+    timer=None,
+    cost_ms: float | None = None,
+    variant: dict | None = None,
+    extra: dict | None = None,
+) -> str | None:
+    """
+    Store query result in cache and register key for data-source invalidation.
+    timeout is the base TTL (default QUERY_CACHE_TIMEOUT); expensive, often-read results get longer.
+    cost_ms (taken from timer when given) is what the query cost the source.
+    variant: store a derived result (see build_key); extra: response fields kept with the entry.
+    Returns the entry's ETag (it changes whenever the result is re-executed and stored), or
+    None if the result was not worth caching (see cache_policy).
+    """
+    if timer is not None:
+        with timer.phase("cache_set"):
+            return set_cached_result(
+                data_source_id, query_type, query_value, rows, columns, timeout, truncated, params,
+                cost_ms=query_cost_ms(timer), variant=variant, extra=extra,
+            )
+    key = build_key(data_source_id, query_type, query_value, params, variant)
+    size = estimate_size(rows, columns)
+    meta = cache.get(_meta_key(data_source_id)) or {}
+    previous = meta.get(key) or {}
+    reads = previous.get("stores", 0) + get_hit_counts(data_source_id).get(key, 0)
+    decision = decide(cost_ms, size, reads, timeout)
+    now = time.time()
+    timeout = decision.timeout
+    meta.pop(key, None)  # re-insert last: newest
+    meta[key] = {
+        "cost_ms": cost_ms,
+        "size": size,
+        "stores": previous.get("stores", 0) + 1,
+        "expires": (now + timeout if timeout else None) if decision.admit else 0,
+    }
+    if not decision.admit:
+        CACHE_REJECTS.labels(decision.reason).inc()
+        _save_meta(data_source_id, meta)
+        return None
+    # Bodies rendered from the previous result of this query, and (for a full result) results
+    # derived from it (key:v:..., with their bodies): they would outlive the refresh otherwise.
+    keys_list = tracked_keys(data_source_id)
+    stale = _body_keys(keys_list, [key])
+    if variant is None:
+        derived = [k for k in keys_list if k.startswith(f"{key}:v:")]
+        stale.extend(derived)
+        for k in derived:
+            if k in meta:
+                meta[k]["expires"] = 0
+    if stale:
+        cache.delete_many(stale)
+    etag = make_etag(key, time.time_ns())
+    tables = query_tables(query_type, query_value)
+    # "expires" (epoch seconds, None = never) lets snapshots carry the remaining TTL
+    entry = {
+        "rows": rows,
+        "columns": columns,
+        "truncated": truncated,
+        "etag": etag,
+        "expires": now + timeout if timeout else None,
+        "tables": tables,
+        "cost_ms": cost_ms,
+        "size": size,
+    }
+    if extra:
+        entry["extra"] = extra
+    cache.set_many({key: entry, _stamp_key(key): etag}, timeout=timeout)
+    CACHE_STORES.inc()
+    track_key(data_source_id, key, timeout, tables)
+    track_key(data_source_id, _stamp_key(key), timeout, tables)
+    _enforce_budget(data_source_id, meta, keep=key)
+    _save_meta(data_source_id, meta)
+    return etag
+
+
+def _meta_key(data_source_id: int) -> str:
+    return f"query:meta:{data_source_id}"
+
 
+# Per-source query metadata kept for admission decisions (also for results not cached)
+META_KEPT = 2000
 
-def invalidate_data_source(data_source_id: int, table_name: str | None = None, sql: str | None = None) -> int:
+
+def _save_meta(data_source_id: int, meta: dict) -> None:
+    if len(meta) > META_KEPT:
+        # dicts keep insertion order: drop the entries stored longest ago
+        for key in list(meta)[: len(meta) - META_KEPT]:
+            del meta[key]
+    cache.set(_meta_key(data_source_id), meta, timeout=None)
+
+
+def _forget_sizes(data_source_id: int, keys) -> None:
+    """Stop counting deleted entries against the source's budget."""
+    meta = cache.get(_meta_key(data_source_id))
+    if not meta:
+        return
+    changed = False
+    for key in keys:
+        if key in meta and meta[key].get("expires") != 0:
+            meta[key]["expires"] = 0
+            changed = True
+    if changed:
+        cache.set(_meta_key(data_source_id), meta, timeout=None)
+
+
+def _enforce_budget(data_source_id: int, meta: dict, keep: str) -> None:
+    """
+    Past QUERY_CACHE_SOURCE_MAX_MB for the source, drop its lowest-value entries (not keep).
+    The budget is approximate: meta is read-modify-written without a lock, so concurrent stores
+    may each miss the other's entry until the next store.
+    """
+    budget = getattr(settings, "QUERY_CACHE_SOURCE_MAX_MB", 64) * 1024 * 1024
+    if not budget:
+        return
+    now = time.time()
+    hits = get_hit_counts(data_source_id)
+    live = {
+        k: m for k, m in meta.items()
+        if m.get("expires") is None or m["expires"] > now
+    }
+    total = sum(m["size"] for m in live.values())
+    if total <= budget:
+        return
+    # Entries the backend already evicted (LRU, culling) no longer count against the budget
+    for k in [k for k in live if k != keep and not cache.has_key(k)]:
+        total -= live.pop(k)["size"]
+        meta[k]["expires"] = 0
+    if total <= budget:
+        return
+    ranked = sorted(
+        (k for k in live if k != keep),
+        key=lambda k: value_score(live[k]["cost_ms"], live[k]["size"], live[k]["stores"] - 1 + hits.get(k, 0)),
+    )
+    evicted = []
+    for k in ranked:
+        if total <= budget:
+            break
+        total -= live[k]["size"]
+        meta[k]["expires"] = 0
+        evicted.append(k)
+    cache.delete_many(evicted + _body_keys(tracked_keys(data_source_id), evicted))
+    CACHE_EVICTIONS.inc(len(evicted))
+
+
+def _version_key(data_source_id: int) -> str:
+    return f"query:version:{data_source_id}"
+
+
+def get_data_version(data_source_id: int) -> int:
     """
-    Invalidate cache for a data source. If table_name or sql is given, only that entry.
+    Opaque data version of a source, changed by every full invalidation (refresh).
+    Time-based, so a version lost on cache eviction never repeats an older one.
+    """
+    key = _version_key(data_source_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate_data_source(
+    data_source_id: int,
+    table_name: str | None = None,
+    sql: str | None = None,
+    tables: list[str] | None = None,
+) -> int:
+    """
+    Invalidate cache for a data source. If table_name or sql is given, only that entry and its
+    variants (for sql: every cached parameter variant too). If tables is given, every entry that reads
+    one of them (see invalidate_tables).
     Otherwise invalidate all cached queries for this data source.
     Returns number of keys deleted.
     """
+    if tables:
+        return invalidate_tables(data_source_id, tables)
+    list_key = _keys_list_key(data_source_id)
+    keys_list = cache.get(list_key) or []
     if table_name is not None and str(table_name).strip():
         key = build_key(data_source_id, "table", str(table_name).strip())
-        cache.delete(key)
-        return 1
+        # Derived results (key:v:...) and rendered bodies (key:body:..., key:v:...:body:...)
+        related = [k for k in keys_list if k.startswith(f"{key}:")]
+        variants = [k for k in related if ":body:" not in k]
+        cache.delete_many([key, *related])
+        _forget_sizes(data_source_id, [key, *variants])
+        return 1 + len(variants)
     if sql is not None and str(sql).strip():
         key = build_key(data_source_id, "sql", sql.strip())
-        cache.delete(key)
-        return 1
+        # Parameter and derived variants (key:p:..., key:v:...) and rendered bodies (key:body:..., key:p:...:body:...)
+        related = [k for k in keys_list if k.startswith(f"{key}:")]
+        variants = [k for k in related if ":body:" not in k]
+        cache.delete_many([key, *related])
+        _forget_sizes(data_source_id, [key, *variants])
+        return 1 + len(variants)
     # Full source invalidation using tracked keys
-    list_key = _keys_list_key(data_source_id)
-    keys_list = cache.get(list_key) or []
     for k in keys_list:
         cache.delete(k)
-    cache.delete(list_key)
-    return len(keys_list)
+    cache.delete_many([list_key, _hits_key(data_source_id), _tables_index_key(data_source_id), _meta_key(data_source_id)])
+    cache.set(_version_key(data_source_id), time.time_ns(), timeout=None)
+    return sum(1 for k in keys_list if ":body:" not in k)
+
+
+def invalidate_tables(data_source_id: int, tables) -> int:
+    """
+    Invalidate entries that read any of tables (None = every table: full invalidation), found
+    through the table index; entries whose SQL could not be parsed are dropped too. Unrelated
+    entries stay cached. Returns number of keys deleted.
+    """
+    if tables is None:
+        return invalidate_data_source(data_source_id)
+    tables = list(tables)
+    list_key = _keys_list_key(data_source_id)
+    keys_list = cache.get(list_key) or []
+    stale = keys_for_tables(data_source_id, tables)
+    # Table entries stored before they were indexed
+    stale.update(k for k in (build_key(data_source_id, "table", t) for t in tables) if k in keys_list)
+    stale.update(_body_keys(keys_list, stale))
+    if stale:
+        cache.delete_many(list(stale))
+        _forget_sizes(data_source_id, stale)
+        timeout = getattr(settings, "QUERY_CACHE_TIMEOUT", 300)
+        cache.set(list_key, [k for k in keys_list if k not in stale], timeout=timeout or None)
+    cache.set(_version_key(data_source_id), time.time_ns(), timeout=None)
+    return sum(1 for k in stale if ":body:" not in k)
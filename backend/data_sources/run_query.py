@@ -2,35 +2,28 @@
 Run read-only SQL and introspect schema for a DataSource.
 """
 
-from datetime import date, datetime
-from decimal import Decimal
+import hashlib
+import time
 
-# Forbidden SQL (read-only enforcement)
-FORBIDDEN = {"insert", "update", "delete", "drop", "create", "alter", "truncate", "grant", "revoke", "exec", "execute", ";--", "/*"}
-MAX_ROWS = 10_000
+from flow_reports_project.metrics import QUERIES_IN_FLIGHT, QUERY_ERRORS, QUERY_LATENCY, QUERY_ROWS
 
+from .instrumentation import QueryTimer
+from .pool import pooled_connection
+from .sql_parse import analyze_sql, has_top_level_limit, to_driver_sql
 
-def _json_serializable(value):
-    if value is None:
-        return None
-    if isinstance(value, (datetime, date)):
-        return value.isoformat()
-    if isinstance(value, Decimal):
-        return float(value)
-    if isinstance(value, (str, int, float, bool)):
-        return value
-    return str(value)
+MAX_ROWS = 10_000
+MAX_PREPARED_PER_CONNECTION = 64
+PARAM_TYPES = (str, int, float, bool, type(None))
+# PostgreSQL bytea (psycopg2 returns memoryview, which cannot be pickled into the cache)
+PG_BYTEA_OID = 17
+# MySQL error of the limit_sql wrapper when the SELECT projects one name twice (a.id, b.id):
+# 1060 "Duplicate column name". PostgreSQL and SQLite accept such derived tables.
+MYSQL_DUPLICATE_COLUMN = 1060
 
 
-def _check_read_only(sql: str) -> str | None:
+def _check_read_only(sql: str, dialect: str | None = None) -> str | None:
     """Return error message if SQL is not read-only."""
-    lower = sql.lower().strip()
-    for kw in FORBIDDEN:
-        if kw in lower:
-            return f"Forbidden keyword: {kw}"
-    if not lower.startswith("select"):
-        return "Only SELECT queries are allowed."
-    return None
+    return analyze_sql(sql, dialect).error or None
 
 
 def get_connection(data_source):
@@ -68,33 +61,147 @@ def get_connection(data_source):
     raise ValueError(f"Unsupported db_type: {db_type}")
 
 
-def run_sql(data_source, sql: str, limit: int = MAX_ROWS):
+def limit_sql(sql: str, limit: int) -> str:
+    """
+    Wrap a SELECT so the row cap is enforced by the database regardless of its own LIMITs.
+    Fetches one row more than limit so the caller can tell whether results were cut.
+    PostgreSQL, MySQL (derived tables need an alias) and SQLite share the same form.
+    A derived table cannot have two columns of the same name on MySQL; run_sql then runs
+    unwrapped_limit_sql instead. SQLite renames a repeated name in the derived table
+    (id, id:1), so both columns reach the rows; on PostgreSQL and MySQL the rows are dicts
+    and the last column of a repeated name wins.
+    """
+    return f"SELECT * FROM ({sql}) AS q LIMIT {int(limit) + 1}"
+
+
+def unwrapped_limit_sql(sql: str, limit: int) -> str:
+    """
+    sql with LIMIT limit + 1 appended unless it has its own top-level LIMIT (which then bounds
+    the rows the source sends). Used when the statement cannot be wrapped by limit_sql.
+    """
+    if has_top_level_limit(sql):
+        return sql
+    return f"{sql} LIMIT {int(limit) + 1}"
+
+
+def _is_duplicate_column_error(db_type: str, error: Exception) -> bool:
+    return db_type == "mysql" and error.args[:1] == (MYSQL_DUPLICATE_COLUMN,)
+
+
+def table_query_sql(db_type: str, table_name: str) -> str | None:
+    """SELECT * for a schema table, quoted per dialect. None if the name has characters other than letters, digits, '.', '_'."""
+    safe_name = "".join(c for c in table_name if c.isalnum() or c in "._")
+    if not safe_name or safe_name != table_name:
+        return None
+    return f"SELECT * FROM `{safe_name}`" if db_type == "mysql" else f'SELECT * FROM "{safe_name}"'
+
+
+def bind_params(parameters: tuple, params: dict | None):
     """
-    Run read-only SQL against the data source. Returns (rows, columns, error).
-    rows is list of dicts; columns is list of column names.
+    Pick the values for a statement's :parameters from params.
+    Returns (values, error); values only contains the names the SQL uses.
     """
-    err = _check_read_only(sql)
+    params = params or {}
+    values = {}
+    for name in parameters:
+        if name not in params:
+            return {}, f"Missing value for parameter :{name}"
+        value = params[name]
+        if not isinstance(value, PARAM_TYPES):
+            return {}, f"Parameter :{name} must be a string, number, boolean or null."
+        values[name] = value
+    return values, ""
+
+
+def _execute(entry, db_type: str, sql: str, parameters: tuple, values: dict):
+    """Execute on a pooled connection; parameterized PostgreSQL statements use server-side PREPARE."""
+    cursor = entry.conn.cursor()
+    if not parameters:
+        cursor.execute(sql)
+        return cursor
+    if db_type == "sqlite":
+        cursor.execute(to_driver_sql(sql, "named"), values)
+        return cursor
+    if db_type == "postgresql":
+        name = entry.prepared.get(sql)
+        if name is None:
+            if len(entry.prepared) >= MAX_PREPARED_PER_CONNECTION:
+                cursor.execute("DEALLOCATE ALL")
+                entry.prepared.clear()
+            name = f"fr_{hashlib.sha256(sql.encode()).hexdigest()[:24]}"
+            try:
+                cursor.execute(f"PREPARE {name} AS {to_driver_sql(sql, 'numeric')}")
+            except Exception:
+                # e.g. parameter types PostgreSQL cannot infer: fall back to client-side binding
+                cursor.execute(to_driver_sql(sql, "pyformat"), values)
+                return cursor
+            entry.prepared[sql] = name
+        placeholders = ", ".join(["%s"] * len(parameters))
+        cursor.execute(f"EXECUTE {name}({placeholders})", [values[p] for p in parameters])
+        return cursor
+    # PyMySQL only speaks the text protocol; bind client-side.
+    cursor.execute(to_driver_sql(sql, "pyformat"), values)
+    return cursor
+
+
+def run_sql(data_source, sql: str, limit: int = MAX_ROWS, params: dict | None = None, timer=None):
+    """
+    Run read-only SQL against the data source. Returns (rows, columns, error, truncated).
+    rows is list of dicts; columns is list of column names; truncated is True if more
+    than limit rows matched and the result was cut to limit.
+    params supplies values for named :parameters in the SQL (bound by the driver, never
+    interpolated). PostgreSQL/MySQL connections come from the per-process pool.
+    timer (instrumentation.QueryTimer) records connect/execute/fetch/convert phases and row count.
+    """
+    if timer is None:
+        timer = QueryTimer()
+    parsed = analyze_sql(sql, data_source.db_type)
+    if parsed.error:
+        return [], [], parsed.error, False
+    values, err = bind_params(parsed.parameters, params)
     if err:
-        return [], [], err
-    # Ensure LIMIT for safety
-    if "limit" not in sql.lower().rstrip().rstrip(";"):
-        sql = sql.rstrip().rstrip(";") + f" LIMIT {limit}"
+        return [], [], err, False
+    sql = limit_sql(parsed.sql, limit)
+    db_type = data_source.db_type
+    started = time.perf_counter()
+    QUERIES_IN_FLIGHT.labels(db_type).inc()
     try:
-        conn = get_connection(data_source)
-        try:
-            cursor = conn.cursor()
-            cursor.execute(sql)
-            columns = [col[0] for col in cursor.description] if cursor.description else []
-            raw = cursor.fetchall()
-            rows = [
-                {k: _json_serializable(v) for k, v in zip(columns, row)}
-                for row in raw
-            ]
-            return rows, columns, ""
-        finally:
-            conn.close()
+        with pooled_connection(data_source, timer) as entry:
+            with timer.phase("execute"):
+                try:
+                    cursor = _execute(entry, db_type, sql, parsed.parameters, values)
+                except Exception as e:
+                    if not _is_duplicate_column_error(db_type, e):
+                        raise
+                    # Sessions are autocommit, so the connection is still usable
+                    cursor = _execute(entry, db_type, unwrapped_limit_sql(parsed.sql, limit), parsed.parameters, values)
+            description = cursor.description or []
+            columns = [col[0] for col in description]
+            with timer.phase("fetch"):
+                # fetchmany keeps the cap when an unwrapped statement has a larger LIMIT of its own
+                raw = cursor.fetchmany(limit + 1)
+            cursor.close()
+        truncated = len(raw) > limit
+        with timer.phase("convert"):
+            # Values stay as the driver returns them (datetime, Decimal, ...); the API
+            # renderers encode them (flow_reports_project.renderers).
+            rows = [dict(zip(columns, row)) for row in raw[:limit]]
+            if db_type == "postgresql":
+                binary = [col[0] for col in description if col[1] == PG_BYTEA_OID]
+                for row in rows if binary else ():
+                    for name in binary:
+                        if row[name] is not None:
+                            row[name] = bytes(row[name])
+        timer.rows = len(rows)
+        QUERY_ROWS.labels(db_type).inc(len(rows))
+        return rows, columns, "", truncated
     except Exception as e:
-        return [], [], str(e)
+        timer.error = str(e)
+        QUERY_ERRORS.labels(db_type).inc()
+        return [], [], str(e), False
+    finally:
+        QUERIES_IN_FLIGHT.labels(db_type).dec()
+        QUERY_LATENCY.labels(db_type).observe(time.perf_counter() - started)
 
 
 def get_schema(data_source):
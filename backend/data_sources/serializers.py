@@ -75,3 +75,9 @@ class SavedVisualizationSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         validated_data["user"] = self.context["request"].user
         return super().create(validated_data)
+
+
+class SavedVisualizationSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SavedVisualization
+        fields = ("id", "name", "updated_at")
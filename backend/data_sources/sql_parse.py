@@ -0,0 +1,262 @@
+"""
+Tokenizer-based SQL analysis (sqlparse): read-only validation, normalization and the tables
+a query reads (for cache invalidation).
+
+Keywords are recognised as tokens, so identifiers such as created_at or updated_by
+no longer trip the read-only check. Parsing is memoized per SQL string (LRU), so
+repeated dashboard queries skip re-validation and cache-key normalization.
+
+sqlparse reads a backslash before a quote inside a quoted string or identifier as an escaped
+quote, while PostgreSQL and SQLite end the literal at that quote (MySQL does too after an
+escaped backslash): text the validator saw as one literal would run as further statements.
+Backslashes inside quotes are therefore rejected.
+"""
+
+from functools import lru_cache
+from typing import NamedTuple
+
+import sqlparse
+from sqlparse import tokens as T
+
+PARSE_CACHE_SIZE = 2048
+
+# The statement must be a SELECT, so only keywords that can write from inside one matter:
+# any DML other than SELECT (data-modifying CTEs, FOR UPDATE), DDL/DCL, and SELECT ... INTO.
+FORBIDDEN_TOKEN_TYPES = (T.Keyword.DML, T.Keyword.DDL, T.Keyword.DCL)
+FORBIDDEN_KEYWORDS = {"INTO"}
+
+# Functions with side effects or filesystem/network access, per dialect.
+FORBIDDEN_FUNCTIONS = {
+    "postgresql": {
+        "pg_sleep", "pg_sleep_for", "pg_sleep_until", "pg_terminate_backend", "pg_cancel_backend",
+        "pg_reload_conf", "pg_rotate_logfile", "pg_read_file", "pg_read_binary_file", "pg_ls_dir",
+        "pg_stat_file", "lo_import", "lo_export", "set_config", "dblink", "dblink_exec",
+        "pg_advisory_lock", "pg_advisory_xact_lock", "nextval", "setval",
+    },
+    "mysql": {"sleep", "benchmark", "load_file", "get_lock", "release_lock", "sys_exec", "sys_eval"},
+    "sqlite": {"load_extension", "readfile", "writefile", "edit"},
+}
+
+
+class ParsedSQL(NamedTuple):
+    """Result of analyze_sql. error is empty when the statement is a single read-only SELECT."""
+
+    sql: str  # comments stripped, whitespace collapsed, no trailing semicolon (safe to execute/wrap)
+    normalized: str  # sql with keywords lower-cased (cache keys)
+    error: str
+    parameters: tuple = ()  # named :parameters, in order of first use
+
+
+class _Tokens(NamedTuple):
+    sql: str
+    normalized: str
+    statement_count: int
+    statement_type: str
+    keywords: frozenset  # forbidden keywords found
+    functions: frozenset
+    executable_comment: bool
+    parameters: tuple
+    quoted_backslash: bool  # a backslash inside '...' or "..." (see module docstring)
+
+
+def _is_named_parameter(tok) -> bool:
+    return tok.ttype in T.Name.Placeholder and tok.value.startswith(":") and tok.value[1:].isidentifier()
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _tokenize(sql: str) -> _Tokens:
+    statements = [s for s in sqlparse.parse(sql or "") if s.value.strip().strip(";").strip()]
+    if not statements:
+        return _Tokens("", "", 0, "", frozenset(), frozenset(), False, (), False)
+    statement = statements[0]
+    exact, lowered, keywords, functions, parameters = [], [], set(), set(), []
+    executable_comment = False
+    quoted_backslash = False
+    previous = None
+    for tok in statement.flatten():
+        if tok.ttype in T.Comment:
+            # MySQL runs the body of /*! ... */ comments.
+            executable_comment = executable_comment or tok.value.startswith("/*!")
+            if exact and exact[-1] != " ":
+                exact.append(" ")
+                lowered.append(" ")
+            continue
+        if tok.is_whitespace:
+            if exact and exact[-1] != " ":
+                exact.append(" ")
+                lowered.append(" ")
+            continue
+        if tok.ttype in T.Keyword:
+            word = tok.normalized.upper()
+            if word in FORBIDDEN_KEYWORDS or (
+                word != "SELECT" and any(tok.ttype in tt for tt in FORBIDDEN_TOKEN_TYPES)
+            ):
+                keywords.add(word)
+            value = tok.value
+            lowered.append(value.lower())
+        else:
+            value = tok.value
+            lowered.append(value)
+        if tok.ttype in (T.Literal.String.Single, T.Literal.String.Symbol) and "\\" in tok.value:
+            quoted_backslash = True
+        if _is_named_parameter(tok) and tok.value[1:] not in parameters:
+            parameters.append(tok.value[1:])
+        if tok.match(T.Punctuation, "(") and previous is not None and previous.ttype in (T.Name, T.Keyword):
+            functions.add(previous.value.strip('`"').lower())
+        exact.append(value)
+        previous = tok
+    compact = "".join(exact).strip()
+    normalized = "".join(lowered).strip()
+    while compact.endswith(";"):
+        compact = compact[:-1].rstrip()
+        normalized = normalized[:-1].rstrip()
+    return _Tokens(
+        compact,
+        normalized,
+        len(statements),
+        statement.get_type(),
+        frozenset(keywords),
+        frozenset(functions),
+        executable_comment,
+        tuple(parameters),
+        quoted_backslash,
+    )
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def analyze_sql(sql: str, dialect: str | None = None) -> ParsedSQL:
+    """
+    Parse SQL and check it is a single read-only SELECT (or WITH ... SELECT).
+    dialect is a DataSource.db_type ("postgresql", "mysql", "sqlite") or None for generic rules.
+    """
+    parsed = _tokenize(sql or "")
+    params = parsed.parameters
+    if parsed.statement_count == 0:
+        return ParsedSQL("", "", "SQL is empty.")
+    if parsed.quoted_backslash:
+        return ParsedSQL(parsed.sql, parsed.normalized, "Backslashes inside quoted strings or identifiers are not allowed.")
+    if parsed.statement_count > 1:
+        return ParsedSQL(parsed.sql, parsed.normalized, "Only a single statement is allowed.")
+    if parsed.statement_type != "SELECT":
+        return ParsedSQL(parsed.sql, parsed.normalized, "Only SELECT queries are allowed.")
+    forbidden = sorted(parsed.keywords)
+    if forbidden:
+        return ParsedSQL(parsed.sql, parsed.normalized, f"Forbidden keyword: {forbidden[0].lower()}")
+    if parsed.executable_comment:
+        return ParsedSQL(parsed.sql, parsed.normalized, "Executable comments are not allowed.")
+    if dialect is None:
+        denied = set().union(*FORBIDDEN_FUNCTIONS.values())
+    else:
+        denied = FORBIDDEN_FUNCTIONS.get(dialect, set())
+    functions = sorted(parsed.functions & denied)
+    if functions:
+        return ParsedSQL(parsed.sql, parsed.normalized, f"Forbidden function: {functions[0]}", params)
+    return ParsedSQL(parsed.sql, parsed.normalized, "", params)
+
+
+def normalize_sql(sql: str) -> str:
+    """Canonical SQL text for cache keys: comments removed, whitespace collapsed, keywords lower-cased."""
+    return _tokenize(sql or "").normalized
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def has_top_level_limit(sql: str) -> bool:
+    """True if the statement has its own LIMIT clause (not one inside a subquery or CTE body)."""
+    statements = sqlparse.parse(sql or "")
+    return bool(statements) and any(tok.ttype in T.Keyword and tok.normalized == "LIMIT" for tok in statements[0].tokens)
+
+
+def _is_name(tok) -> bool:
+    return tok.ttype in T.Name or tok.ttype in T.Literal.String.Symbol
+
+
+def _unquote(value: str) -> str:
+    return value.strip('`"[]')
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def referenced_tables(sql: str) -> frozenset | None:
+    """
+    Tables a SELECT reads (FROM / JOIN items, subqueries and CTE bodies included), as bare
+    lower-case names: "public.Orders" -> "orders". CTE names and table functions are left out,
+    except a name read inside its own CTE's body (WITH orders AS (SELECT ... FROM orders)),
+    which is the table the CTE shadows. None when a FROM item cannot be read; callers must then assume the query reads anything.
+    """
+    statements = sqlparse.parse(sql or "")
+    if not statements:
+        return frozenset()
+    tokens = [t for t in statements[0].flatten() if not t.is_whitespace and t.ttype not in T.Comment]
+    references, ctes = set(), set()  # references: (name, CTE bodies it is read in)
+    in_from, expect_table = False, False
+    in_query = True  # False inside function arguments: EXTRACT(YEAR FROM ...) lists no tables
+    stack = []  # (in_from, in_query, enclosing CTE bodies) of enclosing parentheses
+    enclosing = frozenset()
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        word = tok.normalized.upper() if tok.ttype in T.Keyword else ""
+        if tok.match(T.Punctuation, "("):
+            stack.append((in_from, in_query, enclosing))
+            if i >= 2 and tokens[i - 1].ttype in T.Keyword and tokens[i - 1].normalized.upper() == "AS" and _is_name(tokens[i - 2]):
+                cte = _unquote(tokens[i - 2].value).lower()  # WITH name AS (
+                ctes.add(cte)
+                enclosing = enclosing | {cte}
+            following = tokens[i + 1] if i + 1 < len(tokens) else None
+            in_query = following is not None and (following.ttype in T.Keyword.DML or following.ttype in T.Keyword.CTE)
+            in_from, expect_table = False, False
+        elif tok.match(T.Punctuation, ")"):
+            in_from, in_query, enclosing = stack.pop() if stack else (False, True, frozenset())
+            expect_table = False
+        elif not in_query:
+            pass
+        elif word == "FROM" or word.endswith("JOIN"):
+            in_from, expect_table = True, True
+        elif expect_table:
+            if word in ("LATERAL", "ONLY"):
+                pass
+            elif _is_name(tok) or (tok.ttype in T.Keyword and tok.ttype not in T.Keyword.DML):
+                # Dotted name (schema.table); keyword-like table names (user, data) are accepted here
+                name = tok.value
+                while i + 2 < len(tokens) and tokens[i + 1].match(T.Punctuation, ".") and _is_name(tokens[i + 2]):
+                    i += 2
+                    name = tokens[i].value
+                is_function = i + 1 < len(tokens) and tokens[i + 1].match(T.Punctuation, "(")
+                if not is_function:
+                    references.add((_unquote(name).lower(), enclosing))
+                expect_table = False
+            else:
+                return None
+        elif in_from and tok.match(T.Punctuation, ","):
+            expect_table = True
+        elif in_from and tok.ttype in T.Keyword and word not in ("AS", "NATURAL"):
+            in_from = False
+        i += 1
+    return frozenset(name for name, within in references if name not in ctes or name in within)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def to_driver_sql(sql: str, style: str) -> str:
+    """
+    Rewrite :name parameters of an analyzed statement (ParsedSQL.sql) for a driver.
+    style: "pyformat" -> %(name)s with literal % doubled (psycopg2, PyMySQL),
+    "named" -> :name unchanged (sqlite3), "numeric" -> $1, $2 ... in order of first use
+    (PostgreSQL PREPARE). Parameters inside string literals and :: casts are left alone.
+    """
+    if style == "named":
+        return sql
+    order = []
+    out = []
+    for tok in sqlparse.parse(sql)[0].flatten():
+        if _is_named_parameter(tok):
+            name = tok.value[1:]
+            if style == "numeric":
+                if name not in order:
+                    order.append(name)
+                out.append(f"${order.index(name) + 1}")
+            else:
+                out.append(f"%({name})s")
+        elif style == "pyformat":
+            out.append(tok.value.replace("%", "%%"))
+        else:
+            out.append(tok.value)
+    return "".join(out)
@@ -0,0 +1,654 @@
+import gzip
+import json
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APITestCase
+
+from questions.models import SavedQuestion
+
+from . import query_cache, run_query
+from .cache_policy import decide
+from .cache_snapshot import collect_entries, restore_snapshot, write_snapshot
+from .change_probe import ALL_TABLES, changed_tables
+from .chart_queries import OTHER_LABEL, fill_time_gaps, label_other, time_bucket_sql, top_n_sql
+from .downsample import downsample_rows, lttb
+from .instrumentation import QueryTimer
+from .models import DataSource, SavedVisualization
+from .pool import PooledConnection, close_pool, pooled_connection
+from .run_query import bind_params, run_sql, unwrapped_limit_sql
+from .sql_parse import analyze_sql, to_driver_sql
+
+
+class VisualizationQueryCountTests(APITestCase):
+    """Visualization lists load their questions in the same query, however many there are."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("viewer", password="secret")
+        self.client.force_authenticate(self.user)
+        self.source = DataSource.objects.create(
+            user=self.user, name="Source", db_type="sqlite", config={"path": ":memory:"}
+        )
+
+    def create_visualizations(self, count):
+        for i in range(count):
+            question = SavedQuestion.objects.create(
+                user=self.user, data_source=self.source, title=f"Question {i}", natural_language="?"
+            )
+            SavedVisualization.objects.create(
+                user=self.user, data_source=self.source, name=f"Chart {i}", question=question
+            )
+
+    def test_list_query_count_is_constant(self):
+        url = f"/api/data-sources/{self.source.pk}/visualizations/"
+        self.create_visualizations(1)
+        # data source lookup + ETag version aggregate + visualizations joined with their question
+        with self.assertNumQueries(3):
+            self.client.get(url)
+        self.create_visualizations(10)
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(len(response.json()), 11)
+        self.assertTrue(all(v["question_title"] for v in response.json()))
+
+    def test_data_source_list_query_count_is_constant(self):
+        for i in range(10):
+            DataSource.objects.create(user=self.user, name=f"Source {i}", db_type="sqlite", config={"path": ":memory:"})
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/data-sources/")
+        self.assertEqual(len(response.json()), 11)
+
+
+class SqlValidationTests(SimpleTestCase):
+    def test_identifiers_containing_keywords_are_accepted(self):
+        parsed = analyze_sql("SELECT created_at, updated_by, deleted FROM t", "postgresql")
+        self.assertEqual((parsed.sql, parsed.error), ("SELECT created_at, updated_by, deleted FROM t", ""))
+        self.assertEqual(analyze_sql("WITH recent AS (SELECT 1) SELECT * FROM recent").error, "")
+
+    def test_only_a_single_select_is_allowed(self):
+        self.assertEqual(analyze_sql("SELECT 1; DROP TABLE t").error, "Only a single statement is allowed.")
+        self.assertEqual(analyze_sql("SELECT 1; SELECT 2").error, "Only a single statement is allowed.")
+        self.assertEqual(analyze_sql("DELETE FROM t").error, "Only SELECT queries are allowed.")
+        self.assertEqual(analyze_sql("SELECT * INTO copy FROM t").error, "Forbidden keyword: into")
+        self.assertEqual(analyze_sql("WITH d AS (DELETE FROM t RETURNING *) SELECT * FROM d").error, "Forbidden keyword: delete")
+        self.assertEqual(analyze_sql("SELECT * FROM t FOR UPDATE").error, "Forbidden keyword: update")
+        self.assertEqual(analyze_sql("SELECT /*! SLEEP(1) */ 1").error, "Executable comments are not allowed.")
+        self.assertEqual(analyze_sql("  ").error, "SQL is empty.")
+
+    def test_forbidden_functions_per_dialect(self):
+        self.assertEqual(analyze_sql("SELECT pg_sleep(1)", "postgresql").error, "Forbidden function: pg_sleep")
+        self.assertEqual(analyze_sql("SELECT SLEEP(1)", "mysql").error, "Forbidden function: sleep")
+        self.assertEqual(analyze_sql("SELECT load_extension('x')", "sqlite").error, "Forbidden function: load_extension")
+        self.assertEqual(analyze_sql("SELECT SLEEP(1)", "postgresql").error, "")
+        # no dialect: every dialect's list applies
+        self.assertEqual(analyze_sql("SELECT load_extension('x')").error, "Forbidden function: load_extension")
+
+    def test_comments_and_trailing_semicolons_are_stripped(self):
+        parsed = analyze_sql("SELECT a -- note\nFROM t /* why */ WHERE b = 1;;")
+        self.assertEqual((parsed.sql, parsed.error), ("SELECT a FROM t WHERE b = 1", ""))
+        self.assertEqual(analyze_sql("SELECT A FROM T Where b = 1").normalized, "select A from T where b = 1")
+
+    def test_backslash_quotes_cannot_hide_a_second_statement(self):
+        # PostgreSQL ends 'x\' at the backslash-quote; sqlparse would read one long literal
+        smuggled = "SELECT 1 AS a, 'x\\' ) q; SET default_transaction_read_only = off; --' AS b"
+        for dialect in ("postgresql", "sqlite", "mysql", None):
+            self.assertEqual(analyze_sql(smuggled, dialect).error, "Backslashes inside quoted strings or identifiers are not allowed.")
+        self.assertTrue(analyze_sql('SELECT "x\\" ; SET search_path = evil; --"', "postgresql").error)
+
+    def test_backslash_quotes_cannot_hide_a_forbidden_function(self):
+        self.assertTrue(analyze_sql("SELECT 'x\\' ) q, pg_sleep(30) --'", "postgresql").error)
+        self.assertEqual(analyze_sql("SELECT 'it''s' AS s", "postgresql").error, "")
+
+
+class ParameterTests(SimpleTestCase):
+    sql = "SELECT * FROM t WHERE a = :a AND b LIKE '50%' AND c::text = :c AND d = ':a' OR e = :a"
+
+    def test_bind_params_keeps_only_referenced_values(self):
+        parameters = analyze_sql(self.sql).parameters
+        self.assertEqual(parameters, ("a", "c"))
+        self.assertEqual(bind_params(parameters, {"a": 1, "c": None, "unused": 2}), ({"a": 1, "c": None}, ""))
+        self.assertEqual(bind_params(parameters, {"a": 1}), ({}, "Missing value for parameter :c"))
+        values, err = bind_params(parameters, {"a": [1], "c": 2})
+        self.assertEqual(err, "Parameter :a must be a string, number, boolean or null.")
+
+    def test_driver_styles(self):
+        sql = analyze_sql(self.sql).sql
+        self.assertEqual(to_driver_sql(sql, "named"), sql)
+        pyformat = to_driver_sql(sql, "pyformat")
+        self.assertIn("a = %(a)s", pyformat)
+        self.assertIn("'50%%'", pyformat)
+        self.assertIn("c::text = %(c)s", pyformat)
+        self.assertIn("d = ':a'", pyformat)
+        numeric = to_driver_sql(sql, "numeric")
+        self.assertIn("a = $1", numeric)
+        self.assertIn("c::text = $2", numeric)
+        self.assertIn("e = $1", numeric)
+        self.assertIn("'50%'", numeric)
+
+    def test_sqlite_binding(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = str(Path(tmp.name) / "source.sqlite3")
+        with sqlite3.connect(path) as conn:
+            conn.execute("CREATE TABLE t (name TEXT, n INTEGER)")
+            conn.executemany("INSERT INTO t VALUES (?, ?)", [("a", 1), ("b", 2), ("c", 3)])
+        source = DataSource(id=1, db_type="sqlite", config={"path": path})
+        rows, _, err, _ = run_sql(source, "SELECT name FROM t WHERE n >= :min AND name != ':min'", params={"min": 2})
+        self.assertEqual((rows, err), ([{"name": "b"}, {"name": "c"}], ""))
+        self.assertEqual(run_sql(source, "SELECT * FROM t WHERE n = :n")[2], "Missing value for parameter :n")
+
+    def test_duplicate_column_names_fall_back_to_an_unwrapped_query(self):
+        conn = sqlite3.connect(":memory:")
+        self.addCleanup(conn.close)
+        conn.execute("CREATE TABLE a (id INTEGER)")
+        conn.executemany("INSERT INTO a VALUES (?)", [(1,), (2,), (3,)])
+        entry = PooledConnection(conn, None)
+        execute = run_query._execute
+        executed = []
+
+        def mysql_like(entry, db_type, sql, parameters, values):
+            # SQLite accepts duplicate names in a derived table; MySQL raises error 1060
+            executed.append(sql)
+            if sql.startswith("SELECT * FROM ("):
+                raise Exception(1060, "Duplicate column name 'id'")
+            return execute(entry, db_type, sql, parameters, values)
+
+        @contextmanager
+        def pooled(data_source, timer=None):
+            yield entry
+
+        source = DataSource(id=1, db_type="mysql", config={})
+        sql = "SELECT x.id, y.id FROM a x JOIN a y ON x.id = y.id"
+        with patch("data_sources.run_query._execute", mysql_like), patch("data_sources.run_query.pooled_connection", pooled):
+            rows, columns, err, truncated = run_sql(source, sql, limit=2)
+            self.assertEqual((err, len(rows), truncated), ("", 2, True))
+            # the source still caps the rows: LIMIT limit + 1 unless the statement has its own
+            self.assertEqual(executed[-1], f"{sql} LIMIT 3")
+            run_sql(source, f"{sql} LIMIT 1", limit=2)
+            self.assertEqual(executed[-1], f"{sql} LIMIT 1")
+        self.assertEqual(unwrapped_limit_sql("SELECT * FROM (SELECT * FROM a LIMIT 5) AS s", 10), "SELECT * FROM (SELECT * FROM a LIMIT 5) AS s LIMIT 11")
+
+    def test_only_mysql_duplicate_column_errors_are_retried(self):
+        executed = []
+
+        def ambiguous(entry, db_type, sql, parameters, values):
+            executed.append(sql)
+            raise Exception('column reference "id" is ambiguous')
+
+        source = DataSource(id=1, db_type="postgresql", config={})
+        with patch("data_sources.run_query._execute", ambiguous), patch("data_sources.pool._connect", side_effect=lambda ds: FakeConnection()):
+            self.assertEqual(run_sql(source, "SELECT id FROM a JOIN b USING (k)")[2], 'column reference "id" is ambiguous')
+        close_pool()
+        self.assertEqual(len(executed), 1)
+
+    def test_sqlite_renames_repeated_names_in_the_wrapper(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = str(Path(tmp.name) / "source.sqlite3")
+        source = DataSource(id=1, db_type="sqlite", config={"path": path})
+        rows, columns, err, _ = run_sql(source, "SELECT 1 AS x, 2 AS x")
+        self.assertEqual((rows, columns, err), ([{"x": 1, "x:1": 2}], ["x", "x:1"], ""))
+
+    def test_parameter_values_get_their_own_cache_entries(self):
+        cache.clear()
+        sql = "SELECT * FROM t WHERE n = :n"
+        self.assertEqual(query_cache.build_key(1, "sql", sql, {"n": 1, "m": 2}), query_cache.build_key(1, "sql", sql, {"m": 2, "n": 1}))
+        for n in (1, 2):
+            query_cache.set_cached_result(1, "sql", sql, [{"n": n}], ["n"], params={"n": n})
+        self.assertEqual(query_cache.get_cached_result(1, "sql", sql, {"n": 2})["rows"], [{"n": 2}])
+        self.assertIsNone(query_cache.get_cached_result(1, "sql", sql, {"n": 3}))
+        self.assertEqual(query_cache.invalidate_data_source(1, sql=sql), 3)
+        self.assertIsNone(query_cache.get_cached_result(1, "sql", sql, {"n": 1}))
+
+
+class FakeConnection:
+    closed = False
+
+    def __init__(self):
+        self.executed = []
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.executed.append(sql)
+
+    def close(self):
+        self.closed = True
+
+
+class PoolTests(SimpleTestCase):
+    def setUp(self):
+        close_pool()
+        self.addCleanup(close_pool)
+        connect = patch("data_sources.pool._connect", side_effect=lambda ds: FakeConnection())
+        self.connect = connect.start()
+        self.addCleanup(connect.stop)
+        self.source = DataSource(id=1, db_type="postgresql", config={"host": "db"})
+
+    def test_connections_are_returned_and_reused(self):
+        with pooled_connection(self.source) as first:
+            pass
+        first.conn.execute("SET default_transaction_read_only = off")
+        with pooled_connection(self.source) as second:
+            self.assertIs(second.conn, first.conn)
+        # read-only mode is restored on every checkout, whatever the previous request changed
+        self.assertEqual(first.conn.executed[-1], "SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+        self.assertEqual(self.connect.call_count, 1)
+        self.assertFalse(first.conn.closed)
+        self.assertEqual(close_pool(1), 1)
+        self.assertTrue(first.conn.closed)
+
+    def test_connection_that_cannot_be_reset_is_replaced(self):
+        with pooled_connection(self.source) as first:
+            pass
+        with patch.object(first.conn, "execute", side_effect=OSError("server closed the connection")):
+            with pooled_connection(self.source) as second:
+                self.assertIsNot(second.conn, first.conn)
+        self.assertTrue(first.conn.closed)
+
+    def test_failed_block_closes_its_connection(self):
+        with self.assertRaises(RuntimeError):
+            with pooled_connection(self.source) as entry:
+                raise RuntimeError("broken")
+        self.assertTrue(entry.conn.closed)
+        self.assertEqual(close_pool(), 0)
+
+    def test_changed_config_and_idle_timeout_get_new_connections(self):
+        with pooled_connection(self.source) as first:
+            pass
+        edited = DataSource(id=1, db_type="postgresql", config={"host": "replica"})
+        with pooled_connection(edited) as other:
+            self.assertIsNot(other.conn, first.conn)
+        with override_settings(DATA_SOURCE_POOL_MAX_IDLE=0):
+            with pooled_connection(self.source) as fresh:
+                self.assertIsNot(fresh.conn, first.conn)
+        self.assertTrue(first.conn.closed)
+
+
+class TableInvalidationTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        for table in ("orders", "customers"):
+            query_cache.set_cached_result(1, "table", table, [], [])
+        self.orders_sql = 'SELECT c.name, SUM(o.total) FROM "Orders" o JOIN public.customers c ON c.id = o.customer_id GROUP BY c.name'
+        self.items_sql = "WITH recent AS (SELECT * FROM items) SELECT COUNT(*) FROM recent"
+        query_cache.set_cached_result(1, "sql", self.orders_sql, [], [])
+        query_cache.set_cached_result(1, "sql", self.items_sql, [], [])
+
+    def test_changed_table_drops_only_entries_that_read_it(self):
+        version = query_cache.get_data_version(1)
+        self.assertEqual(query_cache.invalidate_tables(1, {"orders"}), 2)
+        self.assertIsNone(query_cache.get_cached_result(1, "table", "orders"))
+        self.assertIsNone(query_cache.get_cached_result(1, "sql", self.orders_sql))
+        self.assertIsNotNone(query_cache.get_cached_result(1, "table", "customers"))
+        self.assertIsNotNone(query_cache.get_cached_result(1, "sql", self.items_sql))
+        self.assertNotEqual(query_cache.get_data_version(1), version)
+        self.assertEqual(query_cache.invalidate_data_source(1, tables=["ITEMS"]), 1)
+        self.assertIsNone(query_cache.get_cached_result(1, "sql", self.items_sql))
+
+    def test_unknown_tables_invalidate_everything(self):
+        query_cache.invalidate_tables(1, None)
+        self.assertEqual(query_cache.tracked_keys(1), [])
+
+    def test_referenced_tables(self):
+        self.assertEqual(query_cache.query_tables("sql", self.orders_sql), ["customers", "orders"])
+        self.assertEqual(query_cache.query_tables("sql", self.items_sql), ["items"])
+        self.assertEqual(query_cache.query_tables("sql", "SELECT EXTRACT(YEAR FROM created_at) FROM events"), ["events"])
+        shadowing = "WITH orders AS (SELECT * FROM orders WHERE total > 0) SELECT * FROM orders"
+        self.assertEqual(query_cache.query_tables("sql", shadowing), ["orders"])
+
+    def test_changed_tables(self):
+        self.assertEqual(changed_tables({"a": "1", "b": "1"}, {"a": "1", "b": "2", "c": "1"}), {"b", "c"})
+        self.assertEqual(changed_tables({ALL_TABLES: "1"}, {ALL_TABLES: "1"}), set())
+        self.assertIsNone(changed_tables({ALL_TABLES: "1"}, {ALL_TABLES: "2"}))
+
+
+class WatchSourcesTests(TestCase):
+    def test_entries_read_through_views_are_invalidated_on_any_change(self):
+        cache.clear()
+        user = User.objects.create_user("watcher", password="secret")
+        source = DataSource.objects.create(user=user, name="Source", db_type="postgresql", config={})
+        for sql in ("SELECT * FROM order_totals", "SELECT * FROM customers", "SELECT * FROM orders"):
+            query_cache.set_cached_result(source.pk, "sql", sql, [], [])
+        probes = iter([{"orders": "1", "customers": "1"}, {"orders": "2", "customers": "1"}])
+        with patch("data_sources.management.commands.watch_sources.probe_tables", lambda ds: next(probes)):
+            call_command("watch_sources", "--once", stdout=StringIO())
+            call_command("watch_sources", "--once", stdout=StringIO())
+        self.assertIsNone(query_cache.get_cached_result(source.pk, "sql", "SELECT * FROM order_totals"))
+        self.assertIsNone(query_cache.get_cached_result(source.pk, "sql", "SELECT * FROM orders"))
+        self.assertIsNotNone(query_cache.get_cached_result(source.pk, "sql", "SELECT * FROM customers"))
+
+
+@override_settings(QUERY_CACHE_TIMEOUT=300, QUERY_CACHE_MAX_TIMEOUT=3600, QUERY_CACHE_SOURCE_MAX_MB=1)
+class CachePolicyTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_large_cheap_results_are_not_admitted(self):
+        self.assertFalse(decide(5, 5 * 1024 * 1024, 0).admit)
+        self.assertTrue(decide(5, 10 * 1024, 0).admit)
+        self.assertTrue(decide(5000, 5 * 1024 * 1024, 0).admit)
+        self.assertIsNone(query_cache.set_cached_result(1, "sql", "SELECT * FROM big", [{"x": "y" * 100}] * 50_000, ["x"], cost_ms=5))
+        self.assertIsNone(query_cache.get_cached_result(1, "sql", "SELECT * FROM big"))
+
+    def test_expensive_frequently_read_results_live_longer(self):
+        cheap = decide(5, 1024, 0).timeout
+        expensive = decide(10_000, 1024, 0).timeout
+        popular = decide(10_000, 1024, 20).timeout
+        self.assertLess(cheap, expensive)
+        self.assertLess(expensive, popular)
+        self.assertLessEqual(popular, 3600)
+
+    def test_source_budget_drops_lowest_value_entries(self):
+        rows = [{"x": "y" * 100}] * 4000  # ~0.4 MB
+        for i, cost in enumerate((3000, 1000, 2000)):
+            query_cache.set_cached_result(1, "sql", f"SELECT {i} FROM t", rows, ["x"], cost_ms=cost)
+        self.assertIsNone(query_cache.get_cached_result(1, "sql", "SELECT 1 FROM t"))
+        self.assertIsNotNone(query_cache.get_cached_result(1, "sql", "SELECT 0 FROM t"))
+        self.assertIsNotNone(query_cache.get_cached_result(1, "sql", "SELECT 2 FROM t"))
+
+    def test_entries_evicted_by_the_backend_do_not_count_against_the_budget(self):
+        rows = [{"x": "y" * 100}] * 4000  # ~0.4 MB
+        query_cache.set_cached_result(1, "sql", "SELECT 0 FROM t", rows, ["x"], cost_ms=3000)
+        query_cache.set_cached_result(1, "sql", "SELECT 1 FROM t", rows, ["x"], cost_ms=1000)
+        cache.delete(query_cache.build_key(1, "sql", "SELECT 0 FROM t"))
+        query_cache.set_cached_result(1, "sql", "SELECT 2 FROM t", rows, ["x"], cost_ms=2000)
+        self.assertIsNotNone(query_cache.get_cached_result(1, "sql", "SELECT 1 FROM t"))
+        self.assertIsNotNone(query_cache.get_cached_result(1, "sql", "SELECT 2 FROM t"))
+
+
+class CacheSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user("snapshotter", password="secret")
+        self.source = DataSource.objects.create(user=user, name="Source", db_type="sqlite", config={})
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = str(Path(tmp.name) / "snapshot.pickle.gz")
+
+    def snapshot(self, rows):
+        """Cache rows for "SELECT 1" (with a data version) and write a snapshot; returns the entry."""
+        query_cache.get_data_version(self.source.pk)
+        query_cache.set_cached_result(self.source.pk, "sql", "SELECT 1", rows, ["n"], timeout=600)
+        self.assertEqual(write_snapshot(self.path), 1)
+        return cache.get(query_cache.build_key(self.source.pk, "sql", "SELECT 1"))
+
+    def cached_rows(self):
+        result = query_cache.get_cached_result(self.source.pk, "sql", "SELECT 1")
+        return result and result["rows"]
+
+    def test_collect_entries_reads_only_the_hottest_keys(self):
+        source = self.source
+        keys = []
+        for i in range(6):
+            query_cache.set_cached_result(source.pk, "sql", f"SELECT {i}", [{"n": i}], ["n"])
+            keys.append(query_cache.build_key(source.pk, "sql", f"SELECT {i}"))
+        for key, hits in ((keys[1], 3), (keys[2], 2), (keys[4], 1)):
+            for _ in range(hits):
+                query_cache._count_hit(source.pk, key)
+        cache.delete(keys[1])  # evicted by the backend, still tracked
+        with patch.object(cache, "get_many", wraps=cache.get_many) as get_many:
+            entries = collect_entries(2)
+        self.assertEqual([(e["key"], e["hits"]) for e in entries], [(keys[2], 2), (keys[4], 1)])
+        self.assertEqual([len(c.args[0]) for c in get_many.call_args_list], [2, 2])
+
+    def test_restore_keeps_the_remaining_ttl(self):
+        entry = self.snapshot([{"n": 1}])
+        cache.clear()
+        with patch("data_sources.cache_snapshot.time.time", return_value=entry["expires"] - 100), \
+                patch.object(cache, "add", wraps=cache.add) as add:
+            self.assertEqual(restore_snapshot(self.path, max_age=0), 1)
+        timeouts = {c.args[0]: c.kwargs["timeout"] for c in add.call_args_list}
+        self.assertEqual(timeouts[query_cache.build_key(self.source.pk, "sql", "SELECT 1")], 100)
+        self.assertEqual(self.cached_rows(), [{"n": 1}])
+
+    def test_expired_entries_and_stale_snapshots_are_skipped(self):
+        entry = self.snapshot([{"n": 1}])
+        cache.clear()
+        with patch("data_sources.cache_snapshot.time.time", return_value=entry["expires"]):
+            self.assertEqual(restore_snapshot(self.path, max_age=0), 0)
+        with patch("data_sources.cache_snapshot.time.time", return_value=entry["expires"] - 500):
+            self.assertEqual(restore_snapshot(self.path, max_age=60), 0)
+        self.assertIsNone(self.cached_rows())
+
+    def test_entries_of_a_refreshed_source_are_not_restored(self):
+        self.snapshot([{"n": 1}])
+        query_cache.invalidate_data_source(self.source.pk)  # new data version
+        self.assertEqual(restore_snapshot(self.path), 0)
+        self.assertIsNone(self.cached_rows())
+        # a fresh cache adopts the snapshot's version
+        cache.clear()
+        self.assertEqual(restore_snapshot(self.path), 1)
+        self.assertEqual(self.cached_rows(), [{"n": 1}])
+
+    def test_restore_does_not_overwrite_newer_entries(self):
+        self.snapshot([{"n": 1}])
+        query_cache.set_cached_result(self.source.pk, "sql", "SELECT 1", [{"n": 2}], ["n"])
+        self.assertEqual(restore_snapshot(self.path), 0)
+        self.assertEqual(self.cached_rows(), [{"n": 2}])
+
+
+class DownsampleTests(SimpleTestCase):
+    def test_lttb_keeps_endpoints_and_peaks(self):
+        ys = [0.0] * 1000
+        ys[537], ys[800] = 100.0, -50.0
+        picked = lttb([float(x) for x in range(1000)], ys, 20)
+        self.assertEqual(len(picked), 20)
+        self.assertEqual((picked[0], picked[-1]), (0, 999))
+        self.assertIn(537, picked)
+        self.assertIn(800, picked)
+
+    def test_each_series_is_reduced_in_original_order(self):
+        rows = [{"minute": i // 2, "v": i % 13, "s": "ab"[i % 2]} for i in range(2000)]
+        sampled = downsample_rows(rows, "minute", "v", "s", 50)
+        self.assertEqual(sum(r["s"] == "a" for r in sampled), 50)
+        self.assertEqual(sum(r["s"] == "b" for r in sampled), 50)
+        position = {id(r): i for i, r in enumerate(rows)}
+        positions = [position[id(r)] for r in sampled]
+        self.assertEqual(positions, sorted(positions))
+        self.assertIs(downsample_rows(rows, "minute", "v", "s", 5000), rows)
+
+    def test_storing_the_full_result_drops_its_derived_results(self):
+        cache.clear()
+        variant = {"x": "day", "y": "v", "series": None, "max_points": 10}
+        query_cache.set_cached_result(1, "sql", "SELECT * FROM t", [{"v": 1}], ["v"])
+        query_cache.set_cached_result(1, "sql", "SELECT * FROM t", [{"v": 1}], ["v"], variant=variant)
+        query_cache.set_cached_result(1, "sql", "SELECT * FROM t", [{"v": 2}], ["v"])
+        self.assertIsNone(query_cache.get_cached_result(1, "sql", "SELECT * FROM t", variant=variant))
+        self.assertEqual(query_cache.get_cached_result(1, "sql", "SELECT * FROM t")["rows"], [{"v": 2}])
+
+
+class TimeGrainTests(SimpleTestCase):
+    options = {"time_grain": "month", "x": "day", "y": "amount", "series": None, "aggregate": "sum"}
+
+    def test_bucket_sql_per_dialect(self):
+        sql = "SELECT * FROM sales -- all"
+        self.assertIn("date_trunc('month', \"day\")", time_bucket_sql("postgresql", sql, self.options))
+        self.assertIn("DATE_FORMAT(`day`, '%Y-%m-01 00:00:00')", time_bucket_sql("mysql", sql, self.options))
+        week = time_bucket_sql("sqlite", sql, {**self.options, "time_grain": "week"})
+        self.assertIn("strftime('%Y-%m-%d 00:00:00', \"day\", 'weekday 0', '-6 days')", week)
+        self.assertIn("FROM (SELECT * FROM sales) AS src", week)
+
+    def test_missing_buckets_are_filled(self):
+        rows = [{"day": "2023-11-01 00:00:00", "amount": 5}, {"day": "2024-02-01 00:00:00", "amount": 7}]
+        filled = fill_time_gaps(rows, self.options)
+        self.assertEqual([r["day"].month for r in filled], [11, 12, 1, 2])
+        self.assertEqual([r["amount"] for r in filled], [5, 0, 0, 7])
+        self.assertEqual(len(fill_time_gaps(rows, self.options, limit=3)), 2)
+
+    def test_buckets_across_a_dst_change_keep_their_rows(self):
+        # date_trunc('day', ...) in Europe/Paris: the UTC offset changes on 2024-03-31
+        cet, cest = timezone(timedelta(hours=1)), timezone(timedelta(hours=2))
+        rows = [
+            {"day": datetime(2024, 4, 2, tzinfo=cest), "amount": 7},
+            {"day": datetime(2024, 3, 30, tzinfo=cet), "amount": 5},
+        ]
+        filled = fill_time_gaps(rows, {**self.options, "time_grain": "day"})
+        self.assertEqual([(r["day"].day, r["amount"]) for r in filled], [(30, 5), (31, 0), (1, 0), (2, 7)])
+        self.assertEqual(filled[-1]["day"].utcoffset(), timedelta(hours=2))
+
+    def test_unfilled_rows_are_ordered_by_bucket(self):
+        rows = [{"day": "2024-02-01 00:00:00", "amount": 7}, {"day": "2023-11-01 00:00:00", "amount": 5}]
+        filled = fill_time_gaps(rows, {**self.options, "fill_gaps": False})
+        self.assertEqual([r["amount"] for r in filled], [5, 7])
+
+
+class TopNTests(SimpleTestCase):
+    def run_top_n(self, **options):
+        options = {"label": "region", "value": "amount", "top_n": 2, "aggregate": "sum", **options}
+        conn = sqlite3.connect(":memory:")
+        self.addCleanup(conn.close)
+        conn.execute("CREATE TABLE sales (region TEXT, amount REAL)")
+        conn.executemany("INSERT INTO sales VALUES (?, ?)", [("a", 10), ("a", 30), ("b", 25), ("c", 5), ("d", 1), ("d", 3)])
+        cursor = conn.execute(top_n_sql("sqlite", "SELECT * FROM sales", options))
+        columns = [col[0] for col in cursor.description]
+        rows, columns = label_other([dict(zip(columns, row)) for row in cursor.fetchall()], columns, options)
+        return columns, [(r["region"], r["amount"]) for r in rows]
+
+    def test_remaining_labels_collapse_into_other(self):
+        columns, rows = self.run_top_n()
+        self.assertEqual(columns, ["region", "amount"])
+        self.assertEqual(rows, [("a", 40), ("b", 25), (OTHER_LABEL, 9)])
+        self.assertEqual(self.run_top_n(top_n=4)[1], [("a", 40), ("b", 25), ("c", 5), ("d", 4)])
+        self.assertEqual(self.run_top_n(top_n=10)[1], [("a", 40), ("b", 25), ("c", 5), ("d", 4)])
+
+    def test_rows_are_returned_in_rank_order(self):
+        rows = [{"region": None, "amount": 9, "fr_rank": 3}, {"region": "b", "amount": 25, "fr_rank": 2}, {"region": "a", "amount": 40, "fr_rank": 1}]
+        rows, _ = label_other(rows, ["region", "amount", "fr_rank"], {"label": "region", "top_n": 2})
+        self.assertEqual([r["region"] for r in rows], ["a", "b", OTHER_LABEL])
+
+    def test_other_average_is_over_source_rows(self):
+        self.assertEqual(self.run_top_n(aggregate="avg", top_n=1)[1], [("b", 25), (OTHER_LABEL, 49 / 5)])
+
+
+class QueryInstrumentationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = str(Path(tmp.name) / "source.sqlite3")
+        with sqlite3.connect(path) as conn:
+            conn.execute("CREATE TABLE sales (region TEXT, amount REAL)")
+            conn.executemany("INSERT INTO sales VALUES (?, ?)", [("north", 10), ("south", 25)])
+        self.user = User.objects.create_user("viewer", password="secret")
+        self.client.force_authenticate(self.user)
+        self.source = DataSource.objects.create(user=self.user, name="Source", db_type="sqlite", config={"path": path})
+        self.stats_url = f"/api/data-sources/{self.source.pk}/stats/"
+
+    def run_query(self, sql="SELECT * FROM sales"):
+        return self.client.post(f"/api/data-sources/{self.source.pk}/run-query/", {"sql": sql}, format="json")
+
+    def timing_names(self, response):
+        return [part.split(";")[0] for part in response["Server-Timing"].split(", ")]
+
+    def test_server_timing_lists_cache_status_and_phases(self):
+        miss = self.run_query()
+        self.assertTrue(miss["Server-Timing"].startswith('cache;desc="miss", '))
+        self.assertTrue({"connect", "execute", "fetch", "cache_set", "render"} <= set(self.timing_names(miss)))
+        self.assertEqual(self.timing_names(miss)[-1], "total")
+        hit = self.run_query()
+        self.assertTrue(hit["Server-Timing"].startswith('cache;desc="hit", '))
+        self.assertNotIn("execute", self.timing_names(hit))
+
+    def test_server_timing_format(self):
+        timer = QueryTimer(1, "sqlite", "sql:SELECT 1")
+        timer.cache = "bypass"
+        timer.phases = {"execute": 12.34, "fetch": 1.0}
+        self.assertRegex(timer.server_timing(), r'^cache;desc="bypass", execute;dur=12\.3, fetch;dur=1\.0, total;dur=\d+\.\d$')
+
+    def test_stats_aggregate_the_source_queries(self):
+        self.run_query()
+        self.run_query()
+        self.assertEqual(self.run_query("SELECT * FROM missing").status_code, 400)
+        stats = self.client.get(self.stats_url).json()
+        self.assertEqual((stats["queries"], stats["cache_hits"], stats["cache_misses"], stats["errors"]), (3, 1, 2, 1))
+        self.assertEqual(stats["cache_hit_ratio"], 0.3333)
+        self.assertEqual({s["query"] for s in stats["slowest"]}, {"sql:SELECT * FROM sales", "sql:SELECT * FROM missing"})
+        self.assertEqual(self.client.delete(self.stats_url).status_code, 204)
+        self.assertEqual(self.client.get(self.stats_url).json()["queries"], 0)
+
+    def test_stats_are_only_visible_to_the_owner(self):
+        self.run_query()
+        self.client.force_authenticate(User.objects.create_user("other", password="secret"))
+        self.assertEqual(self.client.get(self.stats_url).status_code, 404)
+        self.assertEqual(self.client.delete(self.stats_url).status_code, 404)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(self.stats_url).json()["queries"], 1)
+
+
+class CachedBodyTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = str(Path(tmp.name) / "source.sqlite3")
+        with sqlite3.connect(path) as conn:
+            conn.execute("CREATE TABLE sales (region TEXT, amount REAL)")
+            conn.executemany("INSERT INTO sales VALUES (?, ?)", [(f"r{i % 7}", i) for i in range(500)])
+        self.user = User.objects.create_user("viewer", password="secret")
+        self.client.force_authenticate(self.user)
+        self.source = DataSource.objects.create(user=self.user, name="Source", db_type="sqlite", config={"path": path})
+        self.url = f"/api/data-sources/{self.source.pk}/run-query/"
+
+    def run_query(self, refresh=False, **headers):
+        body = {"sql": "SELECT * FROM sales", "refresh": refresh}
+        return self.client.post(self.url, body, format="json", HTTP_ACCEPT_ENCODING="gzip", **headers)
+
+    def test_hits_are_served_as_stored_gzip_bytes(self):
+        miss = self.run_query()
+        first_hit = self.run_query()
+        second_hit = self.run_query()
+        self.assertEqual(second_hit["Content-Encoding"], "gzip")
+        self.assertEqual(second_hit.content, first_hit.content)
+        self.assertNotIn("render", second_hit["Server-Timing"])
+        body = json.loads(gzip.decompress(second_hit.content))
+        self.assertTrue(body["cached"])
+        self.assertEqual(body["rows"], miss.json()["rows"])
+        self.assertEqual(self.run_query(HTTP_IF_NONE_MATCH=second_hit["ETag"]).status_code, 304)
+
+    def test_refresh_replaces_stored_bodies(self):
+        self.run_query()
+        stale = self.run_query()
+        refreshed = self.run_query(refresh=True)
+        hit = self.run_query()
+        self.assertNotEqual(hit["ETag"], stale["ETag"])
+        # gzip bytes differ from the identity body: same version, weak validator
+        self.assertEqual(hit["ETag"], f"W/{refreshed['ETag']}")
+
+    def test_body_rendered_from_a_replaced_entry_is_not_served(self):
+        sql = "SELECT * FROM sales"
+        self.run_query()
+        old = query_cache.get_cached_result(self.source.pk, "sql", sql)
+        query_cache.invalidate_tables(self.source.pk, ["sales"])
+        query_cache.set_cached_body(self.source.pk, "sql", sql, old, b"stale", "identity")
+        self.assertIsNone(query_cache.get_cached_body(self.source.pk, "sql", sql))
+        self.run_query()
+        fresh = query_cache.get_cached_result(self.source.pk, "sql", sql)
+        query_cache.set_cached_body(self.source.pk, "sql", sql, fresh, b"fresh", "identity")
+        query_cache.set_cached_result(self.source.pk, "sql", sql, [], ["region", "amount"])
+        query_cache.set_cached_body(self.source.pk, "sql", sql, fresh, b"stale", "identity")
+        self.assertIsNone(query_cache.get_cached_body(self.source.pk, "sql", sql))
+
+    def test_indented_output_is_not_stored(self):
+        self.run_query()
+        indented = self.run_query(HTTP_ACCEPT="application/json; indent=4")
+        self.assertIn(b"\n", indented.content)
+        compact = self.run_query()
+        self.assertEqual(compact["Content-Encoding"], "gzip")
+        self.assertNotIn(b"\n", gzip.decompress(compact.content))
@@ -6,6 +6,7 @@ from .views import (
     DataSourceSchemaView,
     DataSourceRunQueryView,
     DataSourceRefreshCacheView,
+    DataSourceQueryStatsView,
     DataSourceVisualizationListCreateView,
     DataSourceVisualizationDetailView,
 )
@@ -17,6 +18,7 @@ urlpatterns = [
     path("<int:pk>/schema/", DataSourceSchemaView.as_view(), name="data_source_schema"),
     path("<int:pk>/run-query/", DataSourceRunQueryView.as_view(), name="data_source_run_query"),
     path("<int:pk>/refresh-cache/", DataSourceRefreshCacheView.as_view(), name="data_source_refresh_cache"),
+    path("<int:pk>/stats/", DataSourceQueryStatsView.as_view(), name="data_source_query_stats"),
     path(
         "<int:pk>/visualizations/",
         DataSourceVisualizationListCreateView.as_view(),
@@ -1,19 +1,161 @@
+from contextlib import nullcontext
+
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.db.models import Count, Max
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 
+from flow_reports_project.http_cache import (
+    accepted_encoding,
+    encode_body,
+    encoded_response,
+    make_etag,
+    not_modified,
+    set_cache_headers,
+)
+from flow_reports_project.pagination import list_response, wants_summary
+
 from .models import DataSource, SavedVisualization
 from .serializers import (
     DataSourceSerializer,
     DataSourceCreateSerializer,
     TestConnectionSerializer,
     SavedVisualizationSerializer,
+    SavedVisualizationSummarySerializer,
 )
+from .cache_policy import query_cost_ms
+from .chart_queries import fill_time_gaps, label_other, parse_time_grain, parse_top_n, time_bucket_sql, top_n_sql
 from .connection import test_connection
-from .run_query import get_schema, run_sql
-from .query_cache import get_cached_result, set_cached_result, invalidate_data_source
+from .downsample import downsample_rows, parse_downsample
+from .instrumentation import QueryTimer, QueryTimingMixin, get_query_stats, query_label, reset_query_stats
+from .pool import close_pool
+from .run_query import bind_params, get_schema, run_sql, table_query_sql
+from .sql_parse import analyze_sql
+from .query_cache import (
+    get_cached_body,
+    get_cached_result,
+    get_data_version,
+    invalidate_data_source,
+    set_cached_body,
+    set_cached_result,
+)
+
+# Renderer formats whose output is cached as bytes on query cache hits
+RAW_BODY_FORMATS = {"json", "msgpack"}
+
+
+def _cached_body(cached):
+    """Response body for a query_cache hit."""
+    return {
+        "rows": cached["rows"],
+        "columns": cached["columns"],
+        "truncated": cached.get("truncated", False),
+        **cached.get("extra", {}),
+        "cached": True,
+    }
+
+
+def _cached_response(request, cached):
+    """304 if the client already holds this cache entry (If-None-Match), else the cached rows."""
+    etag = cached.get("etag")
+    return not_modified(request, etag) or set_cache_headers(Response(_cached_body(cached)), etag)
+
+
+def _cached_query_response(view, request, ds_id, query_type, query_value, params=None, timer=None, variant=None):
+    """
+    Response for a query cache hit, or None on a miss. The rendered body is cached per format
+    and content encoding, so repeated hits are served as stored bytes: no unpickling of rows,
+    no JSON encoding, no compression. Indented output (Accept: ...; indent=4) is not stored.
+    """
+    renderer = request.accepted_renderer
+    if renderer.format not in RAW_BODY_FORMATS or "indent=" in (request.accepted_media_type or ""):
+        cached = get_cached_result(ds_id, query_type, query_value, params, timer=timer, variant=variant)
+        return None if cached is None else _cached_response(request, cached)
+    encoding = accepted_encoding(request)
+    content_type = f"{renderer.media_type}; charset={renderer.charset}" if renderer.charset else renderer.media_type
+    hit = get_cached_body(ds_id, query_type, query_value, params, renderer.format, encoding, timer=timer, variant=variant)
+    if hit is not None:
+        return not_modified(request, hit["etag"]) or encoded_response(hit["body"], content_type, hit["encoding"], hit["etag"])
+    cached = get_cached_result(ds_id, query_type, query_value, params, timer=timer, variant=variant)
+    if cached is None:
+        return None
+    response = not_modified(request, cached.get("etag"))
+    if response:
+        return response
+    with timer.phase("render") if timer else nullcontext():
+        rendered = renderer.render(_cached_body(cached), request.accepted_media_type, {"request": request, "view": view})
+        body, used = encode_body(rendered, encoding)
+    set_cached_body(
+        ds_id, query_type, query_value, cached, body, used, params, renderer.format,
+        requested_encoding=encoding, variant=variant,
+    )
+    return encoded_response(body, content_type, used, cached.get("etag"))
+
+
+def _error_response(err):
+    return Response({"error": err, "rows": [], "columns": []}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _run_query_response(view, request, ds, query_type, query_value, sql, params, timer, refresh, chart):
+    """
+    Serve a run-query request from the cache or the source, storing what was run.
+    chart (merged parse_time_grain / parse_top_n / parse_downsample options) selects a derived
+    result, cached under its own key: time buckets and top N are aggregated by the source,
+    downsampling reduces the rows of the full result, which is cached as well so other chart
+    sizes and table views reuse it.
+    """
+    if refresh:
+        timer.cache = "bypass"
+    else:
+        response = _cached_query_response(view, request, ds.id, query_type, query_value, params, timer, variant=chart)
+        if response is not None:
+            return response
+    if chart is None:
+        rows, columns, err, truncated = run_sql(ds, sql, params=params, timer=timer)
+        if err:
+            return _error_response(err)
+        etag = set_cached_result(ds.id, query_type, query_value, rows, columns, truncated=truncated, params=params, timer=timer)
+        return set_cache_headers(Response({"rows": rows, "columns": columns, "truncated": truncated}), etag)
+    aggregated = "time_grain" in chart or "top_n" in chart
+    full = None if refresh or aggregated else get_cached_result(ds.id, query_type, query_value, params)
+    if full is not None:
+        rows, columns, truncated, cost_ms = full["rows"], full["columns"], full.get("truncated", False), full.get("cost_ms")
+    elif "time_grain" in chart:
+        rows, columns, err, truncated = run_sql(ds, time_bucket_sql(ds.db_type, sql, chart), params=params, timer=timer)
+        if err:
+            return _error_response(err)
+        with timer.phase("gap_fill"):
+            rows = fill_time_gaps(rows, chart)
+        cost_ms = query_cost_ms(timer)
+    elif "top_n" in chart:
+        rows, columns, err, truncated = run_sql(ds, top_n_sql(ds.db_type, sql, chart), params=params, timer=timer)
+        if err:
+            return _error_response(err)
+        rows, columns = label_other(rows, columns, chart)
+        cost_ms = query_cost_ms(timer)
+    else:
+        rows, columns, err, truncated = run_sql(ds, sql, params=params, timer=timer)
+        if err:
+            return _error_response(err)
+        set_cached_result(ds.id, query_type, query_value, rows, columns, truncated=truncated, params=params, timer=timer)
+        cost_ms = query_cost_ms(timer)
+    extra = {}
+    if "max_points" in chart:
+        missing = [c for c in (chart["x"], chart["y"], chart["series"]) if c and c not in columns]
+        if missing:
+            return _error_response(f"Column '{missing[0]}' is not in the result.")
+        extra["source_rows"] = len(rows)
+        with timer.phase("downsample"):
+            rows = downsample_rows(rows, chart["x"], chart["y"], chart["series"], chart["max_points"])
+    etag = set_cached_result(
+        ds.id, query_type, query_value, rows, columns, truncated=truncated, params=params,
+        cost_ms=cost_ms, variant=chart, extra=extra,
+    )
+    timer.rows = len(rows)
+    return set_cache_headers(Response({"rows": rows, "columns": columns, "truncated": truncated, **extra}), etag)
 
 
 class DataSourceListCreateView(APIView):
@@ -21,8 +163,13 @@ class DataSourceListCreateView(APIView):
 
     def get(self, request):
         qs = DataSource.objects.filter(user=request.user)
+        version = qs.aggregate(count=Count("id"), updated=Max("updated_at"))
+        etag = make_etag("data_sources", request.user.id, version)
+        response = not_modified(request, etag)
+        if response:
+            return response
         serializer = DataSourceSerializer(qs, many=True)
-        return Response(serializer.data)
+        return set_cache_headers(Response(serializer.data), etag)
 
     def post(self, request):
         serializer = DataSourceCreateSerializer(
@@ -42,9 +189,15 @@ class DataSourceDetailView(APIView):
         return get_object_or_404(DataSource, pk=pk, user=request.user)
 
     def get(self, request, pk):
-        obj = self.get_object(request, pk)
-        serializer = DataSourceSerializer(obj)
-        return Response(serializer.data)
+        updated_at = DataSource.objects.filter(pk=pk, user=request.user).values_list("updated_at", flat=True).first()
+        if updated_at is None:
+            raise Http404
+        etag = make_etag("data_source", pk, updated_at)
+        response = not_modified(request, etag)
+        if response:
+            return response
+        serializer = DataSourceSerializer(self.get_object(request, pk))
+        return set_cache_headers(Response(serializer.data), etag)
 
     def patch(self, request, pk):
         obj = self.get_object(request, pk)
@@ -63,10 +216,12 @@ class DataSourceDetailView(APIView):
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         serializer.save()
+        close_pool(obj.id)
         return Response(DataSourceSerializer(serializer.instance).data)
 
     def delete(self, request, pk):
         obj = self.get_object(request, pk)
+        close_pool(obj.id)
         obj.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -96,20 +251,34 @@ class TestConnectionView(APIView):
 
 
 class DataSourceSchemaView(APIView):
-    """GET schema (tables and columns) for a data source."""
+    """GET schema (tables and columns) for a data source.
+    The ETag follows the source's settings and data version, so it changes on edit or refresh-cache."""
 
     permission_classes = [IsAuthenticated]
 
     def get(self, request, pk):
         ds = get_object_or_404(DataSource, pk=pk, user=request.user)
+        etag = make_etag("schema", ds.id, ds.updated_at, get_data_version(ds.id))
+        response = not_modified(request, etag)
+        if response:
+            return response
         tables, err = get_schema(ds)
         if err:
             return Response({"error": err, "tables": []}, status=status.HTTP_400_BAD_REQUEST)
-        return Response({"tables": tables})
+        return set_cache_headers(Response({"tables": tables}), etag)
 
 
-class DataSourceRunQueryView(APIView):
-    """POST run read-only SQL or get columns for a table. Body: { "sql": "..." } or { "table_name": "..." }, optional "refresh": true to bypass cache."""
+class DataSourceRunQueryView(QueryTimingMixin, APIView):
+    """POST run read-only SQL or get columns for a table. Body: { "sql": "..." } or { "table_name": "..." }, optional "refresh": true to bypass cache.
+    SQL may use named parameters (:start_date) with values in "params": { "start_date": "2024-01-01" }.
+    Line/area charts may send "chart_type", "column_mapping" ({ "x", "y", "series" }) and "max_points" to get
+    each series downsampled (LTTB) to at most max_points rows; "source_rows" is then the row count before.
+    "time_grain" (minute/hour/day/week/month) with "aggregate" (sum/avg/count/min/max) groups the x column into
+    time buckets in the source database; empty buckets are filled unless "fill_gaps": false.
+    Pie/bar charts may send "top_n": the N largest labels by aggregated value, plus one "Other" row for the rest.
+    Results are capped at MAX_ROWS; "truncated": true means more rows matched.
+    Per-phase timings are returned in the Server-Timing header.
+    Each cached result has an ETag; sending it back in If-None-Match returns 304 while the entry is unchanged."""
 
     permission_classes = [IsAuthenticated]
 
@@ -118,41 +287,60 @@ class DataSourceRunQueryView(APIView):
         sql = request.data.get("sql")
         table_name = request.data.get("table_name")
         refresh = request.data.get("refresh") is True
+        params = request.data.get("params") or None
+        if params is not None and not isinstance(params, dict):
+            return Response({"error": "'params' must be an object.", "rows": [], "columns": []}, status=status.HTTP_400_BAD_REQUEST)
+        downsample, err = parse_downsample(request.data)
+        if err:
+            return _error_response(err)
+        time_grain, err = parse_time_grain(request.data)
+        if err:
+            return _error_response(err)
+        top_n, err = parse_top_n(request.data)
+        if err:
+            return _error_response(err)
+        chart = {**(time_grain or {}), **(top_n or {}), **(downsample or {})} or None
 
         if sql and isinstance(sql, str) and sql.strip():
             sql = sql.strip()
-            if not refresh:
-                cached = get_cached_result(ds.id, "sql", sql)
-                if cached is not None:
-                    return Response({"rows": cached["rows"], "columns": cached["columns"], "cached": True})
-            rows, columns, err = run_sql(ds, sql)
+            # Only values the SQL references are part of the cache key
+            params, err = bind_params(analyze_sql(sql, ds.db_type).parameters, params)
             if err:
                 return Response({"error": err, "rows": [], "columns": []}, status=status.HTTP_400_BAD_REQUEST)
-            set_cached_result(ds.id, "sql", sql, rows, columns)
-            return Response({"rows": rows, "columns": columns})
+            params = params or None
+            timer = self.query_timer = QueryTimer(ds.id, ds.db_type, query_label("sql", sql))
+            return _run_query_response(self, request, ds, "sql", sql, sql, params, timer, refresh, chart)
         if table_name and isinstance(table_name, str) and table_name.strip():
             table_name = table_name.strip()
-            safe_name = "".join(c for c in table_name if c.isalnum() or c in "._")
-            if safe_name != table_name:
+            gen_sql = table_query_sql(ds.db_type, table_name)
+            if gen_sql is None:
                 return Response({"error": "Invalid table name.", "rows": [], "columns": []}, status=status.HTTP_400_BAD_REQUEST)
-            if not refresh:
-                cached = get_cached_result(ds.id, "table", table_name)
-                if cached is not None:
-                    return Response({"rows": cached["rows"], "columns": cached["columns"], "cached": True})
-            gen_sql = f'SELECT * FROM "{safe_name}"' if ds.db_type == "sqlite" else f"SELECT * FROM `{safe_name}`" if ds.db_type == "mysql" else f'SELECT * FROM "{safe_name}"'
-            rows, columns, err = run_sql(ds, gen_sql)
-            if err:
-                return Response({"error": err, "rows": [], "columns": []}, status=status.HTTP_400_BAD_REQUEST)
-            set_cached_result(ds.id, "table", table_name, rows, columns)
-            return Response({"rows": rows, "columns": columns})
+            timer = self.query_timer = QueryTimer(ds.id, ds.db_type, query_label("table", table_name))
+            return _run_query_response(self, request, ds, "table", table_name, gen_sql, None, timer, refresh, chart)
         return Response(
             {"error": "Provide 'sql' or 'table_name'.", "rows": [], "columns": []},
             status=status.HTTP_400_BAD_REQUEST,
         )
 
 
+class DataSourceQueryStatsView(APIView):
+    """GET query performance for this data source: counts, cache hit ratio, average and slowest queries. DELETE resets."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        ds = get_object_or_404(DataSource, pk=pk, user=request.user)
+        return Response(get_query_stats(ds.id))
+
+    def delete(self, request, pk):
+        ds = get_object_or_404(DataSource, pk=pk, user=request.user)
+        reset_query_stats(ds.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class DataSourceRefreshCacheView(APIView):
-    """POST invalidate query cache for this data source. Body optional: { "table_name": "..." } or { "sql": "..." } to clear only that query."""
+    """POST invalidate query cache for this data source. Body optional: { "table_name": "..." } or { "sql": "..." } to clear only that query,
+    or { "tables": ["orders", ...] } to clear every cached query that reads one of those tables."""
 
     permission_classes = [IsAuthenticated]
 
@@ -160,20 +348,33 @@ class DataSourceRefreshCacheView(APIView):
         ds = get_object_or_404(DataSource, pk=pk, user=request.user)
         table_name = request.data.get("table_name")
         sql = request.data.get("sql")
-        deleted = invalidate_data_source(ds.id, table_name=table_name if table_name else None, sql=sql if sql else None)
+        tables = request.data.get("tables")
+        if tables is not None and (not isinstance(tables, list) or not all(isinstance(t, str) for t in tables)):
+            return Response({"error": "'tables' must be a list of table names."}, status=status.HTTP_400_BAD_REQUEST)
+        deleted = invalidate_data_source(
+            ds.id, table_name=table_name if table_name else None, sql=sql if sql else None, tables=tables or None
+        )
         return Response({"invalidated": deleted})
 
 
 class DataSourceVisualizationListCreateView(APIView):
-    """List or create visualizations for a data source."""
+    """List or create visualizations for a data source. GET supports ?view=summary and ?page_size= / ?cursor=."""
 
     permission_classes = [IsAuthenticated]
 
     def get(self, request, pk):
         ds = get_object_or_404(DataSource, pk=pk, user=request.user)
         qs = SavedVisualization.objects.filter(data_source=ds, user=request.user)
-        serializer = SavedVisualizationSerializer(qs, many=True)
-        return Response(serializer.data)
+        version = qs.aggregate(count=Count("id"), updated=Max("updated_at"), question=Max("question__updated_at"))
+        etag = make_etag("visualizations", ds.id, request.user.id, version, request.query_params.urlencode())
+        response = not_modified(request, etag)
+        if response:
+            return response
+        if wants_summary(request):
+            qs, serializer_class = qs.only("id", "name", "updated_at"), SavedVisualizationSummarySerializer
+        else:
+            qs, serializer_class = qs.select_related("question"), SavedVisualizationSerializer
+        return set_cache_headers(list_response(request, self, qs, serializer_class), etag)
 
     def post(self, request, pk):
         ds = get_object_or_404(DataSource, pk=pk, user=request.user)
@@ -195,7 +396,7 @@ class DataSourceVisualizationDetailView(APIView):
     def get_object(self, request, ds_pk, viz_pk):
         get_object_or_404(DataSource, pk=ds_pk, user=request.user)
         return get_object_or_404(
-            SavedVisualization,
+            SavedVisualization.objects.select_related("question"),
             pk=viz_pk,
             data_source_id=ds_pk,
             user=request.user,
@@ -203,7 +404,11 @@ class DataSourceVisualizationDetailView(APIView):
 
     def get(self, request, ds_pk, viz_pk):
         obj = self.get_object(request, ds_pk, viz_pk)
-        return Response(SavedVisualizationSerializer(obj).data)
+        etag = make_etag("visualization", obj.pk, obj.updated_at, obj.question.updated_at if obj.question_id else None)
+        response = not_modified(request, etag)
+        if response:
+            return response
+        return set_cache_headers(Response(SavedVisualizationSerializer(obj).data), etag)
 
     def patch(self, request, ds_pk, viz_pk):
         obj = self.get_object(request, ds_pk, viz_pk)
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'flow_reports_project.settings')
 
 application = get_asgi_application()
+
+# Warm the query cache from QUERY_CACHE_SNAPSHOT_PATH (if set) before serving traffic.
+from data_sources.cache_snapshot import setup_snapshots  # noqa: E402
+
+setup_snapshots()
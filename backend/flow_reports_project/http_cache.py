@@ -0,0 +1,101 @@
+"""
+HTTP caching for API views: ETags and conditional requests (If-None-Match → 304), and
+pre-encoded response bodies (gzip/brotli) that can be cached and served as raw bytes.
+
+ETags are computed from cheap version data (updated_at columns, query-cache entry versions)
+before anything is serialized, so a revalidation that matches skips the serializer and the
+renderer. Responses are per-user, hence "private"; "no-cache" makes clients revalidate on
+every use, which is what keeps an edited dashboard from being served stale.
+"""
+
+import gzip
+import hashlib
+import json
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+PRIVATE_REVALIDATE = "private, no-cache"
+# Bodies smaller than this are sent uncompressed (the framing would cost more than it saves).
+MIN_COMPRESS_BYTES = 1024
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag (quoted) from version data, e.g. make_etag("dashboard", pk, updated_at)."""
+    raw = json.dumps(parts, default=str, separators=(",", ":"))
+    return f'"{hashlib.sha256(raw.encode()).hexdigest()[:32]}"'
+
+
+def etag_matches(request, etag: str | None) -> bool:
+    """True if the request's If-None-Match lists etag (weak comparison, as RFC 9110 requires)."""
+    header = request.headers.get("If-None-Match")
+    if not etag or not header:
+        return False
+    tags = parse_etags(header)
+    if "*" in tags:
+        return True
+    bare = etag.removeprefix("W/")
+    return any(tag.removeprefix("W/") == bare for tag in tags)
+
+
+def set_cache_headers(response, etag: str | None, cache_control: str = PRIVATE_REVALIDATE):
+    if etag:
+        response["ETag"] = etag
+    response["Cache-Control"] = cache_control
+    return response
+
+
+def not_modified(request, etag: str | None, cache_control: str = PRIVATE_REVALIDATE):
+    """304 response if the client already has etag, else None."""
+    if not etag_matches(request, etag):
+        return None
+    return set_cache_headers(HttpResponseNotModified(), etag, cache_control)
+
+
+def accepted_encoding(request) -> str:
+    """Best content coding the client accepts: "br" (if brotli is installed), "gzip" or "identity"."""
+    accepted = {}
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = q
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return "identity"
+
+
+def encode_body(body: bytes, encoding: str) -> tuple[bytes, str]:
+    """(encoded body, encoding actually used); small bodies stay identity."""
+    if encoding == "identity" or len(body) < MIN_COMPRESS_BYTES:
+        return body, "identity"
+    if encoding == "br":
+        return brotli.compress(body, quality=5), "br"
+    return gzip.compress(body, compresslevel=6), "gzip"
+
+
+def encoded_response(body: bytes, content_type: str, encoding: str, etag: str | None = None):
+    """
+    HttpResponse for an already encoded body (served as is, no renderer involved).
+    Compressed bodies get a weak ETag: the gzip, br and identity bytes are not byte-identical.
+    """
+    response = HttpResponse(body, content_type=content_type)
+    if encoding != "identity":
+        response["Content-Encoding"] = encoding
+        if etag and not etag.startswith("W/"):
+            etag = f"W/{etag}"
+    patch_vary_headers(response, ("Accept", "Accept-Encoding"))
+    return set_cache_headers(response, etag)
@@ -0,0 +1,116 @@
+"""
+Prometheus metrics for the backend (prometheus_client), exposed as text format on /metrics.
+
+Multi-process deployments (gunicorn workers): set PROMETHEUS_MULTIPROC_DIR to an empty,
+writable directory before the workers start. Each process then writes its samples to
+mmap-backed files in that directory and /metrics aggregates them at scrape time.
+"""
+
+import hmac
+import os
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_LATENCY = Histogram(
+    "flow_reports_http_request_duration_seconds",
+    "API request latency by view.",
+    ["view", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+QUERY_LATENCY = Histogram(
+    "flow_reports_query_duration_seconds",
+    "Data-source query latency (connect + execute + fetch + convert) by database type.",
+    ["db_type"],
+    buckets=LATENCY_BUCKETS,
+)
+QUERY_ERRORS = Counter(
+    "flow_reports_query_errors_total",
+    "Data-source queries that failed, by database type.",
+    ["db_type"],
+)
+QUERY_ROWS = Counter(
+    "flow_reports_query_rows_total",
+    "Rows returned by data-source queries, by database type.",
+    ["db_type"],
+)
+QUERIES_IN_FLIGHT = Gauge(
+    "flow_reports_queries_in_flight",
+    "Data-source queries currently running or waiting for a connection.",
+    ["db_type"],
+    multiprocess_mode="livesum",
+)
+CACHE_LOOKUPS = Counter(
+    "flow_reports_query_cache_lookups_total",
+    "Query cache lookups by result (hit/miss).",
+    ["result"],
+)
+CACHE_STORES = Counter(
+    "flow_reports_query_cache_stores_total",
+    "Results written to the query cache.",
+)
+CACHE_REJECTS = Counter(
+    "flow_reports_query_cache_rejects_total",
+    "Results not cached by the admission policy, by reason (too_large/low_value).",
+    ["reason"],
+)
+CACHE_EVICTIONS = Counter(
+    "flow_reports_query_cache_evictions_total",
+    "Query cache entries dropped to keep a data source within its cache budget.",
+)
+POOL_CONNECTIONS = Gauge(
+    "flow_reports_pool_connections",
+    "Pooled data-source connections by state (idle/in_use).",
+    ["db_type", "state"],
+    multiprocess_mode="livesum",
+)
+
+
+class MetricsMiddleware:
+    """Record request latency per resolved view (low cardinality: view name, method, status)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unmatched"
+        if view != "metrics":
+            REQUEST_LATENCY.labels(view, request.method, str(response.status_code)).observe(
+                time.perf_counter() - start
+            )
+        return response
+
+
+def _registry():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_view(request):
+    """Prometheus text exposition. If METRICS_TOKEN is set, require 'Authorization: Bearer <token>' (401 otherwise)."""
+    token = getattr(settings, "METRICS_TOKEN", None)
+    supplied = request.headers.get("Authorization", "").encode()
+    if token and not hmac.compare_digest(supplied, f"Bearer {token}".encode()):
+        response = HttpResponse("Unauthorized", status=401, content_type="text/plain")
+        response["WWW-Authenticate"] = "Bearer"
+        return response
+    return HttpResponse(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,43 @@
+"""
+List endpoints: opt-in cursor pagination and a lightweight "summary" representation.
+
+  GET /api/dashboards/                          full objects, unpaginated (unchanged)
+  GET /api/dashboards/?view=summary             id, name, updated_at only (no JSON blobs loaded)
+  GET /api/dashboards/?page_size=50             { "next", "previous", "results" }; follow "next"
+  GET /api/dashboards/?view=summary&page_size=200
+
+Cursor pages (DRF CursorPagination) filter on the first ordering field only, e.g.
+updated_at < <cursor position>, and sort by the full ordering (-updated_at, -id) using the
+matching composite indexes, so a page costs about the same however deep it is. Rows that share
+the position's updated_at are stepped over with an offset; -id keeps their order stable.
+"""
+
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class RecentCursorPagination(CursorPagination):
+    """Newest first; id breaks ties between rows saved in the same instant."""
+
+    ordering = ("-updated_at", "-id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+class IdCursorPagination(RecentCursorPagination):
+    ordering = ("id",)
+
+
+def wants_summary(request) -> bool:
+    return request.query_params.get("view") == "summary"
+
+
+def list_response(request, view, queryset, serializer_class, pagination_class=RecentCursorPagination):
+    """Serialize queryset as a plain list, or as a cursor page when ?cursor= or ?page_size= is given."""
+    params = request.query_params
+    if "cursor" not in params and "page_size" not in params:
+        return Response(serializer_class(queryset, many=True).data)
+    paginator = pagination_class()
+    page = paginator.paginate_queryset(queryset, request, view=view)
+    return paginator.get_paginated_response(serializer_class(page, many=True).data)
@@ -6,8 +6,11 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 import os
+import sys
+from importlib.util import find_spec
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -32,6 +35,9 @@ ALLOWED_HOSTS = []
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:3000',
 ]
+# Conditional requests: the client sends If-None-Match and reads ETag (plus Server-Timing for devtools)
+CORS_ALLOW_HEADERS = (*default_headers, "if-none-match")
+CORS_EXPOSE_HEADERS = ["ETag", "Server-Timing"]
 
 
 # Application definition
@@ -52,6 +58,7 @@ INSTALLED_APPS = [
     'dashboards',
 ]
 MIDDLEWARE = [
+    'flow_reports_project.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -141,8 +148,19 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson first (default for Accept: */* and application/json); MessagePack on
+    # Accept: application/msgpack when the msgpack package is installed.
+    'DEFAULT_RENDERER_CLASSES': [
+        'flow_reports_project.renderers.ORJSONRenderer',
+        *(['flow_reports_project.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
+# Questions run on their DataSource. Running questions without a data source on the
+# Django app database is an explicit opt-in (keeps report load off the app DB).
+QUESTIONS_ALLOW_APP_DB = os.getenv("QUESTIONS_ALLOW_APP_DB", "").strip().lower() in ("1", "true", "yes")
+
 # JWT: access token 1h, refresh 7d (adjust for production)
 from datetime import timedelta
 SIMPLE_JWT = {
@@ -150,15 +168,75 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
 }
 
+# RBAC: per-user role/permission sets are cached this long (seconds). Role and profile changes
+# invalidate the entry; with CACHE_BACKEND=locmem other workers see them only after the timeout.
+RBAC_CACHE_TIMEOUT = int(os.getenv("RBAC_CACHE_TIMEOUT", "300"))
+
 # -----------------------------------------------------------------------------
 # Cache (Power BI–style: load once → fast in-memory → manual/scheduled refresh)
-# Use Redis if REDIS_URL is set; otherwise locmem (dev without Redis).
+# Use Redis if REDIS_URL is set; otherwise a SQLite file shared by all workers on this host
+# (flow_reports_project.sqlite_cache), or per-process locmem with CACHE_BACKEND=locmem.
+# The test runner always uses locmem: tests clear the cache, which must not be a shared one.
 # -----------------------------------------------------------------------------
 CACHE_KEY_PREFIX = "flow_reports"
 QUERY_CACHE_TIMEOUT = int(os.getenv("QUERY_CACHE_TIMEOUT", "300"))  # seconds; 0 = no expiry
+# Cost-aware caching (data_sources.cache_policy): expensive, often-read results live longer (up to
+# QUERY_CACHE_MAX_TIMEOUT); results over ADMIT_ALWAYS_KB must save MIN_MS_PER_MB of query time per
+# MB to be cached; each source keeps at most SOURCE_MAX_MB (0 = no limit), cheapest entries dropped first.
+QUERY_CACHE_MAX_TIMEOUT = int(os.getenv("QUERY_CACHE_MAX_TIMEOUT", "3600"))
+QUERY_CACHE_ADMIT_ALWAYS_KB = int(os.getenv("QUERY_CACHE_ADMIT_ALWAYS_KB", "64"))
+QUERY_CACHE_MIN_MS_PER_MB = float(os.getenv("QUERY_CACHE_MIN_MS_PER_MB", "20"))
+QUERY_CACHE_MAX_ENTRY_MB = int(os.getenv("QUERY_CACHE_MAX_ENTRY_MB", "50"))
+QUERY_CACHE_SOURCE_MAX_MB = int(os.getenv("QUERY_CACHE_SOURCE_MAX_MB", "64"))
+# Query cache snapshot: restored at startup and written when a worker exits (unset = off).
+# Keeps the hottest QUERY_CACHE_SNAPSHOT_LIMIT entries; older snapshots than MAX_AGE are ignored.
+QUERY_CACHE_SNAPSHOT_PATH = os.getenv("QUERY_CACHE_SNAPSHOT_PATH", "").strip() or None
+QUERY_CACHE_SNAPSHOT_LIMIT = int(os.getenv("QUERY_CACHE_SNAPSHOT_LIMIT", "500"))
+QUERY_CACHE_SNAPSHOT_MAX_AGE = int(os.getenv("QUERY_CACHE_SNAPSHOT_MAX_AGE", "3600"))  # seconds; 0 = any age
+# watch_sources: seconds between change probes of each data source.
+QUERY_CHANGE_POLL_SECONDS = float(os.getenv("QUERY_CHANGE_POLL_SECONDS", "30"))
+
+# Prometheus /metrics: optional bearer token. For multi-worker servers set
+# PROMETHEUS_MULTIPROC_DIR (empty, writable dir) in the environment before starting workers.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip() or None
+
+# Query instrumentation: queries slower than this (ms) are logged at WARNING, others at INFO.
+# manage.py test only shows the slow ones unless QUERY_LOG_LEVEL says otherwise.
+QUERY_SLOW_MS = int(os.getenv("QUERY_SLOW_MS", "1000"))
+TESTING = sys.argv[1:2] == ["test"]
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "data_sources.query": {
+            "handlers": ["console"],
+            "level": os.getenv("QUERY_LOG_LEVEL", "WARNING" if TESTING else "INFO"),
+            "propagate": False,
+        },
+    },
+}
+
+# Data-source connection pool (PostgreSQL/MySQL): idle connections kept per source, and idle timeout.
+DATA_SOURCE_POOL_SIZE = int(os.getenv("DATA_SOURCE_POOL_SIZE", "4"))
+DATA_SOURCE_POOL_MAX_IDLE = int(os.getenv("DATA_SOURCE_POOL_MAX_IDLE", "300"))  # seconds
+
+# Dashboard data endpoint: concurrent widget queries per request, and grid rows treated as
+# on screen when the client does not say which widgets are visible.
+DASHBOARD_WIDGET_WORKERS = int(os.getenv("DASHBOARD_WIDGET_WORKERS", "4"))
+DASHBOARD_VISIBLE_ROWS = int(os.getenv("DASHBOARD_VISIBLE_ROWS", "12"))
+# Seconds between keep-alive comments on the dashboard event stream while widget queries run.
+DASHBOARD_STREAM_HEARTBEAT = float(os.getenv("DASHBOARD_STREAM_HEARTBEAT", "15"))
 
 REDIS_URL = os.getenv("REDIS_URL", "").strip() or None
-if REDIS_URL:
+if TESTING or (not REDIS_URL and os.getenv("CACHE_BACKEND", "sqlite").strip().lower() == "locmem"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "KEY_PREFIX": CACHE_KEY_PREFIX,
+        }
+    }
+elif REDIS_URL:
     CACHES = {
         "default": {
             "BACKEND": "django.core.cache.backends.redis.RedisCache",
@@ -169,7 +247,9 @@ if REDIS_URL:
 else:
     CACHES = {
         "default": {
-            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "BACKEND": "flow_reports_project.sqlite_cache.SQLiteCache",
+            "LOCATION": os.getenv("CACHE_SQLITE_PATH", "").strip() or str(BASE_DIR / ".cache" / "cache.sqlite3"),
             "KEY_PREFIX": CACHE_KEY_PREFIX,
+            "OPTIONS": {"MAX_BYTES": int(os.getenv("CACHE_MAX_MB", "256")) * 1024 * 1024},
         }
     }
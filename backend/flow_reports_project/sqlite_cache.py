@@ -0,0 +1,259 @@
+"""
+Node-wide cache backend: one SQLite file in WAL mode shared by every worker process on the host.
+
+LocMemCache is private to each process, so with N gunicorn workers the same query result is
+computed and held N times. This backend keeps entries (pickled) in a single file: readers never
+block each other or the writer (WAL), and the total stored size is bounded by MAX_BYTES with
+least-recently-used eviction. It needs no server, only a local writable path.
+
+    CACHES = {"default": {
+        "BACKEND": "flow_reports_project.sqlite_cache.SQLiteCache",
+        "LOCATION": "/var/lib/flow_reports/cache.sqlite3",
+        "OPTIONS": {"MAX_BYTES": 256 * 1024 * 1024},
+    }}
+
+The byte total is kept in a one-row table by triggers, so eviction never scans the cache.
+Eviction trims to CULL_TO (default 0.9) of MAX_BYTES, expired entries first, then the least
+recently read. Read times are written at most once per ACCESS_RESOLUTION seconds per entry
+so hot keys do not turn every get into a write, and skipped while another connection is
+writing, so a read never waits for the write lock.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entry (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_entry_accessed ON cache_entry (accessed);
+CREATE INDEX IF NOT EXISTS cache_entry_expires ON cache_entry (expires);
+CREATE TABLE IF NOT EXISTS cache_stats (id INTEGER PRIMARY KEY CHECK (id = 1), bytes INTEGER NOT NULL);
+INSERT OR IGNORE INTO cache_stats (id, bytes) VALUES (1, 0);
+CREATE TRIGGER IF NOT EXISTS cache_entry_insert AFTER INSERT ON cache_entry
+    BEGIN UPDATE cache_stats SET bytes = bytes + NEW.size WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS cache_entry_update AFTER UPDATE OF size ON cache_entry
+    BEGIN UPDATE cache_stats SET bytes = bytes - OLD.size + NEW.size WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS cache_entry_delete AFTER DELETE ON cache_entry
+    BEGIN UPDATE cache_stats SET bytes = bytes - OLD.size WHERE id = 1; END;
+"""
+
+_UPSERT = """
+INSERT INTO cache_entry (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    value = excluded.value, size = excluded.size, expires = excluded.expires, accessed = excluded.accessed
+"""
+
+_LIVE = "(expires IS NULL OR expires > ?)"
+
+# (path, pid) whose file already has WAL mode and the schema: threads of a process (e.g. a
+# dashboard's widget pool) only open a connection, without taking the write lock again.
+_prepared: set[tuple[str, int]] = set()
+_prepared_lock = threading.Lock()
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._path = os.path.abspath(location or "cache.sqlite3")
+        self._max_bytes = int(options.get("MAX_BYTES", 256 * 1024 * 1024))
+        self._cull_to = float(options.get("CULL_TO", 0.9))
+        self._access_resolution = float(options.get("ACCESS_RESOLUTION", 1.0))
+        self._busy_timeout = float(options.get("BUSY_TIMEOUT", 5.0))
+        self._local = threading.local()
+
+    # -- connections ----------------------------------------------------------------------------
+
+    def _conn(self) -> sqlite3.Connection:
+        """Connection for this thread; reopened after a fork (a connection must not cross processes)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        conn = sqlite3.connect(self._path, timeout=self._busy_timeout, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _prepared_lock:
+            if (self._path, os.getpid()) not in _prepared:
+                # WAL mode is stored in the file; the schema statements take the write lock
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                _prepared.add((self._path, os.getpid()))
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _write(self, fn):
+        """Run fn(conn) in one write transaction (BEGIN IMMEDIATE takes the write lock up front)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    @staticmethod
+    def _dumps(value) -> bytes:
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _row(self, key, value, timeout, now):
+        blob = self._dumps(value)
+        return (key, blob, len(blob) + len(key), self.get_backend_timeout(timeout), now)
+
+    # -- eviction -------------------------------------------------------------------------------
+
+    def _cull(self, conn, now):
+        """Trim to CULL_TO x MAX_BYTES: drop expired entries, then least recently read ones."""
+        (total,) = conn.execute("SELECT bytes FROM cache_stats WHERE id = 1").fetchone()
+        if total <= self._max_bytes:
+            return
+        conn.execute("DELETE FROM cache_entry WHERE expires IS NOT NULL AND expires <= ?", (now,))
+        (total,) = conn.execute("SELECT bytes FROM cache_stats WHERE id = 1").fetchone()
+        excess = total - int(self._max_bytes * self._cull_to)
+        if excess <= 0:
+            return
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM cache_entry ORDER BY accessed"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM cache_entry WHERE key = ?", victims)
+
+    def _touch(self, keys, now):
+        """Record a read for LRU order. Skipped, not waited for, while another writer holds the lock."""
+        conn = self._conn()
+        conn.execute("PRAGMA busy_timeout = 0")
+        try:
+            conn.execute(f"UPDATE cache_entry SET accessed = ? WHERE key IN ({','.join('?' * len(keys))})", (now, *keys))
+        except sqlite3.OperationalError:
+            pass  # database is locked: the read time is only an eviction hint
+        finally:
+            conn.execute(f"PRAGMA busy_timeout = {int(self._busy_timeout * 1000)}")
+
+    # -- cache API ------------------------------------------------------------------------------
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        row = self._conn().execute(
+            f"SELECT value, accessed FROM cache_entry WHERE key = ? AND {_LIVE}", (key, now)
+        ).fetchone()
+        if row is None:
+            return default
+        if now - row[1] >= self._access_resolution:
+            self._touch([key], now)
+        return pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        mapped = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not mapped:
+            return {}
+        now = time.time()
+        placeholders = ",".join("?" * len(mapped))
+        rows = self._conn().execute(
+            f"SELECT key, value, accessed FROM cache_entry WHERE key IN ({placeholders}) AND {_LIVE}", (*mapped, now)
+        ).fetchall()
+        stale = [key for key, _, accessed in rows if now - accessed >= self._access_resolution]
+        if stale:
+            self._touch(stale, now)
+        return {mapped[key]: pickle.loads(value) for key, value, _ in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        row = self._row(key, value, timeout, now)
+
+        def store(conn):
+            conn.execute(_UPSERT, row)
+            self._cull(conn, now)
+
+        self._write(store)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        rows = [self._row(self.make_and_validate_key(k, version=version), v, timeout, now) for k, v in data.items()]
+
+        def store(conn):
+            conn.executemany(_UPSERT, rows)
+            self._cull(conn, now)
+
+        self._write(store)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Store only if key is missing or expired; True if stored. Atomic across processes."""
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        row = self._row(key, value, timeout, now)
+
+        def store(conn):
+            cursor = conn.execute(f"{_UPSERT} WHERE NOT {_LIVE.replace('expires', 'cache_entry.expires')}", (*row, now))
+            self._cull(conn, now)
+            return cursor.rowcount > 0
+
+        return self._write(store)
+
+    def incr(self, key, delta=1, version=None):
+        """Atomic across processes (read and write in one transaction)."""
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+
+        def bump(conn):
+            row = conn.execute(f"SELECT value FROM cache_entry WHERE key = ? AND {_LIVE}", (key, now)).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            blob = self._dumps(value)
+            conn.execute(
+                "UPDATE cache_entry SET value = ?, size = ?, accessed = ? WHERE key = ?",
+                (blob, len(blob) + len(key), now, key),
+            )
+            return value
+
+        return self._write(bump)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        cursor = self._conn().execute(
+            f"UPDATE cache_entry SET expires = ? WHERE key = ? AND {_LIVE}",
+            (self.get_backend_timeout(timeout), key, now),
+        )
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._conn().execute(f"SELECT 1 FROM cache_entry WHERE key = ? AND {_LIVE}", (key, time.time())).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._conn().execute("DELETE FROM cache_entry WHERE key = ?", (key,)).rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        keys = [(self.make_and_validate_key(key, version=version),) for key in keys]
+        if keys:
+            self._write(lambda conn: conn.executemany("DELETE FROM cache_entry WHERE key = ?", keys))
+
+    def clear(self):
+        self._write(lambda conn: conn.execute("DELETE FROM cache_entry"))
+
+    def size_bytes(self) -> int:
+        """Bytes currently stored (keys + pickled values, expired entries included until culled)."""
+        return self._conn().execute("SELECT bytes FROM cache_stats WHERE id = 1").fetchone()[0]
+
+    def close(self, **kwargs):
+        # Connections are per thread and reused across requests (Django calls close() after each).
+        pass
@@ -0,0 +1,179 @@
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+from unittest import skipIf
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from prometheus_client import REGISTRY
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from data_sources import query_cache
+from flow_reports_project.renderers import MessagePackRenderer, ORJSONRenderer, dumps, msgpack
+from flow_reports_project.sqlite_cache import SQLiteCache
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def make_cache(self, **options):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return SQLiteCache(str(Path(tmp.name) / "cache.sqlite3"), {"OPTIONS": options})
+
+    def test_set_get_delete(self):
+        cache = self.make_cache()
+        cache.set("k", {"rows": [1, 2]})
+        self.assertEqual(cache.get("k"), {"rows": [1, 2]})
+        self.assertTrue(cache.delete("k"))
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.size_bytes(), 0)
+
+    def test_expired_entries_are_misses_and_can_be_added(self):
+        cache = self.make_cache()
+        cache.set("k", 1, timeout=0.05)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("k"))
+        self.assertTrue(cache.add("k", 2))
+        self.assertFalse(cache.add("k", 3))
+        self.assertEqual(cache.get("k"), 2)
+
+    def test_incr(self):
+        cache = self.make_cache()
+        cache.set("n", 1)
+        self.assertEqual(cache.incr("n", 5), 6)
+        with self.assertRaises(ValueError):
+            cache.incr("missing")
+
+    def test_evicts_least_recently_read_past_max_bytes(self):
+        cache = self.make_cache(MAX_BYTES=40_000, ACCESS_RESOLUTION=0)
+        for i in range(3):
+            cache.set(f"k{i}", b"x" * 10_000)
+        cache.get("k0")  # k1 is now the least recently read
+        cache.set("k3", b"x" * 15_000)
+        self.assertIsNone(cache.get("k1"))
+        self.assertIsNotNone(cache.get("k0"))
+        self.assertIsNotNone(cache.get("k3"))
+        self.assertLessEqual(cache.size_bytes(), 40_000)
+
+    def test_reads_do_not_wait_for_a_writer(self):
+        cache = self.make_cache(ACCESS_RESOLUTION=0, BUSY_TIMEOUT=5)
+        cache.set("k", "v")
+        writer = sqlite3.connect(cache._path, isolation_level=None)
+        self.addCleanup(writer.close)
+        writer.execute("BEGIN IMMEDIATE")
+        started = time.monotonic()
+        self.assertEqual(cache.get("k"), "v")
+        self.assertEqual(cache.get_many(["k"]), {"k": "v"})
+        self.assertLess(time.monotonic() - started, 1)
+        writer.execute("ROLLBACK")
+
+    def test_schema_is_set_up_once_per_process(self):
+        cache = self.make_cache()
+        cache.set("k", "v")
+        results = []
+        # another thread gets its own connection, without running the schema script again
+        with patch("flow_reports_project.sqlite_cache._SCHEMA", "NOT SQL"):
+            thread = threading.Thread(target=lambda: results.append(cache.get("k")))
+            thread.start()
+            thread.join()
+        self.assertEqual(results, ["v"])
+
+    def test_shared_between_instances(self):
+        cache = self.make_cache()
+        other = SQLiteCache(cache._path, {})
+        cache.set("k", "v")
+        self.assertEqual(other.get("k"), "v")
+        other.clear()
+        self.assertIsNone(cache.get("k"))
+
+
+class RendererTests(SimpleTestCase):
+    row = {"amount": Decimal("12.50"), "at": datetime(2024, 5, 1, 9, 30, 0, 123456, tzinfo=timezone.utc), "raw": b"ab\xff", 7: "seven"}
+
+    def test_dumps_converts_values_without_a_json_type(self):
+        self.assertEqual(
+            dumps(self.row),
+            b'{"amount":12.5,"at":"2024-05-01T09:30:00.123456+00:00","raw":"ab\xef\xbf\xbd","7":"seven"}',
+        )
+        self.assertEqual(dumps({"raw": memoryview(b"ab")}), b'{"raw":"ab"}')
+
+    def test_utc_datetimes_end_in_an_offset_not_z(self):
+        value = {"at": self.row["at"]}
+        self.assertEqual(JSONRenderer().render(value), b'{"at":"2024-05-01T09:30:00.123456Z"}')
+        self.assertEqual(ORJSONRenderer().render(value), b'{"at":"2024-05-01T09:30:00.123456+00:00"}')
+
+    def test_indent_option(self):
+        renderer = ORJSONRenderer()
+        self.assertEqual(renderer.render({"a": [1]}, "application/json"), b'{"a":[1]}')
+        self.assertEqual(renderer.render({"a": [1]}, "application/json; indent=4"), b'{\n  "a": [\n    1\n  ]\n}')
+        self.assertEqual(renderer.render(None), b"")
+
+    @skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack_renderer(self):
+        packed = MessagePackRenderer().render(self.row)
+        self.assertEqual(
+            msgpack.unpackb(packed, strict_map_key=False),
+            {"amount": 12.5, "at": "2024-05-01T09:30:00.123456+00:00", "raw": b"ab\xff", 7: "seven"},
+        )
+
+
+class ContentNegotiationTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_user("negotiator", password="secret"))
+
+    def test_json_by_default(self):
+        response = self.client.get("/api/data-sources/")
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response.json(), [])
+
+    @skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack_on_accept(self):
+        response = self.client.get("/api/data-sources/", HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.content), [])
+
+
+class MetricsTests(APITestCase):
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    def test_requests_are_counted_per_view(self):
+        user = User.objects.create_user("viewer", password="secret")
+        self.client.force_authenticate(user)
+        labels = {"view": "data_source_list_create", "method": "GET", "status": "200"}
+        before = self.sample("flow_reports_http_request_duration_seconds_count", **labels)
+        self.client.get("/api/data-sources/")
+        self.client.get("/api/data-sources/")
+        self.assertEqual(self.sample("flow_reports_http_request_duration_seconds_count", **labels), before + 2)
+
+    def test_cache_lookups_are_counted(self):
+        cache.clear()
+        misses = self.sample("flow_reports_query_cache_lookups_total", result="miss")
+        hits = self.sample("flow_reports_query_cache_lookups_total", result="hit")
+        query_cache.get_cached_result(1, "table", "orders")
+        query_cache.set_cached_result(1, "table", "orders", [{"id": 1}], ["id"])
+        query_cache.get_cached_result(1, "table", "orders")
+        self.assertEqual(self.sample("flow_reports_query_cache_lookups_total", result="miss"), misses + 1)
+        self.assertEqual(self.sample("flow_reports_query_cache_lookups_total", result="hit"), hits + 1)
+
+    def test_metrics_endpoint_is_not_counted(self):
+        before = self.sample("flow_reports_http_request_duration_seconds_count", view="metrics", method="GET", status="200")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"flow_reports_http_request_duration_seconds", response.content)
+        self.assertEqual(self.sample("flow_reports_http_request_duration_seconds_count", view="metrics", method="GET", status="200"), before)
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_metrics_token_is_required_when_set(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 401)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"flow_reports_query_cache_lookups_total", response.content)
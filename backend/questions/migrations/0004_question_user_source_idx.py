@@ -0,0 +1,20 @@
+# Generated by Django 6.0.2 on 2026-10-19 18:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_sources', '0006_datasource_user_updated_idx'),
+        ('questions', '0003_question_user_updated_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='savedquestion',
+            index=models.Index(fields=['user', 'data_source', '-updated_at'], name='question_user_source_idx'),
+        ),
+    ]
@@ -30,6 +30,11 @@ class SavedQuestion(models.Model):
 
     class Meta:
         ordering = ["-updated_at"]
+        indexes = [
+            models.Index(fields=["user", "-updated_at", "-id"], name="question_user_updated_idx"),
+            # ?data_source_id= filter on the list
+            models.Index(fields=["user", "data_source", "-updated_at"], name="question_user_source_idx"),
+        ]
 
     def __str__(self):
         return self.title
@@ -1,45 +1,19 @@
 """
 Natural language to SQL service with read-only safety.
 
-- Validates that generated SQL is SELECT-only (no INSERT/UPDATE/DELETE/DROP etc.).
+- Validates that generated SQL is SELECT-only (tokenized by data_sources.sql_parse; no INSERT/UPDATE/DELETE/DROP etc.).
 - Single statement only.
 - Optional: integrate with LLM (e.g. OpenAI) via env; otherwise uses simple placeholder rules.
 """
 
-import re
+from data_sources.sql_parse import analyze_sql
 
 
-# Allowed SQL keywords for execution (read-only)
-READ_ONLY_KEYWORDS = {"select", "with", "from", "where", "join", "left", "right", "inner", "outer",
-                      "on", "group", "by", "order", "asc", "desc", "limit", "offset", "as", "and", "or", "not",
-                      "in", "is", "null", "like", "between", "distinct", "having", "union", "all"}
-FORBIDDEN_KEYWORDS = {"insert", "update", "delete", "drop", "create", "alter", "truncate", "grant",
-                      "revoke", "exec", "execute", "xp_", "sp_", ";--", "/*", "*/"}
-
-
-def is_sql_read_only(sql: str) -> bool:
-    """Return True if sql appears to be a read-only (SELECT/WITH) statement."""
+def is_sql_read_only(sql: str, dialect: str | None = None) -> bool:
+    """Return True if sql is a single read-only (SELECT/WITH) statement."""
     if not sql or not sql.strip():
         return False
-    # Normalize: single statement, strip comments
-    normalized = re.sub(r"--[^\n]*", "", sql)
-    normalized = re.sub(r"/\*.*?\*/", "", normalized, flags=re.DOTALL)
-    normalized = " ".join(normalized.split()).strip().rstrip(";")
-    if not normalized:
-        return False
-    # Must not contain forbidden patterns
-    lower = normalized.lower()
-    for f in FORBIDDEN_KEYWORDS:
-        if f in lower:
-            return False
-    # Must start with select or with
-    first_word = lower.split()[0] if lower.split() else ""
-    if first_word not in ("select", "with"):
-        return False
-    # No semicolon (single statement)
-    if ";" in normalized:
-        return False
-    return True
+    return not analyze_sql(sql, dialect).error
 
 
 def generate_sql_from_nl(natural_language: str):
@@ -70,12 +44,14 @@ def generate_sql_from_nl(natural_language: str):
     return "SELECT 1 AS placeholder LIMIT 1", ""
 
 
-def validate_and_sanitize_sql(sql: str):
+def validate_and_sanitize_sql(sql: str, dialect: str | None = None):
     """
     Validate SQL is read-only and return (sanitized_sql, error_message).
+    sanitized_sql has comments and the trailing semicolon removed.
     """
     if not sql or not sql.strip():
         return "", "SQL is empty."
-    if not is_sql_read_only(sql):
-        return "", "Only read-only SELECT (or WITH) queries are allowed. No INSERT/UPDATE/DELETE/DROP etc."
-    return sql.strip().rstrip(";"), ""
+    parsed = analyze_sql(sql, dialect)
+    if parsed.error:
+        return "", f"Only read-only SELECT (or WITH) queries are allowed. {parsed.error}"
+    return parsed.sql, ""
@@ -1,32 +1,53 @@
 """
 Execute read-only SQL and return rows as list of dicts.
-"""
 
-from datetime import date, datetime
-from decimal import Decimal
+Questions run against their own DataSource through data_sources.run_query (same
+cache, limits and connection handling as visualizations). Running on the Django
+application database is only allowed when QUESTIONS_ALLOW_APP_DB is enabled.
+"""
 
+from django.conf import settings
 from django.db import connection
 
+from data_sources.query_cache import get_cached_result, set_cached_result
+from data_sources.run_query import run_sql
+
 from .nl_to_sql import validate_and_sanitize_sql
 
 
-def _json_serializable(value):
-    """Convert value to something JSON-serializable."""
-    if value is None:
-        return None
-    if isinstance(value, (datetime, date)):
-        return value.isoformat()
-    if isinstance(value, Decimal):
-        return float(value)
-    if isinstance(value, (str, int, float, bool)):
-        return value
-    return str(value)
+def app_db_queries_allowed() -> bool:
+    """True if questions without a data source may run on the Django app database."""
+    return bool(getattr(settings, "QUESTIONS_ALLOW_APP_DB", False))
+
+
+def run_data_source_query(data_source, sql: str, refresh: bool = False, timer=None):
+    """
+    Run a question's SQL on its DataSource via the shared query cache.
+    Returns (rows, columns, error, truncated, cached). timer is an optional QueryTimer.
+    """
+    sanitized, err = validate_and_sanitize_sql(sql, data_source.db_type)
+    if err:
+        return [], [], err, False, False
+    if refresh:
+        if timer is not None:
+            timer.cache = "bypass"
+    else:
+        cached = get_cached_result(data_source.id, "sql", sanitized, timer=timer)
+        if cached is not None:
+            return cached["rows"], cached["columns"], "", cached.get("truncated", False), True
+    rows, columns, err, truncated = run_sql(data_source, sanitized, timer=timer)
+    if err:
+        return [], [], err, False, False
+    set_cached_result(data_source.id, "sql", sanitized, rows, columns, truncated=truncated, timer=timer)
+    return rows, columns, "", truncated, False
 
 
 def run_read_only_query(sql: str):
     """
-    Run a read-only SQL query. Returns (rows, error_message).
-    rows is a list of dicts (column name -> value), values JSON-serializable.
+    Run a read-only SQL query on the Django app database. Returns (rows, error_message).
+    rows is a list of dicts (column name -> value), values as the driver returns them
+    (encoded by the API renderers).
+    Only used when QUESTIONS_ALLOW_APP_DB is enabled.
     """
     sanitized, err = validate_and_sanitize_sql(sql)
     if err:
@@ -35,11 +56,7 @@ def run_read_only_query(sql: str):
         with connection.cursor() as cursor:
             cursor.execute(sanitized)
             columns = [col[0] for col in cursor.description]
-            raw_rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        rows = [
-            {k: _json_serializable(v) for k, v in r.items()}
-            for r in raw_rows
-        ]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
         return rows, ""
     except Exception as e:
         return [], str(e)
@@ -17,6 +17,12 @@ class SavedQuestionSerializer(serializers.ModelSerializer):
         read_only_fields = ("created_at", "updated_at")
 
 
+class SavedQuestionSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SavedQuestion
+        fields = ("id", "title", "updated_at")
+
+
 class SavedQuestionListSerializer(serializers.ModelSerializer):
     class Meta:
         model = SavedQuestion
@@ -0,0 +1,86 @@
+import sqlite3
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APITestCase
+
+from data_sources.models import DataSource
+from data_sources.run_query import run_sql
+
+from .models import SavedQuestion
+from .nl_to_sql import validate_and_sanitize_sql
+from .run_query import run_data_source_query
+
+
+class RunQuestionTests(APITestCase):
+    url = "/api/questions/run/"
+
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = str(Path(tmp.name) / "source.sqlite3")
+        with sqlite3.connect(path) as conn:
+            conn.execute("CREATE TABLE sales (region TEXT, amount REAL)")
+            conn.executemany("INSERT INTO sales VALUES (?, ?)", [("north", 10), ("south", 25)])
+        self.user = User.objects.create_user("asker", password="secret")
+        self.client.force_authenticate(self.user)
+        self.source = DataSource.objects.create(user=self.user, name="Source", db_type="sqlite", config={"path": path})
+        self.question = SavedQuestion.objects.create(
+            user=self.user,
+            data_source=self.source,
+            title="Sales",
+            natural_language="Sales by region",
+            generated_sql="SELECT region, amount FROM sales ORDER BY region",
+        )
+
+    def test_question_runs_once_then_hits_the_cache(self):
+        with patch("questions.run_query.run_sql", wraps=run_sql) as source_run:
+            first = self.client.post(self.url, {"question_id": self.question.pk}, format="json")
+            second = self.client.post(self.url, {"question_id": self.question.pk}, format="json")
+            refreshed = self.client.post(self.url, {"question_id": self.question.pk, "refresh": True}, format="json")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()["rows"], [{"region": "north", "amount": 10.0}, {"region": "south", "amount": 25.0}])
+        self.assertNotIn("cached", first.json())
+        self.assertTrue(second.json()["cached"])
+        self.assertEqual(second.json()["rows"], first.json()["rows"])
+        self.assertNotIn("cached", refreshed.json())
+        self.assertEqual(source_run.call_count, 2)
+
+    def test_invalid_sql_is_rejected_before_the_source(self):
+        with patch("questions.run_query.run_sql") as source_run:
+            rows, columns, err, truncated, cached = run_data_source_query(self.source, "DELETE FROM sales")
+        self.assertTrue(err)
+        self.assertEqual((rows, columns, cached), ([], [], False))
+        source_run.assert_not_called()
+
+    @override_settings(QUESTIONS_ALLOW_APP_DB=False)
+    def test_sql_without_data_source_is_rejected_when_app_db_is_disabled(self):
+        with patch("questions.views.run_read_only_query") as app_db_run:
+            response = self.client.post(self.url, {"sql": "SELECT 1 AS one"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("no data source", response.json()["error"])
+        app_db_run.assert_not_called()
+
+    @override_settings(QUESTIONS_ALLOW_APP_DB=True)
+    def test_sql_without_data_source_runs_on_the_app_db_when_enabled(self):
+        response = self.client.post(self.url, {"sql": "SELECT 1 AS one"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"rows": [{"one": 1}]})
+
+
+class ValidateSqlTests(SimpleTestCase):
+    def test_returns_sanitized_sql_or_an_error(self):
+        self.assertEqual(validate_and_sanitize_sql("SELECT a -- note\nFROM t;"), ("SELECT a FROM t", ""))
+        self.assertEqual(validate_and_sanitize_sql("  "), ("", "SQL is empty."))
+        sql, err = validate_and_sanitize_sql("DELETE FROM t")
+        self.assertEqual(sql, "")
+        self.assertEqual(err, "Only read-only SELECT (or WITH) queries are allowed. Only SELECT queries are allowed.")
+
+    def test_dialect_selects_the_forbidden_functions(self):
+        self.assertEqual(validate_and_sanitize_sql("SELECT sleep(1)", "postgresql"), ("SELECT sleep(1)", ""))
+        self.assertIn("Forbidden function: sleep", validate_and_sanitize_sql("SELECT sleep(1)", "mysql")[1])
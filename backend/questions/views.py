@@ -4,13 +4,19 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
 
+from data_sources.instrumentation import QueryTimer, QueryTimingMixin, query_label
+from data_sources.models import DataSource
+from flow_reports_project.pagination import list_response, wants_summary
+
 from .models import SavedQuestion
-from .serializers import SavedQuestionSerializer, SavedQuestionListSerializer
+from .serializers import SavedQuestionSerializer, SavedQuestionListSerializer, SavedQuestionSummarySerializer
 from .nl_to_sql import generate_sql_from_nl, validate_and_sanitize_sql
-from .run_query import run_read_only_query
+from .run_query import app_db_queries_allowed, run_data_source_query, run_read_only_query
 
 
 class SavedQuestionListCreateView(APIView):
+    """GET list (?data_source_id= filter, ?view=summary, ?page_size= / ?cursor= pagination). POST create."""
+
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -18,8 +24,9 @@ class SavedQuestionListCreateView(APIView):
         data_source_id = request.query_params.get("data_source_id")
         if data_source_id:
             qs = qs.filter(data_source_id=data_source_id)
-        serializer = SavedQuestionListSerializer(qs, many=True)
-        return Response(serializer.data)
+        if wants_summary(request):
+            return list_response(request, self, qs.only("id", "title", "updated_at"), SavedQuestionSummarySerializer)
+        return list_response(request, self, qs, SavedQuestionListSerializer)
 
     def post(self, request):
         serializer = SavedQuestionSerializer(data=request.data)
@@ -77,22 +84,32 @@ class GenerateSqlView(APIView):
         return Response({"generated_sql": sql})
 
 
-class RunQueryView(APIView):
-    """Run a saved question's SQL or ad-hoc SQL (read-only)."""
+class RunQueryView(QueryTimingMixin, APIView):
+    """
+    Run a saved question's SQL or ad-hoc SQL (read-only) on its data source.
+    Body: { "question_id": ... } or { "sql": "...", "data_source_id": ... }, optional "refresh": true to bypass cache.
+    Without a data source the query only runs on the app database if QUESTIONS_ALLOW_APP_DB is enabled.
+    """
 
     permission_classes = [IsAuthenticated]
 
     def post(self, request, pk=None):
+        refresh = request.data.get("refresh") is True
         # Option 1: run by saved question id
         question_id = request.data.get("question_id")
         if question_id:
-            q = get_object_or_404(SavedQuestion, pk=question_id, user=request.user)
+            q = get_object_or_404(
+                SavedQuestion.objects.select_related("data_source"),
+                pk=question_id,
+                user=request.user,
+            )
             sql = q.generated_sql
             if not sql:
                 return Response(
                     {"error": "This question has no generated SQL. Generate SQL first."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
+            data_source = q.data_source
         else:
             sql = request.data.get("sql", "").strip()
             if not sql:
@@ -100,6 +117,28 @@ class RunQueryView(APIView):
                     {"error": "Provide 'question_id' or 'sql'."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
+            data_source_id = request.data.get("data_source_id")
+            data_source = (
+                get_object_or_404(DataSource, pk=data_source_id, user=request.user)
+                if data_source_id
+                else None
+            )
+        if data_source is not None:
+            self.query_timer = QueryTimer(data_source.id, data_source.db_type, query_label("sql", sql))
+            rows, columns, err, truncated, cached = run_data_source_query(
+                data_source, sql, refresh=refresh, timer=self.query_timer
+            )
+            if err:
+                return Response({"error": err, "rows": [], "columns": []}, status=status.HTTP_400_BAD_REQUEST)
+            body = {"rows": rows, "columns": columns, "truncated": truncated}
+            if cached:
+                body["cached"] = True
+            return Response(body)
+        if not app_db_queries_allowed():
+            return Response(
+                {"error": "This question has no data source. Assign a data source to run it.", "rows": []},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         rows, err = run_read_only_query(sql)
         if err:
             return Response({"error": err, "rows": []}, status=status.HTTP_400_BAD_REQUEST)
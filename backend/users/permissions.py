@@ -1,7 +1,51 @@
-"""RBAC: permission classes that check user role permissions."""
+"""
+RBAC: permission classes that check user role permissions.
 
+A user's role and permission codes are resolved once and cached (key rbac:perms:<user id>,
+RBAC_CACHE_TIMEOUT seconds) as a frozenset; users/signals.py drops the entry when the
+user's profile or role changes. Within a request the result is also kept on the user object.
+"""
+
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
 from rest_framework import permissions
 
+from .models import Role
+
+
+class UserAccess(NamedTuple):
+    role_id: int | None
+    role_name: str | None
+    permissions: frozenset
+
+
+NO_ACCESS = UserAccess(None, None, frozenset())
+
+
+def _cache_key(user_id: int) -> str:
+    return f"rbac:perms:{user_id}"
+
+
+def get_user_access(user) -> UserAccess:
+    """Role and permission codes for a user: from the request-local copy, the cache, or one query."""
+    access = getattr(user, "_rbac_access", None)
+    if access is not None:
+        return access
+    key = _cache_key(user.pk)
+    access = cache.get(key)
+    if access is None:
+        row = Role.objects.filter(users__user_id=user.pk).values_list("id", "name", "permissions").first()
+        access = UserAccess(row[0], row[1], frozenset(row[2] or [])) if row else NO_ACCESS
+        cache.set(key, access, timeout=getattr(settings, "RBAC_CACHE_TIMEOUT", 300))
+    user._rbac_access = access
+    return access
+
+
+def invalidate_user_access(*user_ids: int) -> None:
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
 
 class HasPermission(permissions.BasePermission):
     """
@@ -16,10 +60,7 @@ class HasPermission(permissions.BasePermission):
         required = getattr(view, "required_permission", None)
         if not required:
             return True
-        profile = getattr(request.user, "profile", None)
-        if not profile:
-            return False
-        return required in profile.get_permissions()
+        return required in get_user_access(request.user).permissions
 
 
 class IsAdministrator(permissions.BasePermission):
@@ -28,7 +69,4 @@ class IsAdministrator(permissions.BasePermission):
     def has_permission(self, request, view):
         if not request.user or not request.user.is_authenticated:
             return False
-        profile = getattr(request.user, "profile", None)
-        if not profile or not profile.role:
-            return False
-        return profile.role.name == "Administrator"
+        return get_user_access(request.user).role_name == "Administrator"
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import UserProfile, Role
+from .permissions import get_user_access
 
 
 class RoleSerializer(serializers.ModelSerializer):
@@ -45,16 +46,13 @@ class MeUserSerializer(serializers.Serializer):
     permissions = serializers.SerializerMethodField()
 
     def get_role(self, obj):
-        profile = getattr(obj, "profile", None)
-        if profile and profile.role:
-            return {"id": profile.role.id, "name": profile.role.name}
+        access = get_user_access(obj)
+        if access.role_id is not None:
+            return {"id": access.role_id, "name": access.role_name}
         return None
 
     def get_permissions(self, obj):
-        profile = getattr(obj, "profile", None)
-        if profile:
-            return profile.get_permissions()
-        return []
+        return sorted(get_user_access(obj).permissions)
 
 
 class UserListSerializer(serializers.ModelSerializer):
@@ -73,6 +71,12 @@ class UserListSerializer(serializers.ModelSerializer):
         return None
 
 
+class UserSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ("id", "username")
+
+
 class UserRoleUpdateSerializer(serializers.Serializer):
     role_id = serializers.PrimaryKeyRelatedField(queryset=Role.objects.all())
 
@@ -1,13 +1,29 @@
-"""Ensure every User has a UserProfile (for RBAC)."""
+"""Ensure every User has a UserProfile (for RBAC), and drop cached permissions when roles change."""
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 
-from .models import UserProfile
+from .models import Role, UserProfile
+from .permissions import invalidate_user_access
 
 
 @receiver(post_save, sender=User)
 def ensure_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_profile_access(sender, instance, **kwargs):
+    invalidate_user_access(instance.user_id)
+
+
+@receiver(post_save, sender=Role)
+@receiver(pre_delete, sender=Role)
+def invalidate_role_access(sender, instance, **kwargs):
+    # pre_delete: profiles are set to NULL by the database cascade without post_save
+    user_ids = list(UserProfile.objects.filter(role=instance).values_list("user_id", flat=True))
+    if user_ids:
+        invalidate_user_access(*user_ids)
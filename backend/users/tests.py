@@ -1,3 +1,67 @@
-from django.test import TestCase
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+
+from .models import Role
+from .permissions import HasPermission, IsAdministrator, get_user_access
+
+
+class RbacQueryCountTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user("admin", password="secret")
+        self.admin.profile.role = Role.objects.get(name="Administrator")
+        self.admin.profile.save()
+        self.client.force_authenticate(self.admin)
+
+    def test_permission_checks_use_cached_permissions(self):
+        request = SimpleNamespace(user=User.objects.get(pk=self.admin.pk))
+        with self.assertNumQueries(1):
+            self.assertTrue(HasPermission().has_permission(request, SimpleNamespace(required_permission="users.view")))
+        with self.assertNumQueries(0):
+            self.assertFalse(HasPermission().has_permission(request, SimpleNamespace(required_permission="billing.manage")))
+            self.assertTrue(IsAdministrator().has_permission(request, None))
+        # A new request (fresh user object) is served from the cache
+        request = SimpleNamespace(user=User.objects.get(pk=self.admin.pk))
+        with self.assertNumQueries(0):
+            self.assertTrue(IsAdministrator().has_permission(request, None))
+
+    def test_role_and_profile_changes_invalidate_cache(self):
+        role = Role.objects.get(name="Administrator")
+        get_user_access(self.admin)
+        role.permissions = [*role.permissions, "billing.manage"]
+        role.save()
+        self.assertIn("billing.manage", get_user_access(User.objects.get(pk=self.admin.pk)).permissions)
+        self.admin.profile.role = Role.objects.get(name="Viewer")
+        self.admin.profile.save()
+        self.assertEqual(get_user_access(User.objects.get(pk=self.admin.pk)).role_name, "Viewer")
+        Role.objects.get(name="Viewer").delete()
+        self.assertIsNone(get_user_access(User.objects.get(pk=self.admin.pk)).role_name)
+
+    def test_me_uses_cached_permissions(self):
+        self.client.get("/api/users/me/")
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/users/me/")
+        self.assertEqual(response.json()["role"]["name"], "Administrator")
+        self.assertIn("users.view", response.json()["permissions"])
+
+    def test_users_without_role_are_not_administrators(self):
+        request = SimpleNamespace(user=User.objects.create_user("plain", password="secret"))
+        self.assertFalse(IsAdministrator().has_permission(request, None))
+
+    def test_user_list_query_count_is_constant(self):
+        viewer = Role.objects.get(name="Viewer")
+        for i in range(10):
+            user = User.objects.create_user(f"user{i}", password="secret")
+            user.profile.role = viewer
+            user.profile.save()
+        get_user_access(self.admin)
+        # users joined with profile and role (administrator check is cached)
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/users/users/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 11)
+        self.assertEqual(response.json()[0]["role"]["name"], "Administrator")
+        self.assertEqual(response.json()[1]["role"]["name"], "Viewer")
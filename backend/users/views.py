@@ -6,6 +6,8 @@ from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 
+from flow_reports_project.pagination import IdCursorPagination, list_response, wants_summary
+
 from .models import UserProfile
 from .serializers import (
     UserSerializer,
@@ -14,6 +16,7 @@ from .serializers import (
     RoleSerializer,
     UserListSerializer,
     UserRoleUpdateSerializer,
+    UserSummarySerializer,
 )
 from .permissions import IsAdministrator
 
@@ -74,8 +77,6 @@ class MeView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        UserProfile.objects.get_or_create(user=request.user)
-        request.user.refresh_from_db()
         serializer = MeUserSerializer(request.user)
         return Response(serializer.data)
 
@@ -94,14 +95,16 @@ class RolesListView(APIView):
 
 
 class UserListView(APIView):
-    """List users (Administrator only)."""
+    """List users (Administrator only). ?view=summary returns id and username; ?page_size= / ?cursor= paginate."""
 
     permission_classes = [IsAuthenticated, IsAdministrator]
 
     def get(self, request):
-        users = User.objects.all().order_by("id")
-        serializer = UserListSerializer(users, many=True)
-        return Response(serializer.data)
+        if wants_summary(request):
+            users, serializer_class = User.objects.only("id", "username").order_by("id"), UserSummarySerializer
+        else:
+            users, serializer_class = User.objects.select_related("profile__role").order_by("id"), UserListSerializer
+        return list_response(request, self, users, serializer_class, pagination_class=IdCursorPagination)
 
 
 class UserRoleUpdateView(APIView):
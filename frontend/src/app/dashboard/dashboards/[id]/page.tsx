@@ -307,6 +307,32 @@ export default function DashboardBuilderPage() {
   );
 }
 
+/**
+ * Last run-query result per request body, revalidated with If-None-Match (304 → reuse rows).
+ * run-query is a POST, so the browser's HTTP cache can't hold these; a small LRU bounds the rows kept.
+ */
+const WIDGET_RESULTS_MAX = 20;
+type WidgetResult = { etag: string; rows: Record<string, unknown>[] };
+const widgetResults = new Map<string, WidgetResult>();
+
+function getWidgetResult(key: string): WidgetResult | undefined {
+  const hit = widgetResults.get(key);
+  if (hit) {
+    // Map keeps insertion order: re-insert to mark as most recently used
+    widgetResults.delete(key);
+    widgetResults.set(key, hit);
+  }
+  return hit;
+}
+
+function setWidgetResult(key: string, result: WidgetResult) {
+  widgetResults.delete(key);
+  widgetResults.set(key, result);
+  while (widgetResults.size > WIDGET_RESULTS_MAX) {
+    widgetResults.delete(widgetResults.keys().next().value!);
+  }
+}
+
 function WidgetContent({
   config,
   filterState,
@@ -334,12 +360,21 @@ function WidgetContent({
       let cancelled = false;
       setLoading(true);
       setError("");
-      const body = tableName ? { table_name: tableName } : { sql: sql! };
+      const body = JSON.stringify(tableName ? { table_name: tableName } : { sql: sql! });
+      const resultKey = `${dataSourceId}:${body}`;
+      const previous = getWidgetResult(resultKey);
       authFetch(`/api/data-sources/${dataSourceId}/run-query/`, {
         method: "POST",
-        body: JSON.stringify(body),
+        body,
+        headers: previous ? { "If-None-Match": previous.etag } : undefined,
       })
-        .then((res) => res.json())
+        .then(async (res) => {
+          if (res.status === 304 && previous) return { rows: previous.rows };
+          const json: { rows?: Record<string, unknown>[]; error?: string } = await res.json();
+          const etag = res.headers.get("ETag");
+          if (etag && !json.error) setWidgetResult(resultKey, { etag, rows: json.rows ?? [] });
+          return json;
+        })
         .then((body: { rows?: Record<string, unknown>[]; error?: string }) => {
           if (cancelled) return;
           if (body.error) {
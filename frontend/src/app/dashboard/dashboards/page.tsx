@@ -15,9 +15,6 @@ import {
 interface DashboardItem {
   id: number;
   name: string;
-  layout: Record<string, unknown>;
-  widgets: Record<string, unknown>;
-  created_at: string;
   updated_at: string;
 }
 
@@ -26,7 +23,7 @@ export default function DashboardsListPage() {
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-    authFetch("/api/dashboards/")
+    authFetch("/api/dashboards/?view=summary")
       .then((r) => (r.ok ? r.json() : []))
       .then(setList)
       .finally(() => setLoading(false));